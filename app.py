@@ -1,5 +1,16 @@
+import os
+import time
+
+# The chat app keeps its knowledge base; ingestion is off by default everywhere else
+os.environ.setdefault('CHROMA_INGEST_ENABLED', '1')
+
 import streamlit as st
-from services.chat_service import process_user_input, get_workflow_status
+from services.chat_service import stream_user_input, collect_background_replies, compact_conversation, extract_knowledge_for_display, get_workflow_status
+from services.job_service import get_job_stats
+from services.gemini_service import get_client_stats
+from services.session_state import SessionState
+from services.tracing import get_trace_snapshot, start_metrics_server
+from services.workflow_service import get_workflow_manager
 try:
     from services.chroma_service import init_chroma
 except ImportError:
@@ -7,6 +18,12 @@ except ImportError:
 
 st.set_page_config(page_title="Datasynth KYB Chat", layout="wide", initial_sidebar_state="expanded")
 
+# How often to check on background jobs while any are pending
+JOB_POLL_INTERVAL = 1.0
+
+# Serve /metrics and /snapshot when METRICS_PORT is set (started once per process)
+start_metrics_server()
+
 # Initialize ChromaDB
 try:
     init_chroma()
@@ -17,7 +34,7 @@ except:
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'workflow_session_state' not in st.session_state:
-    st.session_state.workflow_session_state = {}
+    st.session_state.workflow_session_state = SessionState()
 if 'knowledge_data' not in st.session_state:
     st.session_state.knowledge_data = {
         'business_understanding': [],
@@ -26,6 +43,20 @@ if 'knowledge_data' not in st.session_state:
         'summary': ''
     }
 
+def refresh_knowledge_data():
+    """Copy the workflow's knowledge into the sidebar panel"""
+    knowledge_update = extract_knowledge_for_display(st.session_state.workflow_session_state)
+    for key, value in knowledge_update.items():
+        if value:
+            st.session_state.knowledge_data[key] = value
+
+# Deliver the results of background jobs that finished since the last run
+background_replies = collect_background_replies(st.session_state.workflow_session_state)
+if background_replies:
+    for reply in background_replies:
+        st.session_state.messages.append({'role': 'assistant', 'content': reply})
+    refresh_knowledge_data()
+
 # Sidebar
 with st.sidebar:
     st.title("🔷 Datasynth KYB")
@@ -50,13 +81,16 @@ with st.sidebar:
             else:
                 business = str(business_info)
             st.markdown(f"**Business:** {business}")
+        
+        if workflow_status.get('pending_jobs'):
+            st.markdown(f"**⏳ Working on:** {workflow_status['pending_jobs']} background task(s)")
     
     view = st.radio("Navigation", ["KYB Chat", "Analytics", "Export"], label_visibility="collapsed")
     
     # Reset conversation button
     if st.button("🔄 Start New KYB Session", use_container_width=True):
         st.session_state.messages = []
-        st.session_state.workflow_session_state = {}
+        st.session_state.workflow_session_state = SessionState()
         st.session_state.knowledge_data = {
             'business_understanding': [],
             'objectives': [],
@@ -81,11 +115,14 @@ with col1:
             
             # Auto-start the workflow
             if not st.session_state.workflow_session_state:
-                from services.workflow_service import WorkflowManager
-                workflow_manager = WorkflowManager()
-                initial_message = workflow_manager.get_initial_message()
+                initial_message = get_workflow_manager().get_initial_message()
                 st.session_state.messages.append({'role': 'assistant', 'content': initial_message})
         
+        # Older turns live on only as a summary
+        if st.session_state.workflow_session_state.get('conversation_summary'):
+            with st.expander(f"Earlier conversation ({st.session_state.workflow_session_state.get('summarized_turns', 0)} messages summarized)"):
+                st.markdown(st.session_state.workflow_session_state['conversation_summary'])
+        
         for msg in st.session_state.messages:
             with st.chat_message(msg['role']):
                 st.write(msg['content'])
@@ -96,24 +133,26 @@ with col1:
     if user_input:
         st.session_state.messages.append({'role': 'user', 'content': user_input})
         
-        with st.spinner('Processing through KYB workflow...'):
-            response = process_user_input(
-                user_input, 
-                st.session_state.messages, 
-                st.session_state.workflow_session_state
-            )
+        with chat_container:
+            with st.chat_message('user'):
+                st.write(user_input)
             
-        st.session_state.messages.append({'role': 'assistant', 'content': response['message']})
-        
-        # Update workflow session state
-        if 'session_state' in response:
-            st.session_state.workflow_session_state = response['session_state']
+            # Render the reply as it streams in; the workflow updates its session state in place
+            with st.chat_message('assistant'):
+                message = st.write_stream(stream_user_input(
+                    user_input, 
+                    st.session_state.messages, 
+                    st.session_state.workflow_session_state
+                ))
+            
+        st.session_state.messages.append({'role': 'assistant', 'content': message})
+        st.session_state.messages = compact_conversation(
+            st.session_state.messages,
+            st.session_state.workflow_session_state
+        )
         
         # Update knowledge data if available
-        if response.get('knowledge_update'):
-            for key, value in response['knowledge_update'].items():
-                if value:
-                    st.session_state.knowledge_data[key] = value
+        refresh_knowledge_data()
         
         st.rerun()
 
@@ -171,6 +210,9 @@ with col2:
             if st.button("📊 View Details", use_container_width=True):
                 if st.session_state.workflow_session_state:
                     status = get_workflow_status(st.session_state.workflow_session_state)
+                    status['job_queue'] = get_job_stats()
+                    status['gemini_client'] = get_client_stats()
+                    status['latency'] = get_trace_snapshot()['stages']
                     st.json(status)
         with col_b:
             if st.button("💾 Export KYB", use_container_width=True):
@@ -201,3 +243,8 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+
+# Keep polling until every background job has reported back
+if st.session_state.workflow_session_state.get('pending_jobs'):
+    time.sleep(JOB_POLL_INTERVAL)
+    st.rerun()
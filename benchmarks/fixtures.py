@@ -0,0 +1,85 @@
+"""
+Offline fixtures for the benchmark suite: a local HTML corpus server
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Loopback is blocked by URL intake, so run_benchmarks allow-lists this host
+FIXTURE_HOST = os.getenv('BENCH_FIXTURE_HOST', '127.0.0.1')
+
+SMALL_PAGE_COUNT = 50
+HUGE_PAGE_BYTES = 5 * 1024 * 1024
+NESTED_DEPTH = 3000
+
+
+def small_page(i: int) -> str:
+    paragraphs = ''.join(
+        f"<p>Company {i} helps small businesses automate invoicing, payroll and reporting, section {j}.</p>"
+        for j in range(20)
+    )
+    return (f"<html><head><title>Company {i}</title>"
+            f"<meta name=\"description\" content=\"Company {i} sells business software.\"></head>"
+            f"<body><nav>Home About Pricing</nav><h1>Company {i}</h1><h2>Pricing</h2><h2>Customers</h2>"
+            f"{paragraphs}<script>var tracking = {i};</script></body></html>")
+
+
+def huge_page() -> str:
+    filler = "<div><p>Filler paragraph that repeats to make the page very large indeed.</p></div>"
+    body = filler * (HUGE_PAGE_BYTES // len(filler))
+    return f"<html><head><title>Huge page</title></head><body><h1>Huge</h1>{body}</body></html>"
+
+
+def nested_page() -> str:
+    opening = '<div><span>' * NESTED_DEPTH
+    closing = '</span></div>' * NESTED_DEPTH
+    return (f"<html><head><title>Nested page</title></head><body><h1>Deeply nested</h1>{opening}"
+            f"<p>The only real paragraph sits at the bottom of a very deep element tree.</p>{closing}</body></html>")
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    pages = {}
+
+    def do_GET(self):
+        body = self.pages.get(self.path.split('?')[0])
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """Serves /small/<i>, /huge and /nested from memory on an ephemeral port"""
+
+    def __init__(self, host: str = FIXTURE_HOST):
+        pages = {f'/small/{i}': small_page(i).encode('utf-8') for i in range(SMALL_PAGE_COUNT)}
+        pages['/huge'] = huge_page().encode('utf-8')
+        pages['/nested'] = nested_page().encode('utf-8')
+        handler = type('Handler', (CorpusHandler,), {'pages': pages})
+        self.server = ThreadingHTTPServer((host, 0), handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return self.base_url + path
+
+    def __enter__(self) -> 'FixtureServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for scraping, the KYB workflow and KYB persistence
+
+    python benchmarks/run_benchmarks.py [--quick] [--gemini-latency 0.2] [--gemini-failure-rate 0.05]
+                                        [--output FILE] [--compare FILE]
+
+Everything runs against a local fixture server and the synthetic Gemini backend, inside a
+temporary working directory so KYB files and caches never touch the repo.
+Results are saved as JSON; --compare prints the change against an earlier run.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep caches out of the measurements; the knowledge base is off unless CHROMA_INGEST_ENABLED=1
+os.environ.setdefault('SCRAPE_CACHE_ENABLED', '0')
+os.environ.setdefault('GEMINI_CACHE_ENABLED', '0')
+# Measure the app, not the production rate limit on Gemini calls
+os.environ.setdefault('GEMINI_RATE_LIMIT', '0')
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from fixtures import FIXTURE_HOST, SMALL_PAGE_COUNT, FixtureServer
+from services import gemini_service
+from services.kyb_repository import KYBRepository
+from services.kyb_service import KYBManager
+from services.scraper_service import scrape_many, scrape_url
+from services.url_intake import allow_host
+from services.workflow_service import WorkflowManager
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+allow_host(FIXTURE_HOST)
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda percent: ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+    return {
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(pick(50) * 1000, 3),
+        'p95_ms': round(pick(95) * 1000, 3),
+        'p99_ms': round(pick(99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def bench_scraping(server, rounds, concurrency):
+    """Throughput over the small-page corpus, plus the pathological pages"""
+    urls = [server.url(f'/small/{i % SMALL_PAGE_COUNT}') for i in range(SMALL_PAGE_COUNT * rounds)]
+
+    # Every fixture page lives on one host, so lift the per-host politeness limits
+    started = time.perf_counter()
+    results = list(scrape_many(urls, concurrency=concurrency, per_host_limit=concurrency, politeness_delay=0))
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for result in results if result['error'])
+
+    single = []
+    for url in urls[:SMALL_PAGE_COUNT]:
+        started = time.perf_counter()
+        scrape_url(url, use_cache=False)
+        single.append(time.perf_counter() - started)
+
+    pathological = {}
+    for name in ('huge', 'nested'):
+        samples, data = [], {}
+        for _ in range(3):
+            started = time.perf_counter()
+            data = scrape_url(server.url(f'/{name}'), use_cache=False)
+            samples.append(time.perf_counter() - started)
+        pathological[name] = dict(_percentiles(samples), bytes_read=data.get('bytes_read'),
+                                  truncated=data.get('truncated'))
+
+    return {
+        'pages': len(urls),
+        'failures': failures,
+        'concurrency': concurrency,
+        'pages_per_second': round(len(urls) / elapsed, 1),
+        'single_page': _percentiles(single),
+        **pathological
+    }
+
+
+def bench_workflow(server, sessions):
+    """Latency of a full pass through steps 1-8, starting from a pasted URL"""
+    manager = WorkflowManager()
+    turns = ['', None, '', 'We build invoicing software', '', 'It reconciles bank feeds automatically', '', '']
+    samples = []
+    for i in range(sessions):
+        session_state = {}
+        started = time.perf_counter()
+        for text in turns:
+            manager.process_workflow_step(text if text is not None else server.url(f'/small/{i % SMALL_PAGE_COUNT}'),
+                                          session_state)
+        samples.append(time.perf_counter() - started)
+    return dict(_percentiles(samples), sessions=sessions, steps=manager.get_step_timings())
+
+
+def bench_llm_load(turns, threads):
+    """Gemini turns per second and tail latency with many sessions talking at once"""
+    samples, failures = [], []
+    lock = threading.Lock()
+
+    def worker(index):
+        local, failed = [], 0
+        for turn in range(turns // threads):
+            started = time.perf_counter()
+            result = gemini_service.analyze_with_gemini(f'Session {index} turn {turn}: we sell invoicing software',
+                                                        use_cache=False)
+            local.append(time.perf_counter() - started)
+            failed += result.get('knowledge_update') is None
+        with lock:
+            samples.extend(local)
+            failures.append(failed)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return dict(_percentiles(samples), turns=len(samples), threads=threads, failures=sum(failures),
+                turns_per_second=round(len(samples) / elapsed, 1))
+
+
+def bench_kyb_writes(history_sizes):
+    """Cost of one more write as a document's history grows"""
+    results = {'kyb_manager_update': {}, 'workflow_update': {}}
+    manager = KYBManager(kyb_dir=os.path.join(os.getcwd(), 'bench_kyb'))
+    repository = KYBRepository(os.path.join(os.getcwd(), 'bench_kyb', 'workflow_index.db'))
+
+    for size in history_sizes:
+        path = manager.create_kyb_file(f'bench-{size}', {'what_they_sell': 'Benchmarks'})
+        for i in range(size):
+            manager.update_kyb_file(path, {'conversation_entry': {'role': 'user', 'content': f'Message {i}'}})
+        samples = []
+        for i in range(20):
+            started = time.perf_counter()
+            manager.update_kyb_file(path, {'conversation_entry': {'role': 'user', 'content': f'Extra {i}'}})
+            samples.append(time.perf_counter() - started)
+        results['kyb_manager_update'][str(size)] = _percentiles(samples)
+
+        # The workflow rewrites the whole kyb_data dict on every step
+        workflow_path = os.path.join(os.getcwd(), 'bench_kyb', f'kyb_workflow_{size}.json')
+        kyb_data = {'business_understanding': [f'Insight {i}' for i in range(size)],
+                    'objectives': [], 'constraints': [], 'summary': '', 'scraped_data': []}
+        repository.create(workflow_path, {'session_id': f'wf-{size}', 'kyb_data': kyb_data, 'workflow_step': 4})
+        samples = []
+        for i in range(20):
+            kyb_data['business_understanding'].append(f'Extra {i}')
+            started = time.perf_counter()
+            repository.update(workflow_path, {'kyb_data': kyb_data, 'workflow_step': 6})
+            samples.append(time.perf_counter() - started)
+        results['workflow_update'][str(size)] = _percentiles(samples)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _flatten(child, f'{prefix}.{key}' if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(current, baseline_path):
+    """Print every latency or throughput metric that moved by more than 5%"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline_report = json.load(f)
+    baseline = dict(_flatten(baseline_report['results']))
+    print(f"\nChanges against {baseline_path} ({baseline_report['meta']['commit']}):")
+    if baseline_report['meta'].get('quick') != current['meta']['quick']:
+        print("  (warning: one run used --quick, so workloads differ)")
+    for name, value in _flatten(current['results']):
+        if not name.endswith(('_ms', 'per_second')):
+            continue
+        old = baseline.get(name)
+        if old and abs(value - old) / old > 0.05:
+            print(f"  {name}: {old} -> {value} ({(value - old) / old:+.0%})")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='kyb_bench_')
+    os.chdir(workdir)
+    original_registry = gemini_service.model_registry
+    original_backend = gemini_service.get_llm_backend()
+    gemini_service.set_llm_backend('synthetic', latency=args.gemini_latency, failure_rate=args.gemini_failure_rate)
+    try:
+        with FixtureServer() as server:
+            results = {
+                'scraping': bench_scraping(server, rounds=1 if args.quick else 4, concurrency=args.concurrency),
+                'workflow_session': bench_workflow(server, sessions=5 if args.quick else 20),
+                'llm_load': bench_llm_load(turns=400 if args.quick else 4000, threads=args.concurrency),
+                'kyb_writes': bench_kyb_writes([10, 100] if args.quick else [10, 100, 1000])
+            }
+    finally:
+        gemini_service.model_registry = original_registry
+        gemini_service._llm_backend = original_backend
+        os.chdir(ROOT)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'gemini_latency': args.gemini_latency,
+            'gemini_failure_rate': args.gemini_failure_rate,
+            'quick': args.quick
+        },
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument('--quick', action='store_true', help="smaller workloads for a fast smoke run")
+    parser.add_argument('--gemini-latency', type=float, default=0.2, help="seconds the synthetic model takes per call")
+    parser.add_argument('--gemini-failure-rate', type=float, default=0.0,
+                        help="share of synthetic model calls that fail")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help="results file (default: benchmarks/results/bench_<commit>_<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench_{report['meta']['commit']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    scraping = report['results']['scraping']
+    session = report['results']['workflow_session']
+    print(f"Scraping: {scraping['pages_per_second']} pages/s, single page p50 {scraping['single_page']['p50_ms']} ms")
+    llm_load = report['results']['llm_load']
+    print(f"Workflow session: p50 {session['p50_ms']} ms, p95 {session['p95_ms']} ms")
+    print(f"Gemini load: {llm_load['turns_per_second']} turns/s, p99 {llm_load['p99_ms']} ms, "
+          f"{llm_load['failures']} failed")
+    print(f"Results saved to {output}")
+    if args.compare:
+        compare(report, args.compare)
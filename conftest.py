@@ -0,0 +1,49 @@
+"""
+Shared pytest setup for the test_*.py modules
+"""
+import os
+
+# Keep the suite off the ChromaDB knowledge base: no chroma_db/ in the tree, no embedding model download
+os.environ['CHROMA_INGEST_ENABLED'] = '0'
+os.environ['CONTEXT_USE_KNOWLEDGE_BASE'] = '0'
+
+import pytest
+
+from services import gemini_service, kyb_repository, scraper_service, url_intake
+from services.cache_store import PersistentCache
+from services.kyb_repository import KYBRepository
+
+
+def isolate_kyb_files(monkeypatch, directory):
+    """Run from directory with its own KYB repository, so KYB files stay out of the tree"""
+    monkeypatch.chdir(directory)
+    monkeypatch.setattr(kyb_repository, '_repository', KYBRepository())
+
+
+def use_temp_caches(monkeypatch, directory):
+    """Keep test pages and Gemini replies out of the real on-disk caches"""
+    monkeypatch.setattr(scraper_service, '_scrape_cache',
+                        PersistentCache(os.path.join(directory, 'scrape_cache.db'), table='pages'))
+    monkeypatch.setattr(gemini_service, '_response_cache',
+                        PersistentCache(os.path.join(directory, 'gemini_cache.db'), table='responses'))
+
+
+def allow_test_host(monkeypatch, host='127.0.0.1'):
+    """URL intake blocks loopback addresses unless they are allow-listed"""
+    monkeypatch.setattr(url_intake, 'ALLOWED_HOSTS', url_intake.ALLOWED_HOSTS | {host})
+
+
+@pytest.fixture
+def temp_caches(tmp_path, monkeypatch):
+    use_temp_caches(monkeypatch, str(tmp_path))
+
+
+@pytest.fixture
+def loopback_allowed(monkeypatch):
+    allow_test_host(monkeypatch)
+
+
+@pytest.fixture
+def kyb_tmp_dir(tmp_path, monkeypatch):
+    isolate_kyb_files(monkeypatch, tmp_path)
+    return tmp_path
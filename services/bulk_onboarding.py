@@ -0,0 +1,233 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional
+from services.kyb_repository import get_kyb_repository
+from services.session_state import SessionState
+from services.workflow_service import WORKFLOW_STEPS, WorkflowManager
+
+# CSV layout: one prospect per row. Answer columns follow WorkflowManager.CORE_QUESTIONS.
+ID_COLUMN = 'id'
+URL_COLUMN = 'url'
+BUSINESS_COLUMN = 'what_they_sell'
+DETAILS_COLUMN = 'details'
+ANSWER_COLUMNS = ['features', 'goals', 'challenges', 'audience', 'success']
+
+DEFAULT_CONCURRENCY = int(os.getenv('ONBOARDING_CONCURRENCY', '8'))
+DEFAULT_CHECKPOINT = 'onboarding_checkpoint.jsonl'
+# Safety net against a workflow that never reaches step 9
+MAX_TURNS = 40
+PROGRESS_EVERY = 50
+
+# The chat workflow, except that an incomplete profile moves on to the next question instead of
+# going back to step 3; a CSV row has nothing new to add to the product details it already gave
+BULK_WORKFLOW_STEPS = dict(WORKFLOW_STEPS)
+BULK_WORKFLOW_STEPS[8] = dict(WORKFLOW_STEPS[8], transitions={'complete': 9, 'incomplete': 5})
+
+_bulk_manager = None
+_bulk_manager_lock = threading.Lock()
+
+
+def get_bulk_workflow_manager() -> WorkflowManager:
+    """Return the WorkflowManager running BULK_WORKFLOW_STEPS, creating it on first use"""
+    global _bulk_manager
+    if _bulk_manager is None:
+        with _bulk_manager_lock:
+            if _bulk_manager is None:
+                _bulk_manager = WorkflowManager(BULK_WORKFLOW_STEPS)
+    return _bulk_manager
+
+
+def row_key(row: Dict) -> str:
+    """Stable identity of a CSV row, so a resumed run can skip finished prospects"""
+    if row.get(ID_COLUMN):
+        return str(row[ID_COLUMN])
+    content = json.dumps(row, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def onboard_prospect(row: Dict, manager: Optional[WorkflowManager] = None,
+                     max_turns: int = MAX_TURNS) -> Dict:
+    """Drive one prospect through the KYB workflow using the answers in its CSV row
+
+    manager should run BULK_WORKFLOW_STEPS; see get_bulk_workflow_manager.
+    """
+    manager = manager or get_bulk_workflow_manager()
+    started = time.time()
+    session_state = SessionState()
+    url = (row.get(URL_COLUMN) or '').strip()
+    business = (row.get(BUSINESS_COLUMN) or '').strip()
+    answers = [(row.get(column) or '').strip() for column in ANSWER_COLUMNS]
+    url_used = False
+    status = 'incomplete'
+    turns = 0
+    error = None
+
+    try:
+        manager.process_workflow_step('', session_state)  # Step 1: greeting
+        while turns < max_turns and session_state['workflow_step'] < 9:
+            step = session_state['workflow_step']
+            text = ''
+            if step == 2:
+                # A URL alone can fill in the business; with both, the URL is added once the file exists
+                if business:
+                    text = business
+                elif url and not url_used:
+                    text, url_used = url, True
+            elif step == 4:
+                if url and not url_used:
+                    text, url_used = url, True
+                else:
+                    text = (row.get(DETAILS_COLUMN) or '').strip()
+            elif step == 5 and session_state.get('current_question', 0) >= len(answers):
+                # Step 8 wants more, but every answer in the row has been given
+                break
+            elif step == 6:
+                question_index = session_state.get('current_question', 0)
+                if question_index < len(answers):
+                    text = answers[question_index]
+            
+            if step in (2, 4, 6) and not text:
+                # Out of answers; keep what was collected
+                break
+            manager.process_workflow_step(text, session_state)
+            turns += 1
+
+        if session_state.get('workflow_step', 1) >= 9:
+            status = 'complete'
+    except Exception as e:
+        print(f"Onboarding failed for {row_key(row)}: {e}")
+        status, error = 'failed', str(e)
+
+    filepath = session_state.get('kyb_filepath')
+    completeness = 0.0
+    if filepath:
+        try:
+            repository = get_kyb_repository()
+            repository.update(filepath, {
+                'status': status,
+                'source': 'bulk_onboarding',
+                'prospect_id': row_key(row)
+            })
+            rows = repository.list_sessions(session_id=session_state['session_id'], limit=1)
+            completeness = rows[0]['completeness_score'] if rows else 0.0
+        except Exception as e:
+            print(f"Error recording onboarding status: {e}")
+
+    return {
+        'key': row_key(row),
+        'session_id': session_state.get('session_id'),
+        'kyb_filepath': filepath,
+        'status': status,
+        'workflow_step': session_state.get('workflow_step'),
+        'completeness': completeness,
+        'turns': turns,
+        'elapsed': round(time.time() - started, 3),
+        'error': error
+    }
+
+
+class Checkpoint:
+    """Append-only record of finished prospects; a partial last line from a crash is ignored"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'rb+') as f:
+                valid_end = 0
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    valid_end += len(line)
+                    try:
+                        self.done.add(json.loads(line)['key'])
+                    except (ValueError, KeyError):
+                        continue
+                # Drop a torn final record so new ones start on a fresh line
+                f.truncate(valid_end)
+        self._file = open(path, 'a', encoding='utf-8')
+    
+    def record(self, result: Dict) -> None:
+        with self.lock:
+            self._file.write(json.dumps(result, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.done.add(result['key'])
+    
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_prospects(csv_path: str) -> Iterator[Dict]:
+    """Stream prospect rows without loading the whole file"""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def run_bulk_onboarding(csv_path: str, checkpoint_path: str = DEFAULT_CHECKPOINT,
+                        concurrency: int = DEFAULT_CONCURRENCY, limit: Optional[int] = None) -> Dict:
+    """Onboard every prospect in the CSV, several sessions at a time, and report throughput"""
+    manager = get_bulk_workflow_manager()
+    checkpoint = Checkpoint(checkpoint_path)
+    counts = {'complete': 0, 'incomplete': 0, 'failed': 0, 'skipped': 0}
+    started = time.time()
+
+    def handle(future):
+        result = future.result()
+        checkpoint.record(result)
+        counts[result['status']] += 1
+        finished = counts['complete'] + counts['incomplete'] + counts['failed']
+        if finished % PROGRESS_EVERY == 0:
+            print(f"Onboarded {finished} prospect(s)...")
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='onboarding') as pool:
+            in_flight = set()
+            submitted = 0
+            for row in read_prospects(csv_path):
+                if limit is not None and submitted >= limit:
+                    break
+                if row_key(row) in checkpoint.done:
+                    counts['skipped'] += 1
+                    continue
+                # Keep a small backlog so thousands of rows never sit in memory at once
+                if len(in_flight) >= concurrency * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        handle(future)
+                in_flight.add(pool.submit(onboard_prospect, row, manager))
+                submitted += 1
+            for future in in_flight:
+                handle(future)
+    finally:
+        checkpoint.close()
+        get_kyb_repository().journal.flush()
+
+    elapsed = time.time() - started
+    processed = counts['complete'] + counts['incomplete'] + counts['failed']
+    return dict(counts, processed=processed, elapsed=round(elapsed, 2),
+                sessions_per_minute=round(processed / elapsed * 60, 1) if elapsed > 0 else 0.0)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build KYB profiles for every prospect in a CSV")
+    parser.add_argument('csv_path')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT,
+                        help="progress file; rerun with the same file to resume")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--limit', type=int, default=None, help="onboard at most this many new prospects")
+    args = parser.parse_args()
+
+    report = run_bulk_onboarding(args.csv_path, args.checkpoint, args.concurrency, args.limit)
+    print(f"Onboarded {report['processed']} prospect(s) in {report['elapsed']}s "
+          f"({report['sessions_per_minute']} sessions/min): {report['complete']} complete, "
+          f"{report['incomplete']} incomplete, {report['failed']} failed, {report['skipped']} skipped")
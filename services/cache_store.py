@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class PersistentCache:
+    """SQLite-backed key/value cache with TTL freshness, LRU eviction and hit counters
+
+    Entries past their TTL are kept and returned as stale, so callers can
+    revalidate them instead of starting from scratch.
+    """
+
+    def __init__(self, path: str, table: str = 'cache', ttl: float = 3600, max_entries: int = 1000):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)')
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[Tuple[Any, bool]]:
+        """Return (value, is_fresh) for a key, or None if it is not cached"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT value, stored_at FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                if record_stats:
+                    self._stats['misses'] += 1
+                return None
+            self._conn.execute(f'UPDATE {self.table} SET accessed_at = ? WHERE key = ?', (now, key))
+            fresh = now - row[1] < self.ttl
+            if record_stats:
+                self._stats['hits' if fresh else 'stale_hits'] += 1
+        return json.loads(row[0]), fresh
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value and evict the least recently used entries beyond max_entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now)
+            )
+            count = self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f'DELETE FROM {self.table} WHERE key IN '
+                    f'(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)', (overflow,)
+                )
+                self._stats['evictions'] += overflow
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as fresh again, e.g. after a successful revalidation"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f'UPDATE {self.table} SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key)
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self.table}')
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current hit rate"""
+        stats = dict(self._stats)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['entries'] = len(self)
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
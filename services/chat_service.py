@@ -1,30 +1,33 @@
-import re
-from services.gemini_service import analyze_with_gemini
-from services.scraper_service import scrape_url
-from services.workflow_service import WorkflowManager
+import os
+from services.workflow_service import get_workflow_manager
+from services.session_state import SessionState
+from services.kyb_repository import get_kyb_repository
+from services.summary_service import compact_history
+from services.tracing import span
 
-# Initialize workflow manager
-workflow_manager = WorkflowManager()
+# Run URL scraping and analysis on the job executor instead of inside the script run
+BACKGROUND_JOBS = os.getenv('WORKFLOW_BACKGROUND_JOBS', '1') == '1'
 
 def process_user_input(user_input, conversation_history, session_state=None):
     """Process user input using hardcoded KYB workflow"""
     
     # Initialize session_state if not provided
     if session_state is None:
-        session_state = {}
+        session_state = SessionState()
     
     # Check if this is the first message
     if not conversation_history or len(conversation_history) == 0:
         return {
-            'message': workflow_manager.get_initial_message(),
+            'message': get_workflow_manager().get_initial_message(),
             'session_state': session_state,
             'knowledge_update': extract_knowledge_for_display(session_state)
         }
     
     # Process through hardcoded workflow (handles URLs internally)
-    response_message, updated_session_state = workflow_manager.process_workflow_step(
-        user_input, session_state
-    )
+    with span('chat.turn', bytes=len(user_input)):
+        response_message, updated_session_state = get_workflow_manager().process_workflow_step(
+            user_input, session_state
+        )
     
     return {
         'message': response_message,
@@ -32,6 +35,49 @@ def process_user_input(user_input, conversation_history, session_state=None):
         'knowledge_update': extract_knowledge_for_display(updated_session_state)
     }
 
+def stream_user_input(user_input, conversation_history, session_state):
+    """Yield the reply to user_input in pieces as they are produced
+    
+    session_state is updated in place while the reply streams, so callers can
+    read it (and extract_knowledge_for_display) once the generator is exhausted.
+    """
+    if not conversation_history or len(conversation_history) == 0:
+        yield get_workflow_manager().get_initial_message()
+        return
+    
+    with span('chat.turn', bytes=len(user_input)):
+        yield from get_workflow_manager().process_workflow_step_stream(user_input, session_state,
+                                                                 background=BACKGROUND_JOBS)
+
+def collect_background_replies(session_state):
+    """Apply finished background jobs to session_state and return their replies"""
+    if not session_state or not session_state.get('pending_jobs'):
+        return []
+    return get_workflow_manager().collect_finished_jobs(session_state)
+
+def compact_conversation(messages, session_state):
+    """Fold older chat turns into the session's running summary and return the recent window
+    
+    The summary is also stored with the session's KYB record so it survives reloads.
+    """
+    recent, summary, folded = compact_history(messages, session_state.get('conversation_summary', ''))
+    if not folded:
+        return messages
+    
+    session_state['conversation_summary'] = summary
+    session_state['summarized_turns'] = session_state.get('summarized_turns', 0) + folded
+    
+    if session_state.get('kyb_filepath'):
+        try:
+            get_kyb_repository().update(session_state['kyb_filepath'], {
+                'conversation_summary': summary,
+                'summarized_turns': session_state['summarized_turns']
+            })
+        except Exception as e:
+            print(f"Error saving conversation summary: {e}")
+    
+    return recent
+
 def extract_knowledge_for_display(session_state):
     """Extract knowledge data for display in the sidebar"""
     if not session_state or 'kyb_data' not in session_state:
@@ -57,5 +103,6 @@ def get_workflow_status(session_state):
         'current_step': session_state.get('workflow_step', 1),
         'session_id': session_state.get('session_id', 'Not set'),
         'kyb_file': session_state.get('kyb_filepath', 'Not created'),
-        'business_info': session_state.get('what_they_sell', 'Not specified')
+        'business_info': session_state.get('what_they_sell', 'Not specified'),
+        'pending_jobs': len(session_state.get('pending_jobs', []))
     }
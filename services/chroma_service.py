@@ -1,33 +1,166 @@
+import atexit
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 import chromadb
+from chromadb.utils import embedding_functions
 from datetime import datetime
+from typing import Dict, Optional
+
+CHROMA_PATH = os.getenv('CHROMA_PATH', 'chroma_db')
+COLLECTION_NAME = "business_knowledge"
+
+# Ingestion pipeline tuning. Off unless enabled, so scripts and tests never write CHROMA_PATH;
+# the chat app turns it on
+INGEST_ENABLED = os.getenv('CHROMA_INGEST_ENABLED', '0') == '1'
+INGEST_FLUSH_SIZE = int(os.getenv('CHROMA_INGEST_FLUSH_SIZE', '32'))
+INGEST_FLUSH_INTERVAL = float(os.getenv('CHROMA_INGEST_FLUSH_INTERVAL', '2.0'))
+INGEST_QUEUE_SIZE = int(os.getenv('CHROMA_INGEST_QUEUE_SIZE', '1000'))
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+
+# Retrieval caches
+EMBEDDING_MODEL_ID = 'all-MiniLM-L6-v2'
+EMBEDDING_CACHE_SIZE = int(os.getenv('CHROMA_EMBEDDING_CACHE_SIZE', '5000'))
+QUERY_CACHE_TTL = float(os.getenv('CHROMA_QUERY_CACHE_TTL', '60'))
+QUERY_CACHE_SIZE = int(os.getenv('CHROMA_QUERY_CACHE_SIZE', '500'))
 
 client = None
 collection = None
+_pipeline = None
+_embedding_function = None
+
+# Bumped whenever documents are added, which invalidates cached query results
+_collection_version = 0
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+_query_stats = {'hits': 0, 'misses': 0, 'query_calls': 0}
+
+class CachedEmbeddingFunction:
+    """Memoize embeddings by text hash and embedding-model id in a bounded LRU"""
+    
+    def __init__(self, base, model_id: str, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.base = base
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode('utf-8')).hexdigest()
+    
+    def __call__(self, input):
+        keys = [self._key(text) for text in input]
+        embeddings = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for index, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(index)
+                else:
+                    self._cache.move_to_end(key)
+                    embeddings[index] = cached
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        
+        if missing:
+            # Only the texts we have never seen go to the model, in one batch
+            computed = self.base([input[index] for index in missing])
+            with self._lock:
+                for index, embedding in zip(missing, computed):
+                    embedding = list(embedding)
+                    embeddings[index] = embedding
+                    self._cache[keys[index]] = embedding
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return embeddings
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._cache),
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+def get_embedding_function():
+    """Return the shared, cached embedding function"""
+    global _embedding_function
+    if _embedding_function is None:
+        _embedding_function = CachedEmbeddingFunction(
+            embedding_functions.DefaultEmbeddingFunction(), EMBEDDING_MODEL_ID
+        )
+    return _embedding_function
 
 def init_chroma():
     """Initialize ChromaDB client and collection"""
     global client, collection
     
     if client is None:
-        client = chromadb.Client()
-        collection = client.get_or_create_collection(name="business_knowledge")
+        client = chromadb.PersistentClient(path=CHROMA_PATH)
+        collection = client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            embedding_function=get_embedding_function()
+        )
     
     return collection
 
+def mark_collection_changed():
+    """Invalidate cached query results after the collection changes"""
+    global _collection_version
+    with _query_cache_lock:
+        _collection_version += 1
+        _query_cache.clear()
+
+def content_id(text):
+    """Stable document id derived from the content, so the same text is only stored once"""
+    return f"doc_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}"
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split text into roughly chunk_size pieces, preferring paragraph and sentence breaks"""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Back up to the nearest natural break in the second half of the window
+            for separator in ('\n\n', '\n', '. ', ' '):
+                split_at = text.rfind(separator, start + chunk_size // 2, end)
+                if split_at != -1:
+                    end = split_at + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
 def store_in_chroma(text, metadata=None):
     """Store text in ChromaDB with metadata"""
     try:
         coll = init_chroma()
-        doc_id = f"doc_{datetime.now().timestamp()}_{hash(text) % 10000}"
+        doc_id = content_id(text)
         
         if metadata is None:
             metadata = {}
         
-        coll.add(
-            ids=[doc_id],
-            documents=[text],
-            metadatas=[metadata]
-        )
+        # Same content, same id: skip documents that are already stored
+        if not coll.get(ids=[doc_id], include=[])['ids']:
+            coll.add(
+                ids=[doc_id],
+                documents=[text],
+                metadatas=[metadata or {'source': 'manual'}]
+            )
+            mark_collection_changed()
         
         return doc_id
     
@@ -35,19 +168,204 @@ def store_in_chroma(text, metadata=None):
         print(f"ChromaDB store error: {e}")
         return None
 
-def query_chroma(query_text, n_results=3):
-    """Query ChromaDB for relevant context"""
-    try:
+class IngestionPipeline:
+    """Chunk, deduplicate and batch documents into ChromaDB on a background thread
+    
+    submit() only enqueues, so callers on the request path never wait for
+    embedding or disk writes. Buffered chunks are written with one add() call
+    once flush_size chunks are waiting or flush_interval seconds have passed.
+    """
+    
+    def __init__(self, collection=None, flush_size: int = INGEST_FLUSH_SIZE,
+                 flush_interval: float = INGEST_FLUSH_INTERVAL, queue_size: int = INGEST_QUEUE_SIZE):
+        self._collection = collection
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buffer: Dict[str, tuple] = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'dropped': 0, 'chunks_added': 0, 'duplicates': 0, 'batches': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='chroma-ingest', daemon=True)
+        self._thread.start()
+    
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = init_chroma()
+        return self._collection
+    
+    def submit(self, text: str, metadata: Optional[Dict] = None) -> bool:
+        """Queue text for ingestion; returns False if the queue is full and the text was dropped"""
+        if not text or not text.strip():
+            return False
+        try:
+            self._queue.put_nowait(('doc', text, dict(metadata or {})))
+            self._stats['submitted'] += 1
+            return True
+        except queue.Full:
+            self._stats['dropped'] += 1
+            print("ChromaDB ingestion queue full, dropping document")
+            return False
+    
+    def flush(self, timeout: float = 30.0) -> None:
+        """Block until everything submitted so far has been written"""
+        done = threading.Event()
+        self._queue.put(('flush', done, None))
+        done.wait(timeout)
+    
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['buffered'] = len(self._buffer)
+        return stats
+    
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0.01)
+            try:
+                kind, payload, metadata = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+            
+            if kind == 'doc':
+                self._buffer_chunks(payload, metadata)
+            
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if kind == 'flush' or len(self._buffer) >= self.flush_size or (due and self._buffer):
+                self._write_buffer()
+                last_flush = time.monotonic()
+            elif due:
+                last_flush = time.monotonic()
+            
+            if kind == 'flush':
+                payload.set()
+    
+    def _buffer_chunks(self, text: str, metadata: Dict) -> None:
+        chunks = chunk_text(text)
+        for index, chunk in enumerate(chunks):
+            doc_id = content_id(chunk)
+            if doc_id in self._seen or doc_id in self._buffer:
+                self._stats['duplicates'] += 1
+                continue
+            chunk_metadata = dict(metadata, chunk=index, chunks=len(chunks))
+            self._buffer[doc_id] = (chunk, chunk_metadata)
+    
+    def _write_buffer(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, {}
+        try:
+            ids = list(batch)
+            existing = set(self.collection.get(ids=ids, include=[])['ids'])
+            new_ids = [doc_id for doc_id in ids if doc_id not in existing]
+            self._stats['duplicates'] += len(existing)
+            if new_ids:
+                self.collection.add(
+                    ids=new_ids,
+                    documents=[batch[doc_id][0] for doc_id in new_ids],
+                    metadatas=[batch[doc_id][1] for doc_id in new_ids]
+                )
+                self._stats['chunks_added'] += len(new_ids)
+                self._stats['batches'] += 1
+                mark_collection_changed()
+            self._seen.update(ids)
+            if len(self._seen) > 100000:
+                # Only a shortcut; the collection lookup above still catches repeats
+                self._seen.clear()
+        except Exception as e:
+            self._stats['errors'] += 1
+            print(f"ChromaDB ingestion error: {e}")
+
+def get_ingestion_pipeline():
+    """Return the shared ingestion pipeline, starting its worker on first use"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = IngestionPipeline()
+        atexit.register(_pipeline.flush, 5.0)
+    return _pipeline
+
+def ingest_scraped_page(url, scraped_data, session_id=None):
+    """Queue a scraped page for the knowledge base"""
+    if not INGEST_ENABLED:
+        return False
+    parts = [scraped_data.get('title', ''), scraped_data.get('meta_description', ''),
+             '\n'.join(scraped_data.get('headings', [])), scraped_data.get('content', '')]
+    text = '\n\n'.join(part for part in parts if part)
+    metadata = {'source': 'website', 'url': url, 'ingested_at': datetime.now().isoformat()}
+    if session_id:
+        metadata['session_id'] = session_id
+    return get_ingestion_pipeline().submit(text, metadata)
+
+def ingest_kyb_answer(session_id, question, answer, category=''):
+    """Queue a KYB question/answer pair for the knowledge base"""
+    if not INGEST_ENABLED:
+        return False
+    text = f"{question}\n{answer}" if question else answer
+    metadata = {'source': 'kyb_answer', 'session_id': session_id or '', 'category': category,
+                'ingested_at': datetime.now().isoformat()}
+    return get_ingestion_pipeline().submit(text, metadata)
+
+def query_many(query_texts, n_results=3):
+    """Query ChromaDB for several texts with a single multi-query call
+    
+    Returns one list per query text of {'document', 'metadata', 'distance'}
+    hits. Results are memoized for a short time and dropped as soon as the
+    collection changes.
+    """
+    results = [None] * len(query_texts)
+    now = time.monotonic()
+    with _query_cache_lock:
+        version = _collection_version
+        for index, text in enumerate(query_texts):
+            cached = _query_cache.get((version, n_results, text))
+            if cached and now - cached[0] < QUERY_CACHE_TTL:
+                _query_cache.move_to_end((version, n_results, text))
+                results[index] = cached[1]
+        missing = [index for index, result in enumerate(results) if result is None]
+        _query_stats['hits'] += len(query_texts) - len(missing)
+        _query_stats['misses'] += len(missing)
+    
+    if missing:
         coll = init_chroma()
-        results = coll.query(
-            query_texts=[query_text],
-            n_results=n_results
+        texts = [query_texts[index] for index in missing]
+        response = coll.query(
+            query_embeddings=get_embedding_function()(texts),
+            n_results=n_results,
+            include=['documents', 'metadatas', 'distances']
         )
         
-        if results['documents'] and results['documents'][0]:
-            return '\n\n'.join(results['documents'][0])
-        
-        return ''
+        with _query_cache_lock:
+            _query_stats['query_calls'] += 1
+            for position, index in enumerate(missing):
+                documents = (response.get('documents') or [[]])[position] or []
+                metadatas = (response.get('metadatas') or [[]])[position] or [{}] * len(documents)
+                distances = (response.get('distances') or [[]])[position] or [None] * len(documents)
+                hits = [{'document': document, 'metadata': metadata or {}, 'distance': distance}
+                        for document, metadata, distance in zip(documents, metadatas, distances)]
+                results[index] = hits
+                if version == _collection_version:
+                    _query_cache[(version, n_results, query_texts[index])] = (now, hits)
+            while len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    
+    return results
+
+def get_retrieval_stats():
+    """Return embedding and query cache counters"""
+    lookups = _query_stats['hits'] + _query_stats['misses']
+    return {
+        'query_cache': dict(_query_stats, entries=len(_query_cache),
+                            hit_rate=_query_stats['hits'] / lookups if lookups else 0.0),
+        'embedding_cache': get_embedding_function().stats()
+    }
+
+def query_chroma(query_text, n_results=3):
+    """Query ChromaDB for relevant context"""
+    try:
+        hits = query_many([query_text], n_results=n_results)[0]
+        return '\n\n'.join(hit['document'] for hit in hits)
     
     except Exception as e:
         print(f"ChromaDB query error: {e}")
@@ -0,0 +1,181 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Prompt budgets, in estimated tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '600'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '400'))
+HISTORY_MAX_TURNS = 5
+# Set to 0 to build context from session data only, without querying ChromaDB; follows ingestion by default
+USE_KNOWLEDGE_BASE = os.getenv('CONTEXT_USE_KNOWLEDGE_BASE', os.getenv('CHROMA_INGEST_ENABLED', '0')) == '1'
+CHROMA_RESULTS = 5
+
+# Relative trust in each source when relevance is otherwise equal
+SOURCE_WEIGHTS = {
+    'kyb_summary': 1.0,
+    'kyb': 0.8,
+    'knowledge_base': 0.6
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'is', 'are', 'for', 'on', 'with',
+              'this', 'that', 'what', 'your', 'you', 'it', 'be', 'as', 'at', 'by', 'from', 'do', 'does'}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, on a word boundary where possible"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1]
+    space = cut.rfind(' ')
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
+
+def _terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS}
+
+
+def _overlap(query_terms: set, text: str) -> float:
+    if not query_terms:
+        return 0.0
+    return len(query_terms & _terms(text)) / len(query_terms)
+
+
+def _kyb_snippets(session_state: Dict) -> List[Dict]:
+    """Turn the session's KYB data into context snippets"""
+    kyb_data = session_state.get('kyb_data') or {}
+    snippets = []
+    if session_state.get('what_they_sell'):
+        snippets.append({'text': f"Business: {session_state['what_they_sell']}", 'source': 'kyb_summary'})
+    if kyb_data.get('summary'):
+        snippets.append({'text': f"Summary: {kyb_data['summary']}", 'source': 'kyb_summary'})
+    labels = {'business_understanding': 'Business', 'objectives': 'Objective', 'constraints': 'Challenge'}
+    for key, label in labels.items():
+        for item in kyb_data.get(key, []):
+            snippets.append({'text': f"{label}: {item}", 'source': 'kyb'})
+    if session_state.get('conversation_summary'):
+        snippets.append({'text': f"Earlier conversation: {session_state['conversation_summary']}",
+                         'source': 'kyb_summary'})
+    return snippets
+
+
+def _chroma_snippets(query: str, session_id: Optional[str], exclude_urls: Iterable[str]) -> List[Dict]:
+    """Fetch knowledge-base snippets; the knowledge base is optional"""
+    try:
+        from services.chroma_service import query_many
+        hits = query_many([query], n_results=CHROMA_RESULTS)[0]
+    except Exception as e:
+        print(f"Context retrieval skipped: {e}")
+        return []
+
+    excluded = set(exclude_urls)
+    snippets = []
+    for hit in hits:
+        metadata = hit.get('metadata') or {}
+        if metadata.get('url') in excluded:
+            continue
+        distance = hit.get('distance')
+        similarity = 1.0 / (1.0 + distance) if distance is not None else 0.5
+        if session_id and metadata.get('session_id') == session_id:
+            similarity += 0.25
+        snippets.append({'text': hit['document'], 'source': 'knowledge_base', 'similarity': similarity})
+    return snippets
+
+
+def rank_snippets(query: str, snippets: List[Dict]) -> List[Dict]:
+    """Score snippets by term overlap, vector similarity and source weight; drop duplicates"""
+    query_terms = _terms(query)
+    seen = set()
+    ranked = []
+    for snippet in snippets:
+        key = snippet['text'].strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        score = SOURCE_WEIGHTS.get(snippet['source'], 0.5)
+        score += _overlap(query_terms, snippet['text'])
+        score += snippet.get('similarity', 0.0)
+        ranked.append(dict(snippet, score=score))
+    ranked.sort(key=lambda snippet: snippet['score'], reverse=True)
+    return ranked
+
+
+def pack_snippets(snippets: List[Dict], token_budget: int) -> Tuple[List[str], int, bool]:
+    """Greedily pack ranked snippets into the budget, truncating the one that crosses it"""
+    packed, used, truncated = [], 0, False
+    for snippet in snippets:
+        line = f"- {snippet['text']}"
+        tokens = estimate_tokens(line) + 1
+        if used + tokens <= token_budget:
+            packed.append(line)
+            used += tokens
+            continue
+        remaining = token_budget - used - 1
+        if remaining >= 16:
+            line = truncate_to_tokens(line, remaining)
+            packed.append(line)
+            used += estimate_tokens(line) + 1
+        truncated = True
+        break
+    return packed, used, truncated
+
+
+def build_context(query: str, session_state: Optional[Dict] = None, token_budget: Optional[int] = None,
+                  exclude_url: Union[str, Iterable[str], None] = None,
+                  use_knowledge_base: Optional[bool] = None) -> Tuple[str, Dict]:
+    """Assemble ranked KYB and knowledge-base snippets that fit the token budget
+
+    exclude_url (one URL or several) leaves out knowledge-base chunks of pages
+    that are already in the prompt. Returns (context_text, stats) where stats reports how many snippets were
+    considered and used and the token size of the context.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    session_state = session_state or {}
+
+    snippets = _kyb_snippets(session_state)
+    if USE_KNOWLEDGE_BASE if use_knowledge_base is None else use_knowledge_base:
+        exclude_urls = [exclude_url] if isinstance(exclude_url, str) else (exclude_url or [])
+        snippets += _chroma_snippets(query, session_state.get('session_id'), exclude_urls)
+
+    ranked = rank_snippets(query, snippets)
+    packed, used, truncated = pack_snippets(ranked, token_budget)
+    return '\n'.join(packed), {
+        'candidates': len(ranked),
+        'snippets': len(packed),
+        'context_tokens': used,
+        'token_budget': token_budget,
+        'truncated': truncated
+    }
+
+
+def pack_history(history: Optional[List[Dict]], token_budget: Optional[int] = None,
+                 max_turns: int = HISTORY_MAX_TURNS) -> Tuple[str, int]:
+    """Render the most recent turns newest-first into the budget; long turns are truncated
+
+    Returns (history_text, tokens_used).
+    """
+    token_budget = HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    if not history:
+        return '', 0
+
+    # Give each turn a fair share so one long paste cannot crowd out the rest
+    recent = history[-max_turns:]
+    per_turn = max(token_budget // len(recent), 16)
+    lines, used = [], 0
+    for message in reversed(recent):
+        line = truncate_to_tokens(f"{message['role']}: {message['content']}", per_turn)
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    lines.reverse()
+    return '\n'.join(lines), used
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from services.scraper_service import fetch_text, scrape_many, scrape_url
+from services.text_dedup import ContentDeduper
+from services.tracing import span
+from services.url_intake import cache_key, is_scrapeable_url
+
+# Crawl budgets: pages fetched (seed included), body bytes across all pages, and wall time
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', '6'))
+CRAWL_MAX_BYTES = int(os.getenv('CRAWL_MAX_BYTES', str(3 * 1024 * 1024)))
+CRAWL_DEADLINE = float(os.getenv('CRAWL_DEADLINE', '15'))
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', '4'))
+CRAWL_PAGE_MAX_BYTES = 512 * 1024
+SITEMAP_DEADLINE = 3.0
+SITEMAP_MAX_URLS = 200
+# Pages whose text is at least this similar to a page already kept are skipped
+PAGE_DUPLICATE_THRESHOLD = 0.9
+
+# Path and anchor words that point at pages describing the business, and pages that rarely do
+RELEVANCE_KEYWORDS = {
+    'about': 5, 'pricing': 5, 'price': 4, 'plans': 4, 'product': 4, 'products': 4, 'services': 4,
+    'solutions': 4, 'customers': 4, 'features': 3, 'platform': 3, 'how-it-works': 3, 'company': 3,
+    'case-studies': 3, 'industries': 2, 'who-we-are': 3, 'team': 2, 'use-cases': 2
+}
+IRRELEVANT_KEYWORDS = {
+    'blog': -3, 'news': -3, 'press': -2, 'careers': -4, 'jobs': -4, 'login': -6, 'signin': -6,
+    'signup': -4, 'register': -4, 'cart': -6, 'checkout': -6, 'privacy': -6, 'terms': -6, 'legal': -5,
+    'cookie': -6, 'tag': -3, 'author': -3, 'search': -4
+}
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.zip', '.mp4', '.mp3',
+                   '.css', '.js', '.xml', '.json', '.ico', '.woff', '.woff2')
+
+_WORD_SPLIT = re.compile(r'[^a-z0-9-]+')
+_SITEMAP_LOC = re.compile(r'<loc>\s*([^<\s]+)\s*</loc>', re.IGNORECASE)
+
+
+def site_key(url: str) -> str:
+    """Host without a leading www., so example.com and www.example.com count as one site"""
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def same_site_url(base_url: str, href: str, site: str,
+                  skip_extensions: Tuple[str, ...] = SKIP_EXTENSIONS) -> Optional[str]:
+    """Resolve href against base_url; None unless it is an http(s) page on the same site"""
+    if href.startswith(('mailto:', 'tel:', 'javascript:', '#')):
+        return None
+    url = urljoin(base_url, href)
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or site_key(url) != site:
+        return None
+    if skip_extensions and parts.path.lower().endswith(skip_extensions):
+        return None
+    return cache_key(url)
+
+
+def relevance_score(url: str, anchor_text: str = '') -> int:
+    """Score how likely a page is to describe what the business sells"""
+    parts = urlsplit(url)
+    words = set(_WORD_SPLIT.split(f"{parts.path.lower()} {anchor_text.lower()}")) - {''}
+    score = 0
+    for word in words:
+        score += RELEVANCE_KEYWORDS.get(word, 0) + IRRELEVANT_KEYWORDS.get(word, 0)
+    # Shallow pages are usually the overview pages
+    score -= max(parts.path.rstrip('/').count('/') - 1, 0)
+    if parts.query:
+        score -= 2
+    return score
+
+
+def page_text(data: Dict) -> str:
+    return f"{data.get('title', '')}\n{data.get('content', '')}"
+
+
+def sitemap_urls(seed_url: str, site: str, deadline: float = SITEMAP_DEADLINE) -> List[str]:
+    """Same-site page URLs listed in /sitemap.xml, following one level of sitemap index"""
+    parts = urlsplit(seed_url)
+    pending = [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+    urls: List[str] = []
+    deadline_at = time.monotonic() + deadline
+    fetched = 0
+    while pending and len(urls) < SITEMAP_MAX_URLS and fetched < 3:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            text = fetch_text(pending.pop(0), deadline=remaining)
+        except Exception as e:
+            print(f"Sitemap skipped: {e}")
+            break
+        fetched += 1
+        for loc in _SITEMAP_LOC.findall(text):
+            if loc.lower().endswith('.xml'):
+                # A sitemap index could point anywhere, including private addresses
+                nested = same_site_url(seed_url, loc, site, skip_extensions=())
+                if nested and is_scrapeable_url(nested) and nested not in pending:
+                    pending.append(nested)
+                continue
+            url = same_site_url(seed_url, loc, site)
+            if url and url not in urls:
+                urls.append(url)
+    return urls[:SITEMAP_MAX_URLS]
+
+
+def crawl_site(seed_url: str, max_pages: int = CRAWL_MAX_PAGES, max_bytes: int = CRAWL_MAX_BYTES,
+               deadline: float = CRAWL_DEADLINE, concurrency: int = CRAWL_CONCURRENCY,
+               use_sitemap: bool = True) -> Dict:
+    """Fetch the seed page and the most business-relevant pages of the same site within the budgets
+
+    Returns {url, pages: [{url, data, score}], duplicates, failed, bytes_read,
+    elapsed, exhausted}, pages in fetch order with the seed first. Raises if
+    the seed page cannot be fetched.
+    """
+    started = time.monotonic()
+    deadline_at = started + deadline
+    site = site_key(seed_url)
+
+    with span('crawl.site', max_pages=max_pages) as crawl_span:
+        seed_data = scrape_url(seed_url, max_bytes=min(CRAWL_PAGE_MAX_BYTES, max_bytes), deadline=deadline)
+        seed = cache_key(seed_url)
+        pages = [{'url': seed_url, 'data': seed_data, 'score': relevance_score(seed)}]
+        # Pages sharing a few paragraphs are fine; only near-copies of a whole page are dropped
+        seen_content = ContentDeduper(threshold=PAGE_DUPLICATE_THRESHOLD, containment=False)
+        seen_content.add(page_text(seed_data))
+        visited: Set[str] = {seed}
+        candidates: Dict[str, int] = {}
+        bytes_read = seed_data.get('bytes_read', 0)
+        duplicates, failed = 0, []
+
+        _add_candidates(candidates, visited, seed_url, seed_data, site)
+        if use_sitemap and max_pages > 1:
+            for url in sitemap_urls(seed_url, site, min(SITEMAP_DEADLINE, deadline_at - time.monotonic())):
+                if url not in visited:
+                    candidates.setdefault(url, relevance_score(url))
+
+        while len(pages) < max_pages and candidates:
+            remaining_time = deadline_at - time.monotonic()
+            remaining_bytes = max_bytes - bytes_read
+            if remaining_time <= 0 or remaining_bytes <= 0:
+                break
+            batch = _next_batch(candidates, min(concurrency, max_pages - len(pages)))
+            if not batch:
+                break
+            visited.update(batch)
+            # Each page in the batch gets an equal share of what is left of the byte budget
+            page_bytes = max(min(CRAWL_PAGE_MAX_BYTES, remaining_bytes // len(batch)), 1)
+            for result in scrape_many(batch, concurrency=len(batch), max_bytes=page_bytes,
+                                      deadline=remaining_time):
+                if result['error']:
+                    failed.append(result['url'])
+                    continue
+                data = result['data']
+                bytes_read += data.get('bytes_read', 0)
+                if not seen_content.add(page_text(data)):
+                    duplicates += 1
+                    continue
+                pages.append({'url': result['url'], 'data': data, 'score': relevance_score(result['url'])})
+                _add_candidates(candidates, visited, result['url'], data, site)
+
+        crawl_span.set(pages=len(pages), bytes=bytes_read, duplicates=duplicates)
+
+    return {
+        'url': seed_url,
+        'pages': pages[:max_pages],
+        'duplicates': duplicates,
+        'failed': failed,
+        'bytes_read': bytes_read,
+        'elapsed': time.monotonic() - started,
+        'exhausted': not candidates
+    }
+
+
+def _add_candidates(candidates: Dict[str, int], visited: Set[str], page_url: str, data: Dict, site: str) -> None:
+    """Queue the same-site links of a fetched page, keeping each URL's best score"""
+    for link in data.get('links', []):
+        url = same_site_url(page_url, link.get('href', ''), site)
+        if url is None or url in visited:
+            continue
+        score = relevance_score(url, link.get('text', ''))
+        if score > candidates.get(url, -1000):
+            candidates[url] = score
+
+
+def _next_batch(candidates: Dict[str, int], size: int) -> List[str]:
+    """Pop the highest-scoring candidates, skipping pages that look irrelevant"""
+    ranked: List[Tuple[int, str]] = sorted(((score, url) for url, score in candidates.items()
+                                            if score >= 0), key=lambda item: (-item[0], item[1]))
+    batch = [url for _, url in ranked[:size]]
+    for url in batch:
+        del candidates[url]
+    if not batch:
+        candidates.clear()
+    return batch
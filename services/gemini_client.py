@@ -0,0 +1,351 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterator, Optional
+
+# Requests per second across the process (0 disables the limiter) and the burst allowed on top
+RATE_LIMIT = float(os.getenv('GEMINI_RATE_LIMIT', '5'))
+RATE_BURST = int(os.getenv('GEMINI_RATE_BURST', '10'))
+# Calls allowed to be waiting on the API at once
+MAX_IN_FLIGHT = int(os.getenv('GEMINI_MAX_IN_FLIGHT', '8'))
+# Seconds a call may take in total, retries and queueing included
+CALL_DEADLINE = float(os.getenv('GEMINI_DEADLINE', '30'))
+MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '8'))
+# Consecutive failures that open the breaker, and how long it stays open before a trial call
+BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+
+# HTTP statuses worth retrying besides 5xx
+RETRYABLE_STATUS_CODES = {408, 429}
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+BREAKER_STATE_CODES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised without calling the API while the breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call could not finish before its deadline"""
+
+
+class Throttled(DeadlineExceeded):
+    """Raised when the local rate limit or in-flight cap held a call past its deadline"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient API errors: throttling, server errors, timeouts and dropped connections
+
+    Judged by exception type and HTTP status code (google.api_core errors carry it
+    as .code), never by the message text.
+    """
+    if isinstance(error, (DeadlineExceeded, TimeoutError, ConnectionError)):
+        return True
+    for attribute in ('code', 'status_code'):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code in RETRYABLE_STATUS_CODES or code >= 500
+    return False
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst; acquire blocks until a token or the deadline"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float) -> bool:
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def available(self) -> float:
+        with self._lock:
+            if self.rate <= 0:
+                return float(self.burst)
+            elapsed = time.monotonic() - self._updated
+            return min(self.burst, self._tokens + elapsed * self.rate)
+
+
+class CircuitBreaker:
+    """Opens after threshold consecutive failures; after reset_timeout one trial call decides whether to close"""
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    print(f"Gemini circuit opened after {self._failures} consecutive failures")
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def release(self) -> None:
+        """Give up a trial slot without judging the API (e.g. a non-retryable error)"""
+        with self._lock:
+            self._trial_running = False
+
+
+class _StreamSlot:
+    """An in-flight slot held for a whole stream
+
+    Freed once the stream is closed and no worker is still reading from it, so a
+    read abandoned at the deadline keeps the slot until the API returns.
+    """
+
+    def __init__(self, client: 'GeminiClient'):
+        self._client = client
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closed = False
+
+    def start_read(self) -> None:
+        with self._lock:
+            self._readers += 1
+
+    def end_read(self, future=None) -> None:
+        with self._lock:
+            self._readers -= 1
+            release = self._closed and self._readers == 0
+        if release:
+            self._client._finish(None)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            release = self._readers == 0
+        if release:
+            self._client._finish(None)
+
+
+_END = object()
+
+
+class GeminiClient:
+    """Rate-limited, deadline-bound calls to the model, with retries and a circuit breaker"""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST, max_in_flight: int = MAX_IN_FLIGHT,
+                 deadline: float = CALL_DEADLINE, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 breaker_threshold: int = BREAKER_THRESHOLD, breaker_reset: float = BREAKER_RESET):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        # Released when the worker finishes, so an abandoned call keeps its slot until the API returns
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='gemini-call')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counts = {'calls': 0, 'successes': 0, 'failures': 0, 'retries': 0, 'timeouts': 0,
+                        'rejected_open': 0, 'rate_limited': 0, 'saturated': 0}
+
+    def call(self, fn: Callable, *args, deadline: Optional[float] = None, **kwargs):
+        """Run fn(*args, **kwargs) under the limits; raises CircuitOpen, DeadlineExceeded or fn's own error"""
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        self._count('calls')
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('rejected_open')
+                raise CircuitOpen("Gemini circuit is open")
+            try:
+                result = self._attempt(fn, args, kwargs, expires)
+            except Exception as e:
+                if not self._retry_after(e, attempt, expires):
+                    raise
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._count('successes')
+            return result
+
+    def stream(self, fn: Callable, *args, deadline: Optional[float] = None, **kwargs) -> Iterator:
+        """Iterate over fn(*args, **kwargs) under the same limits as call(), for the whole stream
+
+        The in-flight slot is held until the stream ends or is closed, and every item
+        must arrive before the deadline. Opening the stream and reading its first
+        item are retried like a call; a failure after that ends the stream and counts
+        against the breaker.
+        """
+        expires = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        self._count('calls')
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('rejected_open')
+                raise CircuitOpen("Gemini circuit is open")
+            slot = None
+            try:
+                self._acquire(expires)
+                slot = _StreamSlot(self)
+                items = self._read(slot, lambda: iter(fn(*args, **kwargs)), expires)
+                first = self._read(slot, lambda: next(items, _END), expires)
+            except Exception as e:
+                if slot is not None:
+                    slot.close()
+                if not self._retry_after(e, attempt, expires):
+                    raise
+                attempt += 1
+                continue
+            break
+
+        try:
+            item = first
+            while item is not _END:
+                yield item
+                item = self._read(slot, lambda: next(items, _END), expires)
+        except GeneratorExit:
+            # The caller stopped reading; that says nothing about the API
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            self._count('failures')
+            raise
+        finally:
+            slot.close()
+        self.breaker.record_success()
+        self._count('successes')
+
+    def _retry_after(self, error: Exception, attempt: int, expires: float) -> bool:
+        """Record a failed attempt; sleep and return True if it should be tried again"""
+        if isinstance(error, Throttled):
+            # Our own limits, not a sign the API is unhealthy
+            self.breaker.release()
+            self._count('failures')
+            return False
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+        delay = self._backoff(attempt)
+        if not retryable or attempt >= self.max_retries or time.monotonic() + delay >= expires:
+            self._count('failures')
+            return False
+        self._count('retries')
+        time.sleep(delay)
+        return True
+
+    def _acquire(self, expires: float) -> None:
+        """Take a rate-limit token and an in-flight slot, or raise Throttled"""
+        if not self.bucket.acquire(expires):
+            self._count('rate_limited')
+            raise Throttled("Gemini rate limit wait exceeded the deadline")
+        if not self._slots.acquire(timeout=max(expires - time.monotonic(), 0)):
+            self._count('saturated')
+            raise Throttled("No Gemini call slot freed up before the deadline")
+        with self._lock:
+            self._in_flight += 1
+
+    def _read(self, slot: _StreamSlot, read: Callable, expires: float):
+        """Run one read of a stream on the pool, waiting no later than expires"""
+        slot.start_read()
+        try:
+            future = self._pool.submit(read)
+        except Exception:
+            slot.end_read()
+            raise
+        future.add_done_callback(slot.end_read)
+        try:
+            return future.result(timeout=max(expires - time.monotonic(), 0))
+        except FutureTimeout:
+            self._count('timeouts')
+            raise DeadlineExceeded("Gemini stream exceeded its deadline")
+
+    def _attempt(self, fn: Callable, args, kwargs, expires: float):
+        self._acquire(expires)
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._finish(None)
+            raise
+        future.add_done_callback(self._finish)
+        try:
+            return future.result(timeout=max(expires - time.monotonic(), 0))
+        except FutureTimeout:
+            self._count('timeouts')
+            raise DeadlineExceeded("Gemini call exceeded its deadline")
+
+    def _finish(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: anywhere up to the capped exponential delay"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+            in_flight = self._in_flight
+        return dict(counts,
+                    breaker_state=self.breaker.state,
+                    breaker_state_code=BREAKER_STATE_CODES[self.breaker.state],
+                    breaker_opened=self.breaker.times_opened,
+                    in_flight=in_flight,
+                    max_in_flight=self.max_in_flight,
+                    tokens_available=round(self.bucket.available(), 2))
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
@@ -1,7 +1,18 @@
 ﻿import os
 import json
+import hashlib
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
 import google.generativeai as genai
 from dotenv import load_dotenv
+from services.cache_store import PersistentCache
+from services.gemini_client import CircuitOpen, GeminiClient
+from services.llm_backends import LLM_BACKEND, create_model_factory
+from services.context_service import CONTEXT_TOKEN_BUDGET, estimate_tokens, pack_history, truncate_to_tokens
+from services.tracing import span, tracer
 
 load_dotenv()
 
@@ -25,35 +36,321 @@ Always respond with valid JSON in this format:
     }
 }'''
 
-def analyze_with_gemini(user_input, history=None, context=''):
-    '''Analyze user input with Gemini AI'''
-    try:
-        # Try different model names
-        model_names = ['gemini-1.5-flash', 'gemini-1.5-flash-latest', 'gemini-pro', 'models/gemini-pro']
-        
-        model = None
-        for model_name in model_names:
+# Candidate models, in order of preference
+MODEL_NAMES = ['gemini-1.5-flash', 'gemini-1.5-flash-latest', 'gemini-pro', 'models/gemini-pro']
+
+# How long to wait before retrying the candidate list once every model has failed
+MODEL_RETRY_AFTER = float(os.getenv('GEMINI_MODEL_RETRY_AFTER', '300'))
+
+
+class ModelRegistry:
+    """Process-wide cache of the resolved Gemini model handle"""
+
+    def __init__(self, model_names, factory=None, retry_after: float = MODEL_RETRY_AFTER):
+        self.model_names = list(model_names)
+        self.factory = factory or genai.GenerativeModel
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._model = None
+        self._model_name = None
+        self._candidate_index = 0
+        self._resolved_at = None
+        self._resolution_seconds = None
+        self._exhausted_at = None
+        self._evictions = 0
+
+    def get_model(self):
+        """Return the cached model, resolving the first working candidate on first use"""
+        model = self._model
+        if model is not None:
+            return model
+
+        with self._lock:
+            if self._model is None:
+                self._resolve()
+            return self._model
+
+    def _resolve(self) -> None:
+        """Walk the candidate list until a model can be built (caller holds the lock)"""
+        if self._exhausted_at is not None:
+            if time.monotonic() - self._exhausted_at < self.retry_after:
+                return
+            self._exhausted_at = None
+            self._candidate_index = 0
+
+        start = time.perf_counter()
+        while self._candidate_index < len(self.model_names):
+            model_name = self.model_names[self._candidate_index]
             try:
-                model = genai.GenerativeModel(model_name)
+                self._model = self.factory(model_name)
+                self._model_name = model_name
+                self._resolved_at = datetime.now().isoformat()
+                self._resolution_seconds = time.perf_counter() - start
                 print(f"Successfully loaded model: {model_name}")
-                break
+                return
             except Exception as e:
                 print(f"Failed to load model {model_name}: {e}")
+                self._candidate_index += 1
+
+        self._exhausted_at = time.monotonic()
+
+    def evict(self, model) -> None:
+        """Drop a model the API no longer serves so the next candidate is tried"""
+        with self._lock:
+            if model is not None and model is self._model:
+                print(f"Evicting model: {self._model_name}")
+                self._model = None
+                self._model_name = None
+                self._candidate_index += 1
+                self._evictions += 1
+
+    def reset(self) -> None:
+        """Forget the resolved model and start again from the first candidate"""
+        with self._lock:
+            self._model = None
+            self._model_name = None
+            self._candidate_index = 0
+            self._resolved_at = None
+            self._resolution_seconds = None
+            self._exhausted_at = None
+
+    def info(self) -> Dict:
+        """Return the chosen model and its resolution time for monitoring"""
+        return {
+            'model_name': self._model_name,
+            'resolved_at': self._resolved_at,
+            'resolution_seconds': self._resolution_seconds,
+            'evictions': self._evictions,
+            'candidates_remaining': max(len(self.model_names) - self._candidate_index, 0)
+        }
+
+
+model_registry = ModelRegistry(MODEL_NAMES, factory=create_model_factory(LLM_BACKEND, real_factory=genai.GenerativeModel))
+_llm_backend = LLM_BACKEND
+
+
+def set_llm_backend(backend: str, **options) -> ModelRegistry:
+    """Switch every Gemini call to another backend (gemini, record, replay or synthetic)
+    
+    options go to services.llm_backends.create_model_factory, e.g. latency,
+    failure_rate or recording_path.
+    """
+    global model_registry, _llm_backend
+    factory = create_model_factory(backend, real_factory=genai.GenerativeModel, **options)
+    model_registry = ModelRegistry(MODEL_NAMES, factory=factory)
+    _llm_backend = backend
+    return model_registry
+
+
+def get_llm_backend() -> str:
+    return _llm_backend
+
+
+# Every model call goes through one rate-limited client with retries and a circuit breaker
+gemini_client = GeminiClient()
+tracer.add_gauges('gemini_client', lambda: gemini_client.stats())
+
+
+def get_client_stats() -> Dict:
+    """Rate limiter, in-flight and circuit breaker state of the Gemini client"""
+    return gemini_client.stats()
+
+# Memoized analyses, keyed by a fingerprint of model name, system prompt and prompt text
+RESPONSE_CACHE_ENABLED = os.getenv('GEMINI_CACHE_ENABLED', '1') == '1'
+RESPONSE_CACHE_PATH = os.getenv('GEMINI_CACHE_PATH', os.path.join('cache_files', 'gemini_cache.db'))
+RESPONSE_CACHE_TTL = float(os.getenv('GEMINI_CACHE_TTL', str(24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '1000'))
+
+_response_cache = None
+
+
+def get_model_info() -> Dict:
+    """Get details about the Gemini model currently in use"""
+    return dict(model_registry.info(), backend=_llm_backend)
+
+
+def _is_model_not_found(error: Exception) -> bool:
+    """Check if an API error means the requested model does not exist"""
+    if getattr(error, 'code', None) == 404:
+        return True
+    message = str(error).lower()
+    return '404' in message and 'not found' in message
+
+
+def _generate(prompt: str):
+    """Generate content with the cached model, falling through to the next candidate on 404"""
+    for _ in range(len(model_registry.model_names)):
+        model = model_registry.get_model()
+        if model is None:
+            return None
+        try:
+            return gemini_client.call(model.generate_content, prompt)
+        except Exception as e:
+            if not _is_model_not_found(e):
+                raise
+            model_registry.evict(model)
+    return None
+
+
+def _generate_stream(prompt: str) -> Optional[Iterator[str]]:
+    """Stream text chunks from the cached model, falling through to the next candidate on 404
+
+    The whole stream runs under the client's deadline, in-flight cap and circuit breaker.
+    """
+    for _ in range(len(model_registry.model_names)):
+        model = model_registry.get_model()
+        if model is None:
+            return None
+        chunks = gemini_client.stream(model.generate_content, prompt, stream=True)
+        try:
+            # A missing model only surfaces once the first chunk is requested
+            first = next(chunks, None)
+        except Exception as e:
+            if not _is_model_not_found(e):
+                raise
+            model_registry.evict(model)
+            continue
+        return _chain_chunks(first, chunks)
+    return None
+
+
+def _chain_chunks(first, chunks) -> Iterator[str]:
+    try:
+        if first is not None:
+            yield first.text
+        for chunk in chunks:
+            yield chunk.text
+    finally:
+        # Frees the client's in-flight slot even if the caller stops early
+        chunks.close()
+
+
+class _ResponseFieldStreamer:
+    """Pull the "response" string out of a JSON reply while the reply is still arriving
+
+    Replies that do not start like JSON are passed through unchanged.
+    """
+
+    _RESPONSE_KEY = re.compile(r'"response"\s*:\s*"')
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.text = ''
+        self._json = None
+        self._pos = None
+        self._finished = False
+
+    def feed(self, chunk: str) -> str:
+        """Add the next chunk of raw reply text and return any newly decoded response text"""
+        self.text += chunk
+        if self._json is None:
+            stripped = self.text.lstrip()
+            if not stripped:
+                return ''
+            self._json = stripped[0] in '{`'
+            if not self._json:
+                return self.text
+        if not self._json:
+            return chunk
+        if self._finished:
+            return ''
+        if self._pos is None:
+            match = self._RESPONSE_KEY.search(self.text)
+            if not match:
+                return ''
+            self._pos = match.end()
+        return self._decode_available()
+
+    def _decode_available(self) -> str:
+        text, pos, out = self.text, self._pos, []
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                self._finished = True
+                pos += 1
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
                 continue
-        
-        if not model:
-            # If no model works, return a simple response
-            return {
-                'response': f"I've received your input: {user_input}. AI analysis is currently unavailable, but I've noted this information.",
-                'knowledge_update': None
-            }
-        
-        # Build conversation history
-        history_text = ''
-        if history:
-            history_text = '\n'.join([f"{m['role']}: {m['content']}" for m in history[-5:]])
-        
-        prompt = f'''{SYSTEM_PROMPT}
+            if pos + 1 >= len(text):
+                break
+            escape = text[pos + 1]
+            if escape != 'u':
+                out.append(self._ESCAPES.get(escape, escape))
+                pos += 2
+                continue
+            # \uXXXX, possibly the first half of a surrogate pair
+            if pos + 6 > len(text):
+                break
+            try:
+                code = int(text[pos + 2:pos + 6], 16)
+            except ValueError:
+                code = 0xFFFD
+            if 0xD800 <= code < 0xDC00:
+                if pos + 12 > len(text):
+                    break
+                try:
+                    low = int(text[pos + 8:pos + 12], 16)
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                    pos += 6
+                except ValueError:
+                    code = 0xFFFD
+            out.append(chr(code))
+            pos += 6
+        self._pos = pos
+        return ''.join(out)
+
+
+def get_response_cache() -> PersistentCache:
+    """Return the on-disk Gemini response cache, creating it on first use"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = PersistentCache(RESPONSE_CACHE_PATH, table='responses', ttl=RESPONSE_CACHE_TTL,
+                                          max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+    return _response_cache
+
+
+def get_response_cache_stats() -> Dict:
+    """Return hit/miss counters for the Gemini response cache"""
+    return get_response_cache().stats()
+
+
+def _response_cache_key(prompt: str) -> str:
+    """Fingerprint a request by model name, system prompt and final prompt text"""
+    fingerprint = hashlib.sha256()
+    for part in (model_registry.info()['model_name'] or '', SYSTEM_PROMPT, prompt):
+        fingerprint.update(part.encode('utf-8'))
+        fingerprint.update(b'\0')
+    return fingerprint.hexdigest()
+
+
+def _parse_response_text(raw_text: str) -> Dict:
+    """Parse the model's JSON reply, falling back to the raw text"""
+    text = raw_text.strip()
+    
+    # Clean markdown code blocks if present
+    if text.startswith('`'):
+        text = text.split('`')[1]
+        if text.startswith('json'):
+            text = text[4:]
+    
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return {
+            'response': raw_text,
+            'knowledge_update': None
+        }
+
+
+def _build_prompt(user_input, history=None, context='') -> Tuple[str, Dict]:
+    """Assemble the full prompt sent to Gemini, keeping history and context within budget"""
+    history_text, history_tokens = pack_history(history)
+    if estimate_tokens(context) > CONTEXT_TOKEN_BUDGET:
+        context = truncate_to_tokens(context, CONTEXT_TOKEN_BUDGET)
+
+    prompt = f'''{SYSTEM_PROMPT}
 
 {f"Context from knowledge base: {context}" if context else ""}
 
@@ -63,30 +360,150 @@ Conversation history:
 User: {user_input}
 
 Please analyze and respond with valid JSON.'''
+    return prompt, {
+        'prompt_tokens': estimate_tokens(prompt),
+        'history_tokens': history_tokens,
+        'context_tokens': estimate_tokens(context)
+    }
 
-        # Generate response
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        
-        # Clean markdown code blocks if present
-        if text.startswith('`'):
-            text = text.split('`')[1]
-            if text.startswith('json'):
-                text = text[4:]
+
+def _unavailable_response(user_input) -> Dict:
+    return {
+        'response': f"I've received your input: {user_input}. AI analysis is currently unavailable, but I've noted this information.",
+        'knowledge_update': None
+    }
+
+
+def _error_response(user_input) -> Dict:
+    return {
+        'response': f"I understand your input about: {user_input}. Let me help you with that.",
+        'knowledge_update': None
+    }
+
+
+def analyze_with_gemini(user_input, history=None, context='', use_cache=True, cache_key=None):
+    '''Analyze user input with Gemini AI
+
+    cache_key replaces the prompt text in the response cache key, for callers
+    whose prompt varies in ways that do not change the answer.
+    '''
+    with span('gemini.analyze') as analyze_span:
+        try:
+            prompt, prompt_stats = _build_prompt(user_input, history, context)
+            analyze_span.set(prompt_tokens=prompt_stats['prompt_tokens'])
+
+            with span('gemini.model_init'):
+                model = model_registry.get_model()
+            if model is None:
+                # If no model works, return a simple response
+                return _unavailable_response(user_input)
+            
+            cache = get_response_cache() if use_cache and RESPONSE_CACHE_ENABLED else None
+            if cache is not None:
+                cached = cache.get(_response_cache_key(cache_key or prompt))
+                if cached and cached[1]:
+                    analyze_span.set(from_cache=True)
+                    return dict(cached[0], prompt_stats=prompt_stats)
+
+            # Generate response
+            with span('gemini.generate', prompt_tokens=prompt_stats['prompt_tokens']) as generate_span:
+                response = _generate(prompt)
+                if response is not None:
+                    generate_span.set(bytes=len(response.text))
+            if response is None:
+                return _unavailable_response(user_input)
+            
+            with span('gemini.parse', bytes=len(response.text)):
+                result = _parse_response_text(response.text)
+            if cache is not None:
+                # Keyed by whichever model actually answered
+                cache.set(_response_cache_key(cache_key or prompt), result)
+            return dict(result, prompt_stats=prompt_stats)
         
-        return json.loads(text)
-    
-    except json.JSONDecodeError:
-        return {
-            'response': response.text if 'response' in locals() else user_input,
-            'knowledge_update': None
-        }
+        except CircuitOpen:
+            # The API is known to be unhealthy; answer straight from the fallback
+            analyze_span.set(circuit_open=True)
+            return _error_response(user_input)
+        except Exception as e:
+            print(f"Gemini API error: {e}")
+            analyze_span.set(failed=True)
+            return _error_response(user_input)
+
+
+def stream_with_gemini(user_input, history=None, context='', use_cache=True, cache_key=None):
+    '''Yield the reply text as Gemini produces it
+
+    The generator's return value is the same dict analyze_with_gemini returns,
+    so callers can use `result = yield from stream_with_gemini(...)`.
+    cache_key works as in analyze_with_gemini.
+    '''
+    emitted = ''
+    try:
+        prompt, prompt_stats = _build_prompt(user_input, history, context)
+
+        with span('gemini.model_init'):
+            model = model_registry.get_model()
+        if model is None:
+            result = _unavailable_response(user_input)
+            yield result['response']
+            return result
+
+        cache = get_response_cache() if use_cache and RESPONSE_CACHE_ENABLED else None
+        if cache is not None:
+            cached = cache.get(_response_cache_key(cache_key or prompt))
+            if cached and cached[1]:
+                yield str(cached[0].get('response', ''))
+                return dict(cached[0], prompt_stats=prompt_stats)
+
+        stream_started = time.perf_counter()
+        chunks = _generate_stream(prompt)
+        if chunks is None:
+            result = _unavailable_response(user_input)
+            yield result['response']
+            return result
+
+        # Only time spent waiting on the model counts, not the caller rendering each piece
+        streamer = _ResponseFieldStreamer()
+        # _generate_stream already waited for the first chunk
+        generate_seconds = time.perf_counter() - stream_started
+        first_chunk = True
+        chunks = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            generate_seconds += time.perf_counter() - started
+            if first_chunk:
+                tracer.record('gemini.first_chunk', generate_seconds)
+                first_chunk = False
+            if chunk is None:
+                break
+            delta = streamer.feed(chunk)
+            if delta:
+                emitted += delta
+                yield delta
+        tracer.record('gemini.generate', generate_seconds, prompt_tokens=prompt_stats['prompt_tokens'],
+                      bytes=len(streamer.text))
+
+        with span('gemini.parse', bytes=len(streamer.text)):
+            result = _parse_response_text(streamer.text)
+        final_text = str(result.get('response', ''))
+        if final_text.startswith(emitted) and len(final_text) > len(emitted):
+            # The reply did not stream as expected (e.g. malformed JSON); send the rest now
+            yield final_text[len(emitted):]
+        if cache is not None:
+            cache.set(_response_cache_key(cache_key or prompt), result)
+        return dict(result, prompt_stats=prompt_stats)
+
     except Exception as e:
-        print(f"Gemini API error: {e}")
-        return {
-            'response': f"I understand your input about: {user_input}. Let me help you with that.",
-            'knowledge_update': None
-        }
+        if not isinstance(e, CircuitOpen):
+            print(f"Gemini API error: {e}")
+        result = _error_response(user_input)
+        if emitted:
+            result['response'] = emitted
+        else:
+            yield result['response']
+        return result
+
 
 def test_gemini_connection():
     '''Test if Gemini API is working'''
@@ -0,0 +1,201 @@
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from services.text_dedup import ContentDeduper
+
+MAX_HEADINGS = 15
+MAX_PARAGRAPHS = 15
+MIN_PARAGRAPH_LENGTH = 30
+MAX_PARAGRAPH_LENGTH = 500
+# Links kept per page (href plus anchor text), for same-site crawling
+MAX_LINKS = 100
+MAX_LINK_TEXT = 80
+
+SKIP_TAGS = {'script', 'style', 'nav', 'footer', 'iframe'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4'}
+BLOCK_TAGS = {'p', 'div', 'span'}
+CAPTURE_TAGS = HEADING_TAGS | BLOCK_TAGS | {'title'}
+
+
+class _ExtractionDone(Exception):
+    """Raised from a parser callback once every limit has been reached"""
+
+
+class PageExtractor(HTMLParser):
+    """Collect title, meta description, headings and paragraphs in one pass over the HTML
+
+    Text is kept in a flat buffer; each open element only remembers where its
+    text starts, so closing a deeply nested div costs nothing unless its text
+    length falls inside the paragraph window.
+    """
+
+    def __init__(self, max_headings: int = MAX_HEADINGS, max_paragraphs: int = MAX_PARAGRAPHS):
+        super().__init__(convert_charrefs=True)
+        self.max_headings = max_headings
+        self.max_paragraphs = max_paragraphs
+        self.title = ''
+        self.first_h1 = ''
+        self.meta_description = ''
+        self.og_description = ''
+        self.headings: List[str] = []
+        self.paragraphs: List[str] = []
+        # Nested blocks repeat their children's text; keep one copy of each
+        self.deduper = ContentDeduper()
+        self.links: List[Dict] = []
+        self._link: Optional[Dict] = None
+        self.done = False
+        self._skip_depth = 0
+        self._open: List[Tuple[str, int, int]] = []  # (tag, chunk index, char offset)
+        self._chunks: List[str] = []
+        self._chars = 0
+
+    def feed(self, data: str) -> bool:
+        """Feed the next piece of HTML; returns True once no more input is needed"""
+        if self.done:
+            return True
+        try:
+            super().feed(data)
+        except _ExtractionDone:
+            self.done = True
+        return self.done
+
+    def close(self) -> None:
+        """Finish parsing and close any elements left open at end of input"""
+        if not self.done:
+            try:
+                super().close()
+                while self._open:
+                    self._close_element(self._open[-1][0])
+            except _ExtractionDone:
+                self.done = True
+        self._end_link()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            # Navigation and footers are skipped as content but hold the most useful links
+            self._start_link(attrs)
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        if tag == 'meta':
+            self._handle_meta(attrs)
+        elif tag in CAPTURE_TAGS:
+            self._open.append((tag, len(self._chunks), self._chars))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'meta' and not self._skip_depth:
+            self._handle_meta(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._end_link()
+        if tag in SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+            return
+        if self._skip_depth or tag not in CAPTURE_TAGS:
+            return
+        if any(open_tag == tag for open_tag, _, _ in self._open):
+            # Implicitly close anything left open inside this element
+            while self._open:
+                open_tag = self._open[-1][0]
+                self._close_element(open_tag)
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if self._link is not None and len(self._link['text']) < MAX_LINK_TEXT:
+            self._link['text'] += data
+        if self._skip_depth or not self._open:
+            return
+        self._chunks.append(data)
+        self._chars += len(data)
+
+    def _start_link(self, attrs) -> None:
+        self._end_link()
+        href = (dict(attrs).get('href') or '').strip()
+        if href and len(self.links) < MAX_LINKS:
+            self._link = {'href': href, 'text': ''}
+
+    def _end_link(self) -> None:
+        if self._link is not None:
+            self._link['text'] = ' '.join(self._link['text'].split())[:MAX_LINK_TEXT]
+            self.links.append(self._link)
+            self._link = None
+
+    def _handle_meta(self, attrs) -> None:
+        attributes = dict(attrs)
+        content = (attributes.get('content') or '').strip()
+        if not content:
+            return
+        if (attributes.get('name') or '').lower() == 'description' and not self.meta_description:
+            self.meta_description = content
+        elif (attributes.get('property') or '').lower() == 'og:description' and not self.og_description:
+            self.og_description = content
+
+    def _close_element(self, tag: str) -> None:
+        _, chunk_index, char_offset = self._open.pop()
+        length = self._chars - char_offset
+
+        if tag == 'title':
+            if not self.title:
+                self.title = self._text_since(chunk_index).strip()
+        elif tag in HEADING_TAGS:
+            text = self._text_since(chunk_index).strip()
+            if tag == 'h1' and not self.first_h1:
+                self.first_h1 = text
+            if len(self.headings) < self.max_headings and len(text) > 3:
+                self.headings.append(text)
+        elif len(self.paragraphs) < self.max_paragraphs and length > MIN_PARAGRAPH_LENGTH:
+            # Only join the text when it can plausibly fit the paragraph window
+            # once surrounding whitespace is stripped
+            if length < MAX_PARAGRAPH_LENGTH * 4:
+                text = self._text_since(chunk_index).strip()
+                if MIN_PARAGRAPH_LENGTH < len(text) < MAX_PARAGRAPH_LENGTH and self.deduper.add(text):
+                    self.paragraphs.append(text)
+
+        if not self._open:
+            # Nothing can refer back into the buffer any more
+            self._chunks = []
+
+        if (len(self.paragraphs) >= self.max_paragraphs and len(self.headings) >= self.max_headings
+                and (self.title or self.first_h1)):
+            raise _ExtractionDone()
+
+    def _text_since(self, chunk_index: int) -> str:
+        return ''.join(self._chunks[chunk_index:])
+
+    def result(self) -> Dict:
+        """Return the extracted data in the same shape as scrape_url"""
+        return build_page_data(
+            title=self.title or self.first_h1,
+            meta_description=self.meta_description or self.og_description,
+            headings=self.headings,
+            paragraphs=self.paragraphs,
+            links=self.links,
+            duplicates=self.deduper.duplicates
+        )
+
+
+def build_page_data(title: str, meta_description: str, headings: List[str], paragraphs: List[str],
+                    links: Optional[List[Dict]] = None, duplicates: int = 0) -> Dict:
+    """Assemble the scrape result dict, with the usual fallbacks for empty pages"""
+    return {
+        'title': title if title else 'Title not found',
+        'meta_description': meta_description,
+        'headings': headings,
+        'content': '\n'.join(paragraphs) if paragraphs else 'Content could not be extracted',
+        'links': links or [],
+        'duplicate_blocks': duplicates
+    }
+
+
+def extract_page(html: str, chunk_size: int = 65536, extractor: Optional[PageExtractor] = None) -> Dict:
+    """Extract page data from an HTML string, stopping as soon as the limits are reached"""
+    extractor = extractor or PageExtractor()
+    for start in range(0, len(html), chunk_size):
+        if extractor.feed(html[start:start + chunk_size]):
+            break
+    extractor.close()
+    return extractor.result()
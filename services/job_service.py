@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Pool sizing; the queue bound counts queued and running jobs together
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '32'))
+# Finished jobs nobody collected are dropped after this many seconds
+JOB_RESULT_TTL = float(os.getenv('JOB_RESULT_TTL', '600'))
+LATENCY_SAMPLES = 1000
+
+
+class JobQueueFull(Exception):
+    """Raised when the executor already holds JOB_QUEUE_SIZE jobs"""
+
+
+class Job:
+    """A unit of background work and its outcome"""
+    
+    __slots__ = ('id', 'kind', 'status', 'result', 'error',
+                 'submitted_at', 'started_at', 'finished_at', 'done')
+    
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+
+def _percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class JobExecutor:
+    """Bounded thread pool for slow workflow steps (scraping, LLM calls)
+
+    Submitters get a job id straight away and collect the outcome later with
+    pop_result, so a chat turn never waits on the network.
+    """
+    
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='workflow-job')
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self._run_times = deque(maxlen=LATENCY_SAMPLES)
+        self._counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'expired': 0}
+    
+    def submit(self, fn: Callable, *args, kind: str = 'job', **kwargs) -> str:
+        """Queue fn(*args, **kwargs) and return its job id; raises JobQueueFull when saturated"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} jobs)")
+        
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._counts['submitted'] += 1
+        try:
+            self._pool.submit(self._run, job, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._slots.release()
+            raise
+        return job.id
+    
+    def _run(self, job: Job, fn: Callable, args, kwargs) -> None:
+        job.started_at = time.time()
+        job.status = 'running'
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            print(f"Background job {job.kind} failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._counts['completed' if job.status == 'done' else 'failed'] += 1
+                self._wait_times.append(job.started_at - job.submitted_at)
+                self._run_times.append(job.finished_at - job.started_at)
+                self._expire_locked(job.finished_at)
+            self._slots.release()
+            job.done.set()
+    
+    def _expire_locked(self, now: float) -> None:
+        """Forget finished jobs whose results were never collected"""
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._counts['expired'] += len(expired)
+    
+    def status(self, job_id: str) -> Optional[str]:
+        """Return queued/running/done/failed, or None for an unknown job"""
+        job = self._jobs.get(job_id)
+        return job.status if job else None
+    
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; returns False on timeout or unknown job"""
+        job = self._jobs.get(job_id)
+        return bool(job and job.done.wait(timeout))
+    
+    def pop_result(self, job_id: str) -> Optional[Dict]:
+        """Return and forget a finished job's outcome; None while it is still pending
+        
+        Unknown ids (expired, or lost with a restart) come back with status 'lost'.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {'id': job_id, 'status': 'lost', 'result': None, 'error': 'Job not found'}
+            if not job.done.is_set():
+                return None
+            del self._jobs[job_id]
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'result': job.result,
+            'error': job.error,
+            'wait_seconds': job.started_at - job.submitted_at,
+            'run_seconds': job.finished_at - job.started_at
+        }
+    
+    def stats(self) -> Dict:
+        """Queue depth, throughput counters and latency percentiles in milliseconds"""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            stats = dict(self._counts)
+        stats.update({
+            'workers': self.workers,
+            'capacity': self.queue_size,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'uncollected': statuses.count('done') + statuses.count('failed'),
+            'wait_ms_p50': round(_percentile(wait_times, 50) * 1000, 1),
+            'wait_ms_p95': round(_percentile(wait_times, 95) * 1000, 1),
+            'run_ms_p50': round(_percentile(run_times, 50) * 1000, 1),
+            'run_ms_p95': round(_percentile(run_times, 95) * 1000, 1)
+        })
+        stats['queue_depth'] = stats['queued'] + stats['running']
+        return stats
+    
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+job_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor() -> JobExecutor:
+    """Return the shared executor, creating it on first use"""
+    global job_executor
+    if job_executor is None:
+        with _executor_lock:
+            if job_executor is None:
+                job_executor = JobExecutor()
+    return job_executor
+
+
+def get_job_stats() -> Dict:
+    return get_job_executor().stats()
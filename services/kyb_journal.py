@@ -0,0 +1,333 @@
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FSYNC_EVERY = int(os.getenv('KYB_FSYNC_EVERY', '16'))
+FSYNC_INTERVAL = float(os.getenv('KYB_FSYNC_INTERVAL', '1.0'))
+COMPACT_AFTER = int(os.getenv('KYB_COMPACT_AFTER', '200'))
+MAX_CACHED_DOCUMENTS = 256
+
+# Snapshot key recording the last journal record folded into it
+SEQ_KEY = '_journal_seq'
+
+
+def journal_path(snapshot_path: str) -> str:
+    """Return the JSON Lines journal that sits next to a snapshot (kyb_x.json -> kyb_x.jsonl)"""
+    return snapshot_path + 'l'
+
+
+def diff_documents(old: Dict, new: Dict, path: Optional[List[str]] = None) -> List[Dict]:
+    """Describe how to turn old into new as set/extend/delete operations
+
+    Lists that only grew are recorded as an extend with the new tail, so a
+    step that appends one answer produces one small operation.
+    """
+    path = path or []
+    ops = []
+    for key, value in new.items():
+        key_path = path + [key]
+        if key not in old:
+            ops.append({'op': 'set', 'path': key_path, 'value': value})
+            continue
+        previous = old[key]
+        if isinstance(previous, dict) and isinstance(value, dict):
+            ops.extend(diff_documents(previous, value, key_path))
+        elif isinstance(previous, list) and isinstance(value, list) \
+                and len(value) >= len(previous) and value[:len(previous)] == previous:
+            if len(value) > len(previous):
+                ops.append({'op': 'extend', 'path': key_path, 'value': value[len(previous):]})
+        elif previous != value:
+            ops.append({'op': 'set', 'path': key_path, 'value': value})
+    for key in old:
+        if key not in new:
+            ops.append({'op': 'delete', 'path': path + [key]})
+    return ops
+
+
+def apply_ops(document: Dict, ops: List[Dict]) -> Dict:
+    """Apply journal operations to a document in place"""
+    for op in ops:
+        *parents, key = op['path']
+        target = document
+        for part in parents:
+            target = target.setdefault(part, {})
+        if op['op'] == 'set':
+            target[key] = op['value']
+        elif op['op'] == 'extend':
+            target.setdefault(key, []).extend(op['value'])
+        elif op['op'] == 'delete':
+            target.pop(key, None)
+    return document
+
+
+class KYBJournal:
+    """Append-only KYB storage: a JSON snapshot plus a JSON Lines tail of deltas
+
+    Each update appends one compact record, so write cost does not grow with
+    the document. fsync is batched across records, and once the tail gets long
+    it is folded back into the snapshot.
+
+    Several processes may write the same document (the bulk CLI next to
+    Streamlit workers). Writers hold an exclusive flock on the journal while
+    they read any records other processes appended since their last write and
+    take the next seq from the file, so no two records share a seq.
+    """
+
+    def __init__(self, fsync_every: int = FSYNC_EVERY, fsync_interval: float = FSYNC_INTERVAL,
+                 compact_after: int = COMPACT_AFTER):
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self._locks: Dict[str, threading.RLock] = {}
+        self._locks_guard = threading.Lock()
+        self._documents: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._seq: Dict[str, int] = {}
+        self._tail_records: Dict[str, int] = {}
+        # Journal bytes already applied to the cached document, and the snapshot file they follow
+        self._offsets: Dict[str, int] = {}
+        self._snapshot_ids: Dict[str, tuple] = {}
+        self._torn: Dict[str, bool] = {}
+        self._unsynced: Dict[str, int] = {}
+        self._last_fsync: Dict[str, float] = {}
+
+    def lock(self, snapshot_path: str) -> threading.RLock:
+        """Return the lock that serializes writers of one KYB document within this process"""
+        with self._locks_guard:
+            return self._locks.setdefault(os.path.abspath(snapshot_path), threading.RLock())
+
+    def create(self, snapshot_path: str, document: Dict) -> None:
+        """Write a new document as a snapshot with an empty journal"""
+        with self.lock(snapshot_path):
+            self._write_snapshot(snapshot_path, document, seq=0)
+            with open(journal_path(snapshot_path), 'w'):
+                pass
+            self._remember(snapshot_path, copy.deepcopy(document), seq=0, tail_records=0)
+
+    def load(self, snapshot_path: str) -> Optional[Dict]:
+        """Rebuild the current document from the snapshot plus the journal tail"""
+        with self.lock(snapshot_path):
+            document = self._current(snapshot_path)
+            return copy.deepcopy(document) if document is not None else None
+
+    def read(self, snapshot_path: str, reader: Callable[[Dict], Any]) -> Any:
+        """Return reader(document) for the live cached document, without copying it
+
+        reader runs under the document lock and must neither modify the
+        document nor keep a reference to it. Returns None if there is no document.
+        """
+        with self.lock(snapshot_path):
+            document = self._current(snapshot_path)
+            return reader(document) if document is not None else None
+
+    def append(self, snapshot_path: str, ops: List[Dict]) -> None:
+        """Append one delta record and apply it to the cached document"""
+        if not ops:
+            return
+        with self._locked_journal(snapshot_path) as f:
+            self._append_locked(snapshot_path, f, ops)
+
+    def update(self, snapshot_path: str, changes: Dict) -> None:
+        """Record new values for top-level fields, journaling only what changed"""
+        with self._locked_journal(snapshot_path) as f:
+            document = self._documents[snapshot_path]
+            current = {key: document[key] for key in changes if key in document}
+            ops = diff_documents(current, changes)
+            if ops:
+                self._append_locked(snapshot_path, f, ops)
+
+    def compact(self, snapshot_path: str) -> None:
+        """Fold the journal tail into a fresh snapshot and truncate the journal"""
+        try:
+            with self._locked_journal(snapshot_path) as f:
+                self._compact_locked(snapshot_path, f)
+        except FileNotFoundError:
+            return
+
+    def flush(self) -> None:
+        """fsync every journal with records that have not reached the disk yet"""
+        for snapshot_path in list(self._unsynced):
+            with self.lock(snapshot_path):
+                if self._unsynced.pop(snapshot_path, 0) and os.path.exists(journal_path(snapshot_path)):
+                    with open(journal_path(snapshot_path), 'a') as f:
+                        os.fsync(f.fileno())
+                    self._last_fsync[snapshot_path] = time.monotonic()
+
+    @contextmanager
+    def _locked_journal(self, snapshot_path: str) -> Iterator[BinaryIO]:
+        """Lock the document for this process and the journal for every other one, then catch up
+
+        Yields the journal opened for appending; the cached document is current
+        with everything written to it so far.
+        """
+        with self.lock(snapshot_path):
+            if self._current(snapshot_path) is None:
+                raise FileNotFoundError(snapshot_path)
+            with open(journal_path(snapshot_path), 'a+b') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                self._catch_up(snapshot_path, f)
+                yield f
+
+    def _catch_up(self, snapshot_path: str, f: BinaryIO) -> None:
+        """Apply records other processes wrote since this one last read the journal"""
+        if self._snapshot_id(snapshot_path) != self._snapshot_ids.get(snapshot_path):
+            # Another process compacted the document; its snapshot already holds our records
+            self._forget(snapshot_path)
+            if self._current(snapshot_path) is None:
+                raise FileNotFoundError(snapshot_path)
+            return
+        f.seek(0, os.SEEK_END)
+        if f.tell() < self._offsets[snapshot_path]:
+            self._forget(snapshot_path)
+            self._current(snapshot_path)
+            return
+        f.seek(self._offsets[snapshot_path])
+        seq, applied, offset, torn = _replay(f, self._documents[snapshot_path], self._seq[snapshot_path])
+        self._seq[snapshot_path] = seq
+        self._tail_records[snapshot_path] += applied
+        self._offsets[snapshot_path] = offset
+        self._torn[snapshot_path] = torn
+
+    def _append_locked(self, snapshot_path: str, f: BinaryIO, ops: List[Dict]) -> None:
+        seq = self._seq[snapshot_path] + 1
+        line = json.dumps({'seq': seq, 'ts': datetime.now().isoformat(), 'ops': ops},
+                          separators=(',', ':'), default=str)
+        self._write_record(snapshot_path, f, line)
+
+        # Apply the serialized copy so the cache never aliases caller objects
+        apply_ops(self._documents[snapshot_path], json.loads(line)['ops'])
+        self._seq[snapshot_path] = seq
+        self._tail_records[snapshot_path] += 1
+        if self._tail_records[snapshot_path] >= self.compact_after:
+            self._compact_locked(snapshot_path, f)
+
+    def _compact_locked(self, snapshot_path: str, f: BinaryIO) -> None:
+        self._write_snapshot(snapshot_path, self._documents[snapshot_path], seq=self._seq[snapshot_path])
+        # A crash here leaves records the snapshot already covers; replay skips them by seq
+        f.truncate(0)
+        self._tail_records[snapshot_path] = 0
+        self._offsets[snapshot_path] = 0
+        self._torn[snapshot_path] = False
+        self._snapshot_ids[snapshot_path] = self._snapshot_id(snapshot_path)
+        self._unsynced.pop(snapshot_path, None)
+
+    def _write_record(self, snapshot_path: str, f: BinaryIO, line: str) -> None:
+        # End a line torn by a crashed writer, so replay skips it rather than this record
+        prefix = b'\n' if self._torn.get(snapshot_path) else b''
+        f.write(prefix + line.encode('utf-8') + b'\n')
+        f.flush()
+        self._offsets[snapshot_path] = f.tell()
+        self._torn[snapshot_path] = False
+        unsynced = self._unsynced.get(snapshot_path, 0) + 1
+        last_fsync = self._last_fsync.get(snapshot_path, 0.0)
+        if unsynced >= self.fsync_every or time.monotonic() - last_fsync >= self.fsync_interval:
+            os.fsync(f.fileno())
+            self._last_fsync[snapshot_path] = time.monotonic()
+            unsynced = 0
+        self._unsynced[snapshot_path] = unsynced
+
+    def _write_snapshot(self, snapshot_path: str, document: Dict, seq: int) -> None:
+        data = dict(document)
+        data[SEQ_KEY] = seq
+        tmp_path = snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+    @staticmethod
+    def _snapshot_id(snapshot_path: str) -> Optional[tuple]:
+        try:
+            return _file_id(os.stat(snapshot_path))
+        except FileNotFoundError:
+            return None
+
+    def _current(self, snapshot_path: str) -> Optional[Dict]:
+        """Return the cached live document, reading it from disk on a cache miss"""
+        document = self._documents.get(snapshot_path)
+        if document is not None:
+            self._documents.move_to_end(snapshot_path)
+            return document
+
+        try:
+            with open(snapshot_path, 'r') as f:
+                snapshot_id = _file_id(os.fstat(f.fileno()))
+                document = json.load(f)
+        except FileNotFoundError:
+            return None
+        seq = document.pop(SEQ_KEY, 0)
+        tail_records, offset, torn = 0, 0, False
+        if os.path.exists(journal_path(snapshot_path)):
+            with open(journal_path(snapshot_path), 'rb') as f:
+                seq, tail_records, offset, torn = _replay(f, document, seq)
+        self._remember(snapshot_path, document, seq, tail_records)
+        self._offsets[snapshot_path] = offset
+        self._snapshot_ids[snapshot_path] = snapshot_id
+        self._torn[snapshot_path] = torn
+        return document
+
+    def _remember(self, snapshot_path: str, document: Dict, seq: int, tail_records: int) -> None:
+        self._documents[snapshot_path] = document
+        self._documents.move_to_end(snapshot_path)
+        self._seq[snapshot_path] = seq
+        self._tail_records[snapshot_path] = tail_records
+        self._offsets[snapshot_path] = 0
+        self._snapshot_ids[snapshot_path] = self._snapshot_id(snapshot_path)
+        self._torn[snapshot_path] = False
+        while len(self._documents) > MAX_CACHED_DOCUMENTS:
+            evicted, _ = self._documents.popitem(last=False)
+            self._forget(evicted)
+
+    def _forget(self, snapshot_path: str) -> None:
+        self._documents.pop(snapshot_path, None)
+        for state in (self._seq, self._tail_records, self._offsets, self._snapshot_ids, self._torn):
+            state.pop(snapshot_path, None)
+
+
+def _file_id(stat: os.stat_result) -> tuple:
+    """Identity of a snapshot file; compaction replaces the file, so this changes with it"""
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _replay(f: BinaryIO, document: Dict, seq: int) -> Tuple[int, int, int, bool]:
+    """Apply the journal records after seq from f's position to document
+
+    Returns (last seq, records applied, offset after the last complete line,
+    whether a torn final line follows it).
+    """
+    applied = 0
+    offset = f.tell()
+    while True:
+        line = f.readline()
+        if not line:
+            return seq, applied, offset, False
+        if not line.endswith(b'\n'):
+            return seq, applied, offset, True  # torn final write
+        offset = f.tell()
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # a torn line that a later writer terminated
+        if record['seq'] <= seq:
+            continue
+        apply_ops(document, record['ops'])
+        seq = record['seq']
+        applied += 1
+
+
+# Shared journal for the process, so every writer sees the same cached documents and locks
+kyb_journal = KYBJournal()
+atexit.register(kyb_journal.flush)
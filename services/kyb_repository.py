@@ -0,0 +1,249 @@
+import glob
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from services.kyb_journal import KYBJournal, kyb_journal
+from services.kyb_rules import COMPLETION_RULES
+from services.tracing import traced
+
+KYB_DIR = "kyb_files"
+KYB_INDEX_PATH = os.getenv('KYB_INDEX_PATH', os.path.join(KYB_DIR, 'kyb_index.db'))
+
+_COLUMNS = ['filepath', 'session_id', 'business', 'workflow_step', 'completeness_score',
+            'status', 'created_at', 'updated_at']
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def _completeness(document: Dict) -> float:
+    """Completeness of a document: the share of COMPLETION_RULES met, plus the summary step 8 writes"""
+    if 'completeness_score' in document:
+        return float(document.get('completeness_score') or 0.0)
+    kyb_data = document.get('kyb_data') or {}
+    checks = [len(kyb_data.get(rule['category'], [])) >= rule['minimum'] for rule in COMPLETION_RULES]
+    checks.append(bool(kyb_data.get('summary')))
+    return sum(checks) / len(checks)
+
+
+def index_fields(filepath: str, document: Dict) -> Dict:
+    """Pull the indexed columns out of either KYB document layout"""
+    business = document.get('business')
+    if not business:
+        business = (document.get('business_info') or {}).get('what_they_sell', '')
+    return {
+        'filepath': os.path.abspath(filepath),
+        'session_id': document.get('session_id', ''),
+        'business': business or '',
+        'workflow_step': document.get('workflow_step'),
+        'completeness_score': _completeness(document),
+        'status': document.get('status', 'active')
+    }
+
+
+class KYBRepository:
+    """Index KYB documents in SQLite so sessions can be listed, searched and aggregated
+
+    The documents themselves stay in the journaled kyb_files store; every
+    write also upserts one small index row.
+    """
+
+    def __init__(self, db_path: str = KYB_INDEX_PATH, journal: Optional[KYBJournal] = None):
+        self.db_path = db_path
+        self.journal = journal or kyb_journal
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS kyb_sessions (
+                filepath TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                business TEXT,
+                workflow_step INTEGER,
+                completeness_score REAL,
+                status TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS kyb_sessions_session_id ON kyb_sessions (session_id);
+            CREATE INDEX IF NOT EXISTS kyb_sessions_business ON kyb_sessions (business COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS kyb_sessions_workflow_step ON kyb_sessions (workflow_step);
+            CREATE INDEX IF NOT EXISTS kyb_sessions_completeness ON kyb_sessions (completeness_score);
+            CREATE INDEX IF NOT EXISTS kyb_sessions_updated_at ON kyb_sessions (updated_at);
+        ''')
+
+    # Writes
+
+    @traced('kyb.create')
+    def create(self, filepath: str, document: Dict) -> None:
+        """Store a new KYB document and index it"""
+        self.journal.create(filepath, document)
+        self._upsert(filepath, document)
+
+    @traced('kyb.update')
+    def update(self, filepath: str, changes: Dict) -> None:
+        """Record new values for top-level fields and refresh the index row"""
+        with self.journal.lock(filepath):
+            self.journal.update(filepath, changes)
+            self._reindex(filepath)
+
+    @traced('kyb.append')
+    def append(self, filepath: str, ops: List[Dict], document: Optional[Dict] = None) -> None:
+        """Append journal operations; pass the resulting document to index it directly"""
+        with self.journal.lock(filepath):
+            self.journal.append(filepath, ops)
+            if document is not None:
+                self._upsert(filepath, document)
+            else:
+                self._reindex(filepath)
+
+    _UPSERT_SQL = (
+        'INSERT INTO kyb_sessions (filepath, session_id, business, workflow_step, completeness_score, '
+        'status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(filepath) DO UPDATE SET session_id = excluded.session_id, '
+        'business = excluded.business, workflow_step = excluded.workflow_step, '
+        'completeness_score = excluded.completeness_score, status = excluded.status, '
+        'updated_at = excluded.updated_at'
+    )
+
+    def _row_values(self, filepath: str, document: Dict, timestamp: Optional[str] = None) -> tuple:
+        row = index_fields(filepath, document)
+        now = timestamp or datetime.now().isoformat()
+        return (row['filepath'], row['session_id'], row['business'], row['workflow_step'],
+                row['completeness_score'], row['status'], now, now)
+
+    def _upsert(self, filepath: str, document: Dict) -> None:
+        self._write_row(self._row_values(filepath, document))
+
+    def _reindex(self, filepath: str) -> None:
+        """Refresh the index row from the journal's cached document, read in place rather than copied"""
+        self._write_row(self.journal.read(filepath, lambda document: self._row_values(filepath, document)))
+
+    def _write_row(self, values: tuple) -> None:
+        with self._lock:
+            self._conn.execute(self._UPSERT_SQL, values)
+
+    # Reads
+
+    @traced('kyb.load')
+    def load(self, filepath: str) -> Optional[Dict]:
+        """Return the current KYB document"""
+        return self.journal.load(filepath)
+
+    def get_by_session(self, session_id: str) -> Optional[Dict]:
+        """Return the most recently updated document for a session"""
+        rows = self.list_sessions(session_id=session_id, limit=1)
+        return self.load(rows[0]['filepath']) if rows else None
+
+    def list_sessions(self, session_id: Optional[str] = None, business: Optional[str] = None,
+                      workflow_step: Optional[int] = None, min_completeness: Optional[float] = None,
+                      updated_after: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """List indexed sessions, newest first; business matches as a case-insensitive substring"""
+        clauses, params = [], []
+        if session_id is not None:
+            clauses.append('session_id = ?')
+            params.append(session_id)
+        if business is not None:
+            clauses.append('business LIKE ? COLLATE NOCASE')
+            params.append(f"%{business}%")
+        if workflow_step is not None:
+            clauses.append('workflow_step = ?')
+            params.append(workflow_step)
+        if min_completeness is not None:
+            clauses.append('completeness_score >= ?')
+            params.append(min_completeness)
+        if updated_after is not None:
+            clauses.append('updated_at > ?')
+            params.append(updated_after)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM kyb_sessions {where} "
+                'ORDER BY updated_at DESC LIMIT ? OFFSET ?', params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def analytics(self) -> Dict:
+        """Aggregate session counts and completeness across the whole index"""
+        with self._lock:
+            totals = self._conn.execute(
+                'SELECT COUNT(*) AS sessions, AVG(completeness_score) AS avg_completeness, '
+                'SUM(completeness_score >= 0.8) AS complete FROM kyb_sessions'
+            ).fetchone()
+            by_step = self._conn.execute(
+                'SELECT workflow_step, COUNT(*) AS sessions FROM kyb_sessions GROUP BY workflow_step'
+            ).fetchall()
+        return {
+            'sessions': totals['sessions'],
+            'complete_sessions': totals['complete'] or 0,
+            'avg_completeness': totals['avg_completeness'] or 0.0,
+            'sessions_by_step': {row['workflow_step']: row['sessions'] for row in by_step}
+        }
+
+    def export(self, **filters) -> List[Dict]:
+        """Return full documents for the sessions matching list_sessions filters"""
+        return [self.load(row['filepath']) for row in self.list_sessions(**filters)]
+
+    # Maintenance
+
+    def import_json_files(self, kyb_dir: str = KYB_DIR, batch_size: int = 1000) -> int:
+        """Index every existing kyb_*.json file in a directory; returns how many were imported"""
+        count = 0
+        batch = []
+        for filepath in sorted(glob.glob(os.path.join(kyb_dir, 'kyb_*.json'))):
+            try:
+                document = self.journal.load(filepath)
+            except Exception as e:
+                print(f"Skipping unreadable KYB file {filepath}: {e}")
+                continue
+            if document is None:
+                continue
+            modified = datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
+            batch.append(self._row_values(filepath, document, timestamp=modified))
+            if len(batch) >= batch_size:
+                count += self._write_batch(batch)
+                batch = []
+        if batch:
+            count += self._write_batch(batch)
+        return count
+
+    def _write_batch(self, rows: List[tuple]) -> int:
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(self._UPSERT_SQL, rows)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+
+def get_kyb_repository() -> KYBRepository:
+    """Return the shared KYB repository, creating it on first use"""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = KYBRepository()
+    return _repository
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import existing KYB JSON files into the index")
+    parser.add_argument('kyb_dir', nargs='?', default=KYB_DIR)
+    args = parser.parse_args()
+
+    imported = get_kyb_repository().import_json_files(args.kyb_dir)
+    print(f"Imported {imported} KYB file(s) into {KYB_INDEX_PATH}")
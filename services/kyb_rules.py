@@ -0,0 +1,7 @@
+# Minimum entries per kyb_data category before a profile counts as complete (workflow step 8);
+# the KYB repository scores completeness against the same rules
+COMPLETION_RULES = [
+    {'category': 'business_understanding', 'minimum': 2, 'label': 'Business Details'},
+    {'category': 'objectives', 'minimum': 2, 'label': 'Objectives'},
+    {'category': 'constraints', 'minimum': 2, 'label': 'Challenges'}
+]
@@ -1,15 +1,21 @@
-import json
 import os
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Optional
+from services.kyb_journal import apply_ops
+from services.kyb_repository import KYB_DIR, KYBRepository, get_kyb_repository
+from services.summary_service import summary_ops
 
 class KYBManager:
     """Manage Know Your Business (KYB) files and workflow"""
     
-    def __init__(self, kyb_dir: str = "kyb_files"):
+    def __init__(self, kyb_dir: str = KYB_DIR, repository: Optional[KYBRepository] = None):
         self.kyb_dir = kyb_dir
         if not os.path.exists(kyb_dir):
             os.makedirs(kyb_dir)
+        if repository is None:
+            repository = get_kyb_repository() if kyb_dir == KYB_DIR else \
+                KYBRepository(os.path.join(kyb_dir, 'kyb_index.db'))
+        self.repository = repository
     
     def create_kyb_file(self, session_id: str, business_info: Dict) -> str:
         """Create a new KYB file for a session"""
@@ -32,50 +38,57 @@ class KYBManager:
         filename = f"kyb_{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         filepath = os.path.join(self.kyb_dir, filename)
         
-        with open(filepath, 'w') as f:
-            json.dump(kyb_data, f, indent=2)
+        self.repository.create(filepath, kyb_data)
         
         return filepath
     
     def update_kyb_file(self, filepath: str, new_data: Dict) -> Dict:
         """Update existing KYB file with new information"""
-        with open(filepath, 'r') as f:
-            kyb_data = json.load(f)
-        
-        # Update timestamp
-        kyb_data["updated_at"] = datetime.now().isoformat()
-        
-        # Merge new knowledge
-        if "knowledge_extracted" in new_data:
-            for key, value in new_data["knowledge_extracted"].items():
-                if key in kyb_data["knowledge_extracted"] and isinstance(value, list):
-                    kyb_data["knowledge_extracted"][key].extend(value)
-                else:
-                    kyb_data["knowledge_extracted"][key] = value
-        
-        # Add conversation history
-        if "conversation_entry" in new_data:
-            kyb_data["conversation_history"].append(new_data["conversation_entry"])
-        
-        # Update completeness score
-        kyb_data["completeness_score"] = self._calculate_completeness(kyb_data)
-        
-        with open(filepath, 'w') as f:
-            json.dump(kyb_data, f, indent=2)
+        with self.repository.journal.lock(filepath):
+            kyb_data = self.repository.load(filepath)
+            if kyb_data is None:
+                raise FileNotFoundError(filepath)
+            
+            # Update timestamp
+            ops = [{'op': 'set', 'path': ['updated_at'], 'value': datetime.now().isoformat()}]
+            
+            # Merge new knowledge
+            if "knowledge_extracted" in new_data:
+                for key, value in new_data["knowledge_extracted"].items():
+                    if key in kyb_data["knowledge_extracted"] and isinstance(value, list):
+                        ops.append({'op': 'extend', 'path': ['knowledge_extracted', key], 'value': value})
+                    else:
+                        ops.append({'op': 'set', 'path': ['knowledge_extracted', key], 'value': value})
+            
+            # Add conversation history
+            if "conversation_entry" in new_data:
+                ops.append({'op': 'extend', 'path': ['conversation_history'], 'value': [new_data["conversation_entry"]]})
+            
+            apply_ops(kyb_data, ops)
+            
+            # Fold old turns into the running summary so the file stays bounded
+            fold_ops = summary_ops(kyb_data)
+            if fold_ops:
+                apply_ops(kyb_data, fold_ops)
+                ops.extend(fold_ops)
+            
+            # Update completeness score
+            kyb_data["completeness_score"] = self._calculate_completeness(kyb_data)
+            ops.append({'op': 'set', 'path': ['completeness_score'], 'value': kyb_data["completeness_score"]})
+            
+            self.repository.append(filepath, ops, document=kyb_data)
         
         return kyb_data
     
     def is_kyb_full(self, filepath: str, threshold: float = 0.8) -> bool:
         """Check if KYB file has sufficient information"""
-        with open(filepath, 'r') as f:
-            kyb_data = json.load(f)
+        kyb_data = self.repository.load(filepath)
         
         return kyb_data.get("completeness_score", 0.0) >= threshold
     
     def summarize_kyb(self, filepath: str) -> Dict:
         """Create a summary of the KYB file"""
-        with open(filepath, 'r') as f:
-            kyb_data = json.load(f)
+        kyb_data = self.repository.load(filepath)
         
         summary = {
             "business_overview": kyb_data["business_info"],
@@ -83,7 +96,8 @@ class KYBManager:
             "main_objectives": kyb_data["knowledge_extracted"]["objectives"],
             "constraints": kyb_data["knowledge_extracted"]["constraints"],
             "completeness": kyb_data["completeness_score"],
-            "total_conversations": len(kyb_data["conversation_history"])
+            "conversation_summary": kyb_data.get("conversation_summary", ""),
+            "total_conversations": len(kyb_data["conversation_history"]) + kyb_data.get("summarized_turns", 0)
         }
         
         return summary
@@ -118,6 +132,5 @@ class KYBManager:
     def get_kyb_data(self, filepath: str) -> Dict:
         """Get KYB data from file"""
         if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                return json.load(f)
+            return self.repository.load(filepath)
         return None
\ No newline at end of file
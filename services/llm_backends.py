@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional
+
+# Which backend gemini_service builds its models with: gemini, record, replay or synthetic
+LLM_BACKEND = os.getenv('GEMINI_BACKEND', 'gemini')
+RECORDING_PATH = os.getenv('GEMINI_RECORDING_PATH', os.path.join('cache_files', 'gemini_recording.jsonl'))
+
+# Replay/synthetic behaviour
+SYNTHETIC_LATENCY = float(os.getenv('GEMINI_SYNTHETIC_LATENCY', '0'))
+SYNTHETIC_JITTER = float(os.getenv('GEMINI_SYNTHETIC_JITTER', '0'))
+SYNTHETIC_FAILURE_RATE = float(os.getenv('GEMINI_SYNTHETIC_FAILURE_RATE', '0'))
+SYNTHETIC_SEED = os.getenv('GEMINI_SYNTHETIC_SEED', '0')
+STREAM_CHUNK_CHARS = 24
+
+_USER_LINE = re.compile(r'^User:\s*(.+)$', re.MULTILINE)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class TextResponse:
+    """Minimal stand-in for a Gemini response or stream chunk"""
+    
+    __slots__ = ('text',)
+    
+    def __init__(self, text: str):
+        self.text = text
+
+
+class PromptRecording:
+    """Prompt -> response pairs in a JSON Lines file, loaded once and appended to"""
+    
+    def __init__(self, path: str = RECORDING_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._responses[entry['key']] = entry['response']
+                    except (ValueError, KeyError):
+                        continue
+    
+    def get(self, prompt: str) -> Optional[str]:
+        return self._responses.get(prompt_key(prompt))
+    
+    def put(self, prompt: str, response: str, model_name: str = '') -> None:
+        entry = {'key': prompt_key(prompt), 'model': model_name, 'recorded_at': datetime.now().isoformat(),
+                 'prompt': prompt, 'response': response}
+        with self._lock:
+            self._responses[entry['key']] = response
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    
+    def __len__(self) -> int:
+        return len(self._responses)
+
+
+class RecordingModel:
+    """Wraps a real model and saves every prompt and its full reply"""
+    
+    def __init__(self, model, recording: PromptRecording, model_name: str = ''):
+        self.model = model
+        self.recording = recording
+        self.model_name = model_name
+    
+    def generate_content(self, prompt, stream=False):
+        if not stream:
+            response = self.model.generate_content(prompt)
+            self.recording.put(prompt, response.text, self.model_name)
+            return response
+        return self._record_stream(prompt, self.model.generate_content(prompt, stream=True))
+    
+    def _record_stream(self, prompt: str, chunks) -> Iterator:
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.text)
+            yield chunk
+        self.recording.put(prompt, ''.join(parts), self.model_name)
+
+
+class SyntheticFailure(Exception):
+    """A simulated outage, carrying its status code the way google.api_core errors do"""
+    code = 503
+
+
+class ReplayModel:
+    """Answers from a recording, or synthesizes a deterministic reply, with simulated latency and failures
+    
+    Latency and failures are drawn from a generator seeded by the prompt and how
+    often it has been asked, so a run can be repeated exactly.
+    """
+    
+    def __init__(self, recording: Optional[PromptRecording] = None, latency: float = SYNTHETIC_LATENCY,
+                 jitter: float = SYNTHETIC_JITTER, failure_rate: float = SYNTHETIC_FAILURE_RATE,
+                 seed: str = SYNTHETIC_SEED, synthesize_missing: bool = True, model_name: str = 'synthetic'):
+        self.recording = recording
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.synthesize_missing = synthesize_missing
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._asked: Dict[str, int] = {}
+        self.calls = 0
+        self.failures = 0
+    
+    def generate_content(self, prompt, stream=False):
+        key = prompt_key(prompt)
+        with self._lock:
+            attempt = self._asked.get(key, 0)
+            self._asked[key] = attempt + 1
+            self.calls += 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        
+        delay = self.latency * (1 + self.jitter * (2 * rng.random() - 1))
+        if delay > 0:
+            time.sleep(delay)
+        if rng.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise SyntheticFailure("503 Synthetic backend failure")
+        
+        text = self.recording.get(prompt) if self.recording is not None else None
+        if text is None:
+            if not self.synthesize_missing:
+                raise Exception(f"No recorded response for prompt {key[:12]}")
+            text = self._synthesize(prompt, key)
+        
+        if stream:
+            return [TextResponse(text[i:i + STREAM_CHUNK_CHARS]) for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        return TextResponse(text)
+    
+    def _synthesize(self, prompt: str, key: str) -> str:
+        """A well-formed reply that echoes the user's turn"""
+        users = _USER_LINE.findall(prompt)
+        topic = ' '.join(users[-1].split())[:80] if users else 'your business'
+        return json.dumps({
+            'response': f"Synthetic analysis of: {topic}",
+            'knowledge_update': {
+                'business_understanding': [f"Mentioned: {topic}"],
+                'objectives': [],
+                'constraints': [],
+                'summary': f"Synthetic reply {key[:8]}"
+            }
+        })
+
+
+def create_model_factory(backend: str = LLM_BACKEND, recording_path: str = RECORDING_PATH,
+                         real_factory: Optional[Callable] = None, **options) -> Callable:
+    """Return a ModelRegistry factory for the named backend
+    
+    options are passed to ReplayModel (latency, jitter, failure_rate, seed).
+    """
+    if backend == 'gemini':
+        return real_factory
+    if backend == 'record':
+        recording = PromptRecording(recording_path)
+        return lambda name: RecordingModel(real_factory(name), recording, name)
+    if backend == 'replay':
+        recording = PromptRecording(recording_path)
+        options.setdefault('synthesize_missing', False)
+        return lambda name: ReplayModel(recording, model_name=name, **options)
+    if backend == 'synthetic':
+        return lambda name: ReplayModel(None, model_name=name, **options)
+    raise Exception(f"Unknown LLM backend: {backend}")
@@ -1,76 +1,383 @@
+import asyncio
+import codecs
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+from urllib.parse import urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, Tag
 import urllib3
+from services.cache_store import PersistentCache
+from services.html_extractor import (PageExtractor, build_page_data, BLOCK_TAGS, MAX_HEADINGS, MAX_LINKS, MAX_LINK_TEXT,
+                                     MAX_PARAGRAPHS)
+from services.text_dedup import ContentDeduper
+from services.url_intake import cache_key, is_scrapeable_url
+from services.tracing import span, tracer
 
 # Disable SSL warnings for problematic sites
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def scrape_url(url):
-    """Scrape business-relevant data from a URL"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        
-        # Add session for better handling
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+REQUEST_TIMEOUT = float(os.getenv('SCRAPER_TIMEOUT', '15'))
+DEFAULT_CONCURRENCY = int(os.getenv('SCRAPER_CONCURRENCY', '8'))
+PER_HOST_LIMIT = int(os.getenv('SCRAPER_PER_HOST_LIMIT', '4'))
+POLITENESS_DELAY = float(os.getenv('SCRAPER_POLITENESS_DELAY', '0.25'))
+POOL_HOSTS = int(os.getenv('SCRAPER_POOL_HOSTS', '32'))
+CHUNK_SIZE = 65536
+MAX_REDIRECTS = 5
+
+# Per-page download budgets: stop reading after this many body bytes or seconds
+MAX_PAGE_BYTES = int(os.getenv('SCRAPER_MAX_BYTES', str(2 * 1024 * 1024)))
+PAGE_DEADLINE = float(os.getenv('SCRAPER_DEADLINE', str(REQUEST_TIMEOUT)))
+
+# 'stream' uses the single-pass PageExtractor, 'soup' the original BeautifulSoup tree walk
+EXTRACTOR = os.getenv('SCRAPER_EXTRACTOR', 'stream')
+
+# On-disk cache of extracted pages, keyed by normalized URL
+SCRAPE_CACHE_ENABLED = os.getenv('SCRAPE_CACHE_ENABLED', '1') == '1'
+SCRAPE_CACHE_PATH = os.getenv('SCRAPE_CACHE_PATH', os.path.join('cache_files', 'scrape_cache.db'))
+SCRAPE_CACHE_TTL = float(os.getenv('SCRAPE_CACHE_TTL', '3600'))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv('SCRAPE_CACHE_MAX_ENTRIES', '500'))
+
+_scrape_cache = None
+# Bumped from the scrape_many worker threads
+_revalidated_count = 0
+_revalidated_lock = threading.Lock()
+
+# One adapter holds the keep-alive connection pools (one per host) for the whole
+# process. Sessions are per-thread because their cookie jars are not thread-safe.
+_adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max(PER_HOST_LIMIT, DEFAULT_CONCURRENCY))
+_thread_local = threading.local()
+
+
+def _get_session() -> requests.Session:
+    """Return this thread's session, wired to the shared connection pool"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
         session = requests.Session()
-        session.headers.update(headers)
-        
-        response = session.get(url, timeout=15, allow_redirects=True, verify=False)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove unwanted elements
-        for tag in soup(['script', 'style', 'nav', 'footer', 'iframe']):
-            tag.decompose()
-        
-        # Extract relevant data with fallbacks
-        title = ''
-        if soup.find('title'):
-            title = soup.find('title').get_text().strip()
-        elif soup.find('h1'):
-            title = soup.find('h1').get_text().strip()
-        
-        # Get headings
-        headings = []
-        for h in soup.find_all(['h1', 'h2', 'h3', 'h4'])[:15]:
-            text = h.get_text().strip()
-            if text and len(text) > 3:
-                headings.append(text)
-        
-        # Get paragraphs and content
-        paragraphs = []
-        for p in soup.find_all(['p', 'div', 'span']):
-            text = p.get_text().strip()
-            if text and len(text) > 30 and len(text) < 500:
-                paragraphs.append(text)
-            if len(paragraphs) >= 15:  # Limit content
+        session.headers.update(DEFAULT_HEADERS)
+        session.mount('http://', _adapter)
+        session.mount('https://', _adapter)
+        _thread_local.session = session
+    return session
+
+
+def _blocks_in_closing_order(soup: BeautifulSoup) -> Iterator[Tag]:
+    """Yield p, div and span elements as their end tags close, innermost first
+
+    This is the order PageExtractor sees them in, so both extractors keep the
+    inner paragraphs and drop the wrappers that only repeat them.
+    """
+    stack = [(soup, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            if node.name in BLOCK_TAGS:
+                yield node
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.contents) if isinstance(child, Tag))
+
+
+def _extract_with_soup(content: bytes) -> Dict:
+    """Extract page data by building a full BeautifulSoup tree"""
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Links first: navigation and footers are dropped below but hold the most useful ones
+    links = [{'href': a['href'].strip(), 'text': ' '.join(a.get_text().split())[:MAX_LINK_TEXT]}
+             for a in soup.find_all('a', href=True)[:MAX_LINKS] if a['href'].strip()]
+    
+    # Remove unwanted elements
+    for tag in soup(['script', 'style', 'nav', 'footer', 'iframe']):
+        tag.decompose()
+    
+    # Extract relevant data with fallbacks
+    title = ''
+    if soup.find('title'):
+        title = soup.find('title').get_text().strip()
+    elif soup.find('h1'):
+        title = soup.find('h1').get_text().strip()
+    
+    # Get headings
+    headings = []
+    for h in soup.find_all(['h1', 'h2', 'h3', 'h4'])[:MAX_HEADINGS]:
+        text = h.get_text().strip()
+        if text and len(text) > 3:
+            headings.append(text)
+    
+    # Get paragraphs and content
+    paragraphs = []
+    deduper = ContentDeduper()
+    for p in _blocks_in_closing_order(soup):
+        text = p.get_text().strip()
+        if text and len(text) > 30 and len(text) < 500 and deduper.add(text):
+            paragraphs.append(text)
+        if len(paragraphs) >= MAX_PARAGRAPHS:  # Limit content
+            break
+    
+    # Get meta description
+    meta_desc = ''
+    meta_tag = soup.find('meta', attrs={'name': 'description'})
+    if not meta_tag:
+        meta_tag = soup.find('meta', attrs={'property': 'og:description'})
+    if meta_tag:
+        meta_desc = meta_tag.get('content', '').strip()
+    
+    return build_page_data(title, meta_desc, headings, paragraphs, links, deduper.duplicates)
+
+
+def _response_encoding(response: requests.Response) -> str:
+    """Use the declared charset, defaulting to UTF-8 rather than sniffing the whole body"""
+    if 'charset' in response.headers.get('Content-Type', '').lower() and response.encoding:
+        return response.encoding
+    return 'utf-8'
+
+
+def _read_socket(response: requests.Response):
+    """The socket the body is read from, via urllib3's public HTTPResponse.connection, or None
+
+    http.client drops the socket of responses that close the connection when
+    they end, and urllib3 releases the connection once the body is done; those
+    reads keep the read timeout set when the request was opened.
+    test_scraper_engine checks this path still reaches the socket.
+    """
+    connection = getattr(response.raw, 'connection', None)
+    return getattr(connection, 'sock', None)
+
+
+def _cap_read_timeout(response: requests.Response, deadline_at: float) -> None:
+    """Let the next socket read wait no longer than the time left before deadline_at"""
+    sock = _read_socket(response)
+    if sock is not None and sock.fileno() != -1:
+        sock.settimeout(min(REQUEST_TIMEOUT, max(deadline_at - time.monotonic(), 0.001)))
+
+
+def _iter_body(response: requests.Response, deadline_at: float) -> Iterator[bytes]:
+    """Yield the body as it arrives; read1 returns whatever the socket has instead of waiting for a full chunk
+
+    Each read may only wait until deadline_at, so a stalled server cannot
+    hold the download for a full request timeout past the deadline.
+    """
+    raw = response.raw
+    if hasattr(raw, 'read1'):
+        while True:
+            _cap_read_timeout(response, deadline_at)
+            chunk = raw.read1(CHUNK_SIZE, decode_content=True)
+            if not chunk:
                 break
+            yield chunk
+    else:
+        yield from response.iter_content(chunk_size=CHUNK_SIZE)
+
+
+def _read_within_budget(response: requests.Response, max_bytes: int, deadline_at: float,
+                        on_chunk: Callable[[bytes], bool]) -> Tuple[int, bool]:
+    """Stream the body into on_chunk until it is done, the body ends, or a budget runs out
+
+    Returns (bytes_read, truncated).
+    """
+    bytes_read = 0
+    try:
+        for chunk in _iter_body(response, deadline_at):
+            if bytes_read + len(chunk) > max_bytes:
+                on_chunk(chunk[:max_bytes - bytes_read])
+                return max_bytes, True
+            bytes_read += len(chunk)
+            if on_chunk(chunk):
+                return bytes_read, False
+            if time.monotonic() >= deadline_at:
+                return bytes_read, True
+    except (urllib3.exceptions.ReadTimeoutError, urllib3.exceptions.ProtocolError, requests.exceptions.RequestException):
+        # The server stalled or dropped mid-body; keep whatever prefix arrived
+        if not bytes_read:
+            raise
+        return bytes_read, True
+    return bytes_read, False
+
+
+def _extract_streaming(response: requests.Response, max_bytes: int, deadline_at: float) -> Tuple[Dict, float]:
+    """Extract page data in a single incremental pass as the body downloads
+
+    Returns (data, parse_seconds); parsing is interleaved with the download, so
+    its time is summed over the chunks.
+    """
+    decoder = codecs.getincrementaldecoder(_response_encoding(response))(errors='replace')
+    extractor = PageExtractor()
+    parse_seconds = 0.0
+
+    def feed(chunk: bytes) -> bool:
+        nonlocal parse_seconds
+        started = time.perf_counter()
+        done = extractor.feed(decoder.decode(chunk))
+        parse_seconds += time.perf_counter() - started
+        return done
+
+    bytes_read, truncated = _read_within_budget(response, max_bytes, deadline_at, feed)
+    started = time.perf_counter()
+    extractor.feed(decoder.decode(b'', final=True))
+    extractor.close()
+    data = extractor.result()
+    parse_seconds += time.perf_counter() - started
+    data['truncated'] = truncated
+    data['bytes_read'] = bytes_read
+    return data, parse_seconds
+
+
+def _extract_buffered(response: requests.Response, max_bytes: int, deadline_at: float) -> Tuple[Dict, float]:
+    """Download up to the budget, then run the BeautifulSoup extraction on that prefix
+
+    Returns (data, parse_seconds).
+    """
+    chunks = []
+    bytes_read, truncated = _read_within_budget(
+        response, max_bytes, deadline_at, lambda chunk: chunks.append(chunk)
+    )
+    started = time.perf_counter()
+    data = _extract_with_soup(b''.join(chunks))
+    parse_seconds = time.perf_counter() - started
+    data['truncated'] = truncated
+    data['bytes_read'] = bytes_read
+    return data, parse_seconds
+
+
+def _open(url: str, deadline_at: float, headers: Dict = None) -> requests.Response:
+    """Start a streaming GET, following redirects by hand so every hop passes the URL intake checks
+
+    A public page could otherwise redirect the scraper to a private or
+    loopback address, such as a cloud metadata endpoint.
+    """
+    session = _get_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        if not is_scrapeable_url(url, resolve=True):
+            raise Exception(f"Refusing to fetch non-public address {url}")
+        timeout = min(REQUEST_TIMEOUT, max(deadline_at - time.monotonic(), 0.001))
+        response = session.get(url, headers=headers, timeout=(timeout, timeout), allow_redirects=False,
+                               verify=False, stream=True)
+        if not response.is_redirect:
+            return response
+        url = urljoin(response.url, response.headers['Location'])
+        response.close()
+    raise Exception(f"Too many redirects for {url}")
+
+
+def fetch_text(url: str, max_bytes: int = 256 * 1024, deadline: float = 5.0) -> str:
+    """Download a small text resource such as sitemap.xml within a byte and time budget; raises on HTTP errors"""
+    deadline_at = time.monotonic() + deadline
+    chunks = []
+    with _open(url, deadline_at) as response:
+        response.raise_for_status()
+        _read_within_budget(response, max_bytes, deadline_at, chunks.append)
+        encoding = _response_encoding(response)
+    return b''.join(chunks).decode(encoding, errors='replace')
+
+
+def normalize_url(url: str) -> str:
+    """Cache key for a URL: its canonical form, so equivalent links share one entry"""
+    return cache_key(url)
+
+
+def get_scrape_cache() -> PersistentCache:
+    """Return the on-disk scrape cache, creating it on first use"""
+    global _scrape_cache
+    if _scrape_cache is None:
+        _scrape_cache = PersistentCache(SCRAPE_CACHE_PATH, table='pages', ttl=SCRAPE_CACHE_TTL,
+                                        max_entries=SCRAPE_CACHE_MAX_ENTRIES)
+    return _scrape_cache
+
+
+def get_scrape_cache_stats() -> Dict:
+    """Return scrape cache counters; revalidated pages count as hits"""
+    stats = get_scrape_cache().stats()
+    with _revalidated_lock:
+        stats['revalidated'] = _revalidated_count
+    lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+    stats['hit_rate'] = (stats['hits'] + stats['revalidated']) / lookups if lookups else 0.0
+    return stats
+
+
+def _conditional_headers(entry: Dict) -> Dict:
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def scrape_url(url, extractor=None, max_bytes=None, deadline=None, use_cache=True):
+    """Scrape business-relevant data from a URL
+
+    The download stops after max_bytes of body or deadline seconds in total,
+    whichever comes first; the page is then extracted from the prefix that
+    arrived and the result is marked as truncated.
+
+    Complete results are cached on disk by normalized URL; truncated ones
+    are not, since they depend on the budget. Fresh entries are returned
+    without touching the network; stale ones are revalidated with a
+    conditional GET, and a 304 reuses the cached extraction without parsing.
+    """
+    max_bytes = max_bytes or MAX_PAGE_BYTES
+    deadline = deadline or PAGE_DEADLINE
+    deadline_at = time.monotonic() + deadline
+
+    with span('scrape.url') as scrape_span:
+        data = _scrape(url, extractor, max_bytes, deadline_at, use_cache)
+        from_cache = data.get('from_cache', False)
+        scrape_span.set(bytes=0 if from_cache else data.get('bytes_read', 0), from_cache=from_cache)
+    return data
+
+
+def _scrape(url, extractor, max_bytes, deadline_at, use_cache):
+    """scrape_url without the tracing span"""
+    global _revalidated_count
+    cache = get_scrape_cache() if use_cache and SCRAPE_CACHE_ENABLED else None
+    cache_key = normalize_url(url)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached and cached[1]:
+        return dict(cached[0]['data'], from_cache=True)
+
+    fetch_started = time.perf_counter()
+    try:
+        headers = _conditional_headers(cached[0]) if cached else {}
+        with _open(url, deadline_at, headers) as response:
+            if response.status_code == 304 and cached:
+                cache.touch(cache_key)
+                with _revalidated_lock:
+                    _revalidated_count += 1
+                return dict(cached[0]['data'], from_cache=True)
+
+            response.raise_for_status()
+            
+            if (extractor or EXTRACTOR) == 'soup':
+                data, parse_seconds = _extract_buffered(response, max_bytes, deadline_at)
+            else:
+                data, parse_seconds = _extract_streaming(response, max_bytes, deadline_at)
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
         
-        # Get meta description
-        meta_desc = ''
-        meta_tag = soup.find('meta', attrs={'name': 'description'})
-        if not meta_tag:
-            meta_tag = soup.find('meta', attrs={'property': 'og:description'})
-        if meta_tag:
-            meta_desc = meta_tag.get('content', '').strip()
-        
-        # Ensure we have some content
-        content = '\n'.join(paragraphs) if paragraphs else 'Content could not be extracted'
-        title = title if title else 'Title not found'
-        
-        return {
-            'title': title,
-            'meta_description': meta_desc,
-            'headings': headings,
-            'content': content
-        }
+        # Split the wall time into network and parsing
+        tracer.record('scrape.fetch', time.perf_counter() - fetch_started - parse_seconds, bytes=data['bytes_read'])
+        tracer.record('scrape.parse', parse_seconds, bytes=data['bytes_read'])
+        if data['truncated']:
+            print(f"Page truncated for {url} after {data['bytes_read']} bytes")
+        # A page cut short by this call's budget would be served to callers with a bigger one
+        if cache is not None and not data['truncated']:
+            cache.set(cache_key, dict(validators, data=data))
+        return data
     
     except requests.exceptions.SSLError:
         print(f"SSL Error for {url}")
@@ -84,3 +391,75 @@ def scrape_url(url):
     except Exception as e:
         print(f"Scraping error for {url}: {e}")
         raise Exception(f"Failed to scrape {url}: {str(e)}")
+
+
+class ScrapeEngine:
+    """Run many scrapes concurrently with per-host limits and politeness delays"""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, per_host_limit: int = PER_HOST_LIMIT,
+                 politeness_delay: float = POLITENESS_DELAY, **scrape_options):
+        self.concurrency = max(1, concurrency)
+        self.per_host_limit = max(1, per_host_limit)
+        self.politeness_delay = politeness_delay
+        # Passed to every scrape_url call, e.g. max_bytes or deadline
+        self.scrape_options = scrape_options
+
+    async def iter_scrape(self, urls: Iterable[str]):
+        """Yield one result dict per URL, in the order the scrapes finish"""
+        loop = asyncio.get_running_loop()
+        global_limit = asyncio.Semaphore(self.concurrency)
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        host_locks: Dict[str, asyncio.Lock] = {}
+        host_last_start: Dict[str, float] = {}
+
+        async def wait_for_turn(host: str) -> None:
+            # Space out request starts to the same host
+            async with host_locks.setdefault(host, asyncio.Lock()):
+                wait = host_last_start.get(host, 0.0) + self.politeness_delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                host_last_start[host] = time.monotonic()
+
+        async def scrape_one(url: str) -> Dict:
+            host = urlparse(url).netloc.lower()
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+            async with global_limit, host_limit:
+                await wait_for_turn(host)
+                start = time.perf_counter()
+                try:
+                    data = await loop.run_in_executor(executor, partial(scrape_url, url, **self.scrape_options))
+                    error = None
+                except Exception as e:
+                    data, error = None, str(e)
+                return {'url': url, 'data': data, 'error': error, 'elapsed': time.perf_counter() - start}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='scraper') as executor:
+            tasks = [asyncio.ensure_future(scrape_one(url)) for url in urls]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+async def scrape_many_async(urls: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY, **engine_options):
+    """Async generator over scrape results as they finish"""
+    engine = ScrapeEngine(concurrency=concurrency, **engine_options)
+    async for result in engine.iter_scrape(urls):
+        yield result
+
+
+def scrape_many(urls: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY, **engine_options) -> Iterator[Dict]:
+    """Scrape many URLs concurrently, yielding {url, data, error, elapsed} as each one finishes"""
+    loop = asyncio.new_event_loop()
+    results = scrape_many_async(urls, concurrency=concurrency, **engine_options)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
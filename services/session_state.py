@@ -0,0 +1,64 @@
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional
+
+
+class SessionState(MutableMapping):
+    """Progress of one KYB conversation, kept apart from the shared WorkflowManager
+
+    Fields are slots rather than a per-instance dict, so a session costs a
+    fixed, small amount of memory and a misspelled field fails loudly. It
+    still reads and writes like the dict the workflow has always used:
+    state['workflow_step'], state.get('kyb_filepath'), 'pending_jobs' in state.
+    A field that was never set counts as missing.
+    """
+
+    __slots__ = ('workflow_step', 'session_id', 'kyb_data', 'current_question', 'what_they_sell',
+                 'kyb_filepath', 'pending_jobs', 'conversation_summary', 'summarized_turns')
+
+    workflow_step: int
+    session_id: str
+    kyb_data: Dict
+    current_question: int
+    what_they_sell: str
+    kyb_filepath: str
+    pending_jobs: List[Dict]
+    conversation_summary: str
+    summarized_turns: int
+
+    def __init__(self, values: Optional[Dict] = None, **fields):
+        if values:
+            self.update(values)
+        self.update(fields)
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self.__slots__:
+            raise KeyError(f"Unknown session field: {key}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field in self.__slots__ if hasattr(self, field))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"SessionState({dict(self)!r})"
+
+    def to_dict(self) -> Dict:
+        return dict(self)
@@ -0,0 +1,86 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from services.context_service import estimate_tokens, truncate_to_tokens
+
+# Turns kept verbatim; older ones are folded into the running summary
+RECENT_TURNS = int(os.getenv('CONVERSATION_RECENT_TURNS', '12'))
+# Fold in batches so the summary is not rewritten on every single turn
+SUMMARY_BATCH = int(os.getenv('CONVERSATION_SUMMARY_BATCH', '8'))
+SUMMARY_TOKEN_BUDGET = int(os.getenv('CONVERSATION_SUMMARY_TOKENS', '300'))
+LINE_TOKENS = 40
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+_MARKUP = re.compile(r'[*_#`>]+')
+
+
+def _turn_text(turn: Dict) -> Tuple[str, str]:
+    """Return (role, text) for a chat message or a free-form KYB conversation entry"""
+    if 'content' in turn:
+        return turn.get('role', 'user'), str(turn['content'])
+    text = ' '.join(str(value) for value in turn.values() if isinstance(value, str))
+    return turn.get('role', 'note'), text
+
+
+def summarize_turn(turn: Dict) -> str:
+    """Reduce one turn to its first sentence"""
+    role, text = _turn_text(turn)
+    text = ' '.join(_MARKUP.sub('', text).split())
+    if not text:
+        return ''
+    first = _SENTENCE_END.split(text, 1)[0]
+    return f"{role}: {truncate_to_tokens(first, LINE_TOKENS)}"
+
+
+def fold_summary(summary: str, turns: List[Dict], token_budget: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Fold turns into the running summary, dropping its oldest lines once over budget
+
+    What the user said carries the business facts, so assistant lines are
+    dropped before user lines when space runs out.
+    """
+    lines = [line for line in summary.split('\n') if line] if summary else []
+    seen = set(lines)
+    for turn in turns:
+        line = summarize_turn(turn)
+        if line and line not in seen:
+            lines.append(line)
+            seen.add(line)
+
+    def size():
+        return sum(estimate_tokens(line) + 1 for line in lines)
+
+    for role_prefix in ('assistant:', ''):
+        index = 0
+        while size() > token_budget and index < len(lines):
+            if lines[index].startswith(role_prefix):
+                del lines[index]
+            else:
+                index += 1
+    return '\n'.join(lines)
+
+
+def compact_history(messages: List[Dict], summary: str = '', recent: int = RECENT_TURNS,
+                    batch: int = SUMMARY_BATCH) -> Tuple[List[Dict], str, int]:
+    """Keep the most recent turns and fold the rest into the summary
+
+    Returns (recent_messages, summary, folded_count). Nothing is folded until
+    at least `batch` turns are waiting beyond the recent window.
+    """
+    overflow = len(messages) - recent
+    if overflow < batch:
+        return messages, summary, 0
+    return messages[overflow:], fold_summary(summary, messages[:overflow]), overflow
+
+
+def summary_ops(document: Dict, summary_key: str = 'conversation_summary',
+                history_key: str = 'conversation_history') -> Optional[List[Dict]]:
+    """Journal ops that fold a stored document's old conversation turns, or None if within bounds"""
+    history = document.get(history_key) or []
+    recent, summary, folded = compact_history(history, document.get(summary_key, ''))
+    if not folded:
+        return None
+    return [
+        {'op': 'set', 'path': [summary_key], 'value': summary},
+        {'op': 'set', 'path': [history_key], 'value': recent},
+        {'op': 'set', 'path': ['summarized_turns'], 'value': document.get('summarized_turns', 0) + folded}
+    ]
@@ -0,0 +1,86 @@
+import hashlib
+import random
+import re
+import zlib
+from typing import List, Set
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 32
+# Estimated Jaccard similarity above which two blocks count as the same text
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Share of a block's shingles already kept elsewhere above which it adds nothing new
+CONTAINMENT_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+_WORD = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase words only, so spacing, case and punctuation changes compare equal"""
+    return ' '.join(_WORD.findall(text.lower()))
+
+
+def shingles(normalized: str, size: int = SHINGLE_WORDS) -> Set[int]:
+    """Hashes of every run of size consecutive words (the whole text when it is shorter)"""
+    words = normalized.split()
+    if len(words) <= size:
+        return {zlib.crc32(normalized.encode('utf-8'))}
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set: Set[int]) -> List[int]:
+    """MinHash signature; the share of equal positions estimates Jaccard similarity"""
+    return [min((a * value + b) % _MERSENNE_PRIME for value in shingle_set) for a, b in _PERMUTATIONS]
+
+
+def estimated_similarity(first: List[int], second: List[int]) -> float:
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+class ContentDeduper:
+    """Accept text blocks only if they are not exact, near or contained copies of blocks already accepted
+
+    Exact copies are caught by a hash of the normalized text, reworded copies by
+    MinHash similarity, and wrappers that only repeat accepted text (a div
+    around two paragraphs) by shingle containment.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, containment: bool = True):
+        self.threshold = threshold
+        self.containment = containment
+        self.duplicates = 0
+        self._hashes: Set[str] = set()
+        self._signatures: List[List[int]] = []
+        self._seen_shingles: Set[int] = set()
+        self._last = None
+
+    def add(self, text: str) -> bool:
+        """Record text and return True if it is new content"""
+        # Wrappers nested around the same text arrive back to back
+        if text == self._last:
+            self.duplicates += 1
+            return False
+        self._last = text
+        normalized = normalize_text(text)
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        if digest in self._hashes:
+            self.duplicates += 1
+            return False
+
+        block = shingles(normalized)
+        if self.containment and self._seen_shingles:
+            if len(block & self._seen_shingles) / len(block) >= CONTAINMENT_THRESHOLD:
+                self.duplicates += 1
+                return False
+        signature = minhash(block)
+        if any(estimated_similarity(signature, seen) >= self.threshold for seen in self._signatures):
+            self.duplicates += 1
+            return False
+
+        self._hashes.add(digest)
+        self._signatures.append(signature)
+        self._seen_shingles |= block
+        return True
@@ -0,0 +1,293 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '1') == '1'
+# Durations kept per stage for the percentiles
+SAMPLES_PER_STAGE = int(os.getenv('TRACING_SAMPLES', '2048'))
+RECENT_TRACES = 50
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRIC_PREFIX = 'kyb_stage'
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Span:
+    """A timed stage; attributes such as sizes can be attached while it runs"""
+    
+    __slots__ = ('tracer', 'name', 'attrs', 'started', 'duration', 'children', 'error')
+    
+    def __init__(self, tracer: 'Tracer', name: str, attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.started = 0.0
+        self.duration = 0.0
+        self.children = []
+        self.error = False
+    
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+    
+    def __enter__(self) -> 'Span':
+        self.tracer._push(self)
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.duration = time.perf_counter() - self.started
+        self.error = exc_type is not None and exc_type is not GeneratorExit
+        self.tracer._pop(self)
+        return False
+    
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            'attrs': self.attrs,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is disabled"""
+    
+    def set(self, **attrs) -> None:
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Stage:
+    __slots__ = ('count', 'errors', 'total', 'max', 'bytes', 'samples')
+    
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.samples = deque(maxlen=SAMPLES_PER_STAGE)
+
+
+class Tracer:
+    """Records nested spans per thread and aggregates their durations per stage"""
+    
+    def __init__(self, enabled: bool = TRACING_ENABLED):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._recent = deque(maxlen=RECENT_TRACES)
+        self._gauges: Dict[str, Callable[[], Dict]] = {}
+    
+    def span(self, name: str, **attrs):
+        """Context manager timing one stage; nested spans form a per-turn breakdown"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+    
+    def record(self, name: str, seconds: float, error: bool = False, **attrs) -> None:
+        """Record a stage measured elsewhere, e.g. parse time summed over many chunks"""
+        if not self.enabled:
+            return
+        span = Span(self, name, attrs)
+        span.duration = seconds
+        span.error = error
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack[-1].children.append(span)
+        self._aggregate(span)
+    
+    def add_gauges(self, name: str, provider: Callable[[], Dict]) -> None:
+        """Publish the numbers in provider()'s dict as kyb_<name>_<key> gauges"""
+        with self._lock:
+            self._gauges[name] = provider
+    
+    def gauges(self) -> Dict[str, Dict]:
+        with self._lock:
+            providers = list(self._gauges.items())
+        values = {}
+        for name, provider in providers:
+            try:
+                values[name] = {key: value for key, value in provider().items()
+                                if isinstance(value, (int, float))}
+            except Exception as e:
+                print(f"Gauge provider {name} failed: {e}")
+        return values
+    
+    def _push(self, span: Span) -> None:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack:
+            stack[-1].children.append(span)
+        stack.append(span)
+    
+    def _pop(self, span: Span) -> None:
+        stack = getattr(self._local, 'stack', [])
+        # Tolerate spans closed out of order (e.g. an abandoned generator)
+        if span in stack:
+            while stack.pop() is not span:
+                pass
+        self._aggregate(span)
+        if not stack:
+            with self._lock:
+                self._recent.append(span)
+    
+    def _aggregate(self, span: Span) -> None:
+        size = span.attrs.get('bytes', 0)
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = _Stage()
+            stage.count += 1
+            stage.errors += span.error
+            stage.total += span.duration
+            stage.max = max(stage.max, span.duration)
+            stage.bytes += size if isinstance(size, int) else 0
+            stage.samples.append(span.duration)
+    
+    def snapshot(self, include_traces: bool = True) -> Dict:
+        """Per-stage latency percentiles in milliseconds, plus the most recent traces"""
+        with self._lock:
+            stages = {name: (stage.count, stage.errors, stage.total, stage.max, stage.bytes, sorted(stage.samples))
+                      for name, stage in self._stages.items()}
+            recent = list(self._recent) if include_traces else []
+        
+        snapshot = {'generated_at': time.time(), 'stages': {}}
+        for name, (count, errors, total, maximum, size, ordered) in sorted(stages.items()):
+            snapshot['stages'][name] = {
+                'count': count,
+                'errors': errors,
+                'avg_ms': round(total / count * 1000, 3) if count else 0.0,
+                'p50_ms': round(_percentile(ordered, 50) * 1000, 3),
+                'p95_ms': round(_percentile(ordered, 95) * 1000, 3),
+                'p99_ms': round(_percentile(ordered, 99) * 1000, 3),
+                'max_ms': round(maximum * 1000, 3),
+                'bytes': size
+            }
+        snapshot['gauges'] = self.gauges()
+        if include_traces:
+            snapshot['recent_traces'] = [span.to_dict() for span in recent]
+        return snapshot
+    
+    def export_json(self, path: Optional[str] = None) -> str:
+        """Return the snapshot as JSON, also writing it to path when given"""
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+    
+    def prometheus_text(self) -> str:
+        """Render stage latencies in the Prometheus text exposition format"""
+        stages = self.snapshot(include_traces=False)['stages']
+        metric = f"{METRIC_PREFIX}_duration_seconds"
+        lines = [f"# HELP {metric} Latency of each traced stage",
+                 f"# TYPE {metric} summary"]
+        for name, stage in stages.items():
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'{metric}{{stage="{name}",quantile="{quantile}"}} {stage[key] / 1000:.6f}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {stage["avg_ms"] * stage["count"] / 1000:.6f}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {stage["count"]}')
+        lines.append(f"# HELP {METRIC_PREFIX}_errors_total Traced stages that raised")
+        lines.append(f"# TYPE {METRIC_PREFIX}_errors_total counter")
+        for name, stage in stages.items():
+            lines.append(f'{METRIC_PREFIX}_errors_total{{stage="{name}"}} {stage["errors"]}')
+        lines.append(f"# HELP {METRIC_PREFIX}_bytes_total Bytes processed by each traced stage")
+        lines.append(f"# TYPE {METRIC_PREFIX}_bytes_total counter")
+        for name, stage in stages.items():
+            lines.append(f'{METRIC_PREFIX}_bytes_total{{stage="{name}"}} {stage["bytes"]}')
+        for name, values in self.gauges().items():
+            for key, value in values.items():
+                lines.append(f"# TYPE kyb_{name}_{key} gauge")
+                lines.append(f"kyb_{name}_{key} {float(value):g}")
+        return '\n'.join(lines) + '\n'
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attrs):
+    """Time a stage on the shared tracer: `with span('scrape.fetch', url=url) as s: ...`"""
+    return tracer.span(name, **attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator form of span()"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def get_trace_snapshot() -> Dict:
+    return tracer.snapshot()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics'):
+            body, content_type = tracer.prometheus_text(), 'text/plain; version=0.0.4'
+        elif self.path.startswith('/snapshot'):
+            body, content_type = tracer.export_json(), 'application/json'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+metrics_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics (Prometheus text) and /snapshot (JSON) from a daemon thread; safe to call repeatedly"""
+    global metrics_server
+    if not port:
+        return None
+    with _server_lock:
+        if metrics_server is None:
+            try:
+                metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics server not started: {e}")
+                return None
+            threading.Thread(target=metrics_server.serve_forever, name='metrics-server', daemon=True).start()
+            print(f"Metrics available at http://{host}:{metrics_server.server_port}/metrics")
+    return metrics_server
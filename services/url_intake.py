@@ -0,0 +1,155 @@
+import ipaddress
+import os
+import re
+import socket
+from typing import List, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Bare domains ("acme.com") are only recognised for these top-level domains, so that
+# words like "Node.js" or "e.g." are not mistaken for links
+BARE_DOMAIN_TLDS = {
+    'com', 'net', 'org', 'io', 'co', 'ai', 'app', 'dev', 'biz', 'info', 'tech', 'store', 'shop', 'online',
+    'site', 'xyz', 'us', 'uk', 'ca', 'au', 'de', 'fr', 'es', 'it', 'nl', 'be', 'ch', 'at', 'se', 'no', 'dk',
+    'fi', 'ie', 'pt', 'pl', 'in', 'sg', 'nz', 'eu', 'me', 'tv', 'cloud', 'agency', 'studio', 'health'
+}
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'igshid', 'ref_src'}
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Hosts never worth scraping: reserved documentation domains and local names
+BLOCKED_HOSTS = {'localhost', 'example.com', 'example.net', 'example.org'}
+BLOCKED_SUFFIXES = ('.localhost', '.local', '.internal', '.example.com', '.example.net', '.example.org')
+# Comma-separated hosts that bypass the private-address check (e.g. a local test server)
+ALLOWED_HOSTS: Set[str] = {host.strip().lower() for host in os.getenv('URL_ALLOWED_HOSTS', '').split(',')
+                           if host.strip()}
+
+URL_CANDIDATE = re.compile(
+    r'(?<![@\w.-])(?:https?://[^\s<>"\']+'
+    r'|(?:www\.)?(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24}(?::\d{2,5})?(?:/[^\s<>"\']*)?)',
+    re.IGNORECASE
+)
+_SCHEME = re.compile(r'[a-z][a-z0-9+.-]*://', re.IGNORECASE)
+_REPEATED_SLASHES = re.compile(r'/{2,}')
+# Hosts made only of decimal, octal or hex parts, such as 127.1 or 0x7f.0.0.1, which resolvers read as IPv4
+_NUMERIC_HOST = re.compile(r'(?:0x[0-9a-f]*|\d+)(?:\.(?:0x[0-9a-f]*|\d+)){0,3}', re.IGNORECASE)
+TRAILING_PUNCTUATION = '.,;:!?\'"*'
+MIN_URL_LENGTH = 10
+
+
+def allow_host(host: str) -> None:
+    """Let a private or loopback host through the intake checks"""
+    ALLOWED_HOSTS.add(host.lower())
+
+
+def _trim(candidate: str) -> str:
+    """Drop sentence punctuation after a link, and closing brackets that were never opened"""
+    while candidate:
+        last = candidate[-1]
+        if last in TRAILING_PUNCTUATION:
+            candidate = candidate[:-1]
+        elif last in ')]}' and candidate.count(last) > candidate.count({')': '(', ']': '[', '}': '{'}[last]):
+            candidate = candidate[:-1]
+        else:
+            break
+    return candidate
+
+
+def canonicalize_url(url: str) -> Optional[str]:
+    """Canonical form of url, or None if it is not an http(s) URL with a host
+
+    Adds https:// to bare domains, lowercases scheme and host, drops default
+    ports, fragments, tracking parameters and trailing slashes on paths, and
+    sorts the remaining query parameters.
+    """
+    url = _trim(url.strip())
+    if _SCHEME.match(url) is None:
+        url = f'https://{url}'
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower().rstrip('.')
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    if ':' in host:
+        host = f'[{host}]'
+    if port and port != DEFAULT_PORTS[scheme]:
+        host = f'{host}:{port}'
+
+    path = _REPEATED_SLASHES.sub('/', parts.path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def cache_key(url: str) -> str:
+    """Key under which equivalent URLs share scrape and analysis cache entries"""
+    return canonicalize_url(url) or url.strip()
+
+
+def _is_public_address(address) -> bool:
+    return not (address.is_private or address.is_loopback or address.is_link_local or address.is_multicast
+                or address.is_reserved or address.is_unspecified)
+
+
+def is_public_host(host: str, resolve: bool = False) -> bool:
+    """False for loopback, private, link-local and reserved addresses and local hostnames
+
+    Shorthand numeric hosts (127.1, 2130706433, 0177.0.0.1) are read the way
+    the system resolver reads them. With resolve=True a hostname is looked
+    up and every address it resolves to must be public; names that do not
+    resolve are left to fail when the connection is made.
+    """
+    host = host.lower().strip('[]')
+    if host in ALLOWED_HOSTS:
+        return True
+    if host in BLOCKED_HOSTS or host.endswith(BLOCKED_SUFFIXES):
+        return False
+    try:
+        return _is_public_address(ipaddress.ip_address(host))
+    except ValueError:
+        pass
+    if _NUMERIC_HOST.fullmatch(host):
+        try:
+            return _is_public_address(ipaddress.ip_address(socket.inet_aton(host)))
+        except OSError:
+            return False
+    if '.' not in host:
+        return False
+    if not resolve:
+        return True
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return True
+    # Scoped IPv6 addresses come back as fe80::1%eth0
+    return all(_is_public_address(ipaddress.ip_address(address.split('%', 1)[0])) for address in addresses)
+
+
+def is_scrapeable_url(url: str, resolve: bool = False) -> bool:
+    """A canonical http(s) URL on a public host; see is_public_host for resolve"""
+    canonical = canonicalize_url(url)
+    if not canonical or len(canonical) < MIN_URL_LENGTH:
+        return False
+    return is_public_host(urlsplit(canonical).hostname or '', resolve=resolve)
+
+
+def extract_urls(text: str, limit: Optional[int] = None) -> List[str]:
+    """Canonical, scrapeable URLs in text, in order of appearance and without repeats"""
+    urls: List[str] = []
+    for match in URL_CANDIDATE.finditer(text):
+        candidate = match.group(0)
+        if not candidate.lower().startswith(('http://', 'https://')):
+            host = urlsplit(f'https://{_trim(candidate)}').hostname or ''
+            if host.rsplit('.', 1)[-1] not in BARE_DOMAIN_TLDS:
+                continue
+        canonical = canonicalize_url(candidate)
+        if canonical and canonical not in urls and is_scrapeable_url(canonical):
+            urls.append(canonical)
+            if limit is not None and len(urls) >= limit:
+                break
+    return urls
@@ -1,35 +1,178 @@
-from typing import Dict, List, Optional, Tuple
-from services.gemini_service import analyze_with_gemini
-from services.scraper_service import scrape_url
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from services.gemini_service import analyze_with_gemini, stream_with_gemini
+from services.context_service import build_context
+from services.crawler_service import crawl_site
+from services.scraper_service import scrape_many, scrape_url
+from services.kyb_repository import get_kyb_repository
+from services.kyb_rules import COMPLETION_RULES
+from services.job_service import JobQueueFull, get_job_executor
+from services.tracing import span
+from services.url_intake import cache_key, extract_urls
+try:
+    from services.chroma_service import ingest_scraped_page, ingest_kyb_answer
+except ImportError:
+    def ingest_scraped_page(*args, **kwargs): return False
+    def ingest_kyb_answer(*args, **kwargs): return False
+import hashlib
+import threading
+import time
+import types
 import uuid
-import re
-import json
 import os
 
+# Workflow definition: each step names its handler and maps the handler's outcome to the next step.
+# Any step number not listed here is treated as the ongoing conversation.
+WORKFLOW_STEPS = {
+    1: {'name': 'greeting', 'handler': '_step1_ask_what_you_sell', 'transitions': {'asked': 2}},
+    2: {'name': 'what_they_sell', 'handler': '_step2_user_responds', 'transitions': {'answered': 3}},
+    3: {'name': 'create_kyb_file', 'handler': '_step3_create_kyb_file', 'transitions': {'created': 4}},
+    4: {'name': 'product_details', 'handler': '_step4_update_kyb_file', 'transitions': {'saved': 5}},
+    5: {'name': 'next_question', 'handler': '_step5_chat_next',
+        'transitions': {'asked': 6, 'no_more_questions': 8}},
+    6: {'name': 'record_answer', 'handler': '_step6_update_kyb_file', 'transitions': {'saved': 7}},
+    7: {'name': 'chat_next', 'handler': '_step7_chat_next', 'transitions': {'done': 8}},
+    8: {'name': 'check_complete', 'handler': '_step8_check_if_kyb_full',
+        'transitions': {'complete': 9, 'incomplete': 3}},
+    9: {'name': 'ongoing', 'handler': '_ongoing_conversation', 'transitions': {}}
+}
+ONGOING_STEP = 9
+
+# Questions asked in steps 5-6, and where each answer is filed in kyb_data
+WORKFLOW_QUESTIONS = [
+    {'text': "Tell me more about your AI OS - what makes it special?",
+     'category': 'business_understanding', 'label': 'Special features: '},
+    {'text': "What are your main business goals with this AI OS?", 'category': 'objectives', 'label': ''},
+    {'text': "What challenges are you currently facing?", 'category': 'constraints', 'label': ''},
+    {'text': "Who is your target audience?", 'category': 'business_understanding', 'label': 'Target audience: '},
+    {'text': "What would success look like for you?", 'category': 'objectives', 'label': 'Success metric: '}
+]
+
 class WorkflowManager:
-    """Manage the KYB conversation workflow with exact 8-step pattern"""
+    """Run the KYB conversation workflow defined by WORKFLOW_STEPS
+    
+    All per-conversation state lives in session_state (a SessionState, or any
+    dict), and the step table is fixed at construction, so one instance is
+    shared by every session; see get_workflow_manager. The only thing it
+    updates is the lock-protected step timings.
+    """
     
     # Core questions for the workflow
-    CORE_QUESTIONS = [
-        "Tell me more about your AI OS - what makes it special?",
-        "What are your main business goals with this AI OS?", 
-        "What challenges are you currently facing?",
-        "Who is your target audience?",
-        "What would success look like for you?"
-    ]
-    
-    def __init__(self):
-        self.url_pattern = r'https?://[^\s]+'
-        self.current_question_index = 0
+    CORE_QUESTIONS = [question['text'] for question in WORKFLOW_QUESTIONS]
+    
+    # Download budgets for a pasted URL, so heavy or slow pages cannot stall a chat turn
+    URL_SCRAPE_MAX_BYTES = 1024 * 1024
+    URL_SCRAPE_DEADLINE = 8.0
+    # Links taken from one message, and the page text shared between them in the combined analysis
+    MAX_URLS_PER_MESSAGE = 6
+    MULTI_PAGE_CONTENT_CHARS = 2400
+    # Crawl mode: a single pasted URL seeds a same-site crawl of the most relevant pages
+    CRAWL_SITE = os.getenv('WORKFLOW_CRAWL_SITE', '0') == '1'
+    
+    def __init__(self, steps: Optional[Dict] = None):
+        # Resolve handlers once so each turn is a single dictionary lookup
+        steps = steps or WORKFLOW_STEPS
+        for number, step in steps.items():
+            for outcome, target in step['transitions'].items():
+                if target not in steps:
+                    raise Exception(f"Step {number} ({step['name']}) moves to undefined step {target} on '{outcome}'")
+        self._dispatch = types.MappingProxyType({
+            number: (step['name'], getattr(self, step['handler']), types.MappingProxyType(dict(step['transitions'])))
+            for number, step in steps.items()
+        })
+        self._ongoing = self._dispatch.get(ONGOING_STEP, ('ongoing', self._ongoing_conversation,
+                                                          types.MappingProxyType({})))
+        self._step_hooks = ()
+        self._timing_lock = threading.Lock()
+        self._step_timings = {}
         
     def get_initial_message(self) -> str:
         """Return the initial greeting message - Step 1"""
         return "Hi! 👋 What do you sell? (You can also paste a URL to scrape your business website)"
     
     def process_workflow_step(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Process input following exact 8-step workflow pattern"""
-        
-        # Initialize session state if needed
+        """Process one turn of the workflow"""
+        
+        self._ensure_session(session_state)
+        started = time.perf_counter()
+        step = session_state['workflow_step']
+        
+        # Check if input contains URLs (only scrape if URL detected)
+        urls = self._find_urls(user_input)
+        if urls:
+            print(f"🔍 URL detected in input: {', '.join(urls)}")
+            with span('workflow.url_input', step=step, pages=len(urls)):
+                result = self._handle_url_input(urls, user_input, session_state)
+            self._record_step(step, 'url_input', time.perf_counter() - started, session_state)
+            return result
+        
+        name, handler, transitions = self._dispatch.get(step, self._ongoing)
+        with span(f'workflow.{name}', step=step):
+            response, outcome = handler(user_input, session_state)
+        if outcome in transitions:
+            session_state['workflow_step'] = transitions[outcome]
+        
+        self._record_step(step, name, time.perf_counter() - started, session_state)
+        return response, session_state
+    
+    def process_workflow_step_stream(self, user_input: str, session_state: Dict,
+                                     background: bool = False) -> Iterator[str]:
+        """Like process_workflow_step, but yield the reply in pieces as they become available
+        
+        With background=True pasted URLs are handed to the job executor and the
+        reply is only an acknowledgement; collect_finished_jobs delivers the rest.
+        """
+        self._ensure_session(session_state)
+        
+        urls = self._find_urls(user_input)
+        if urls:
+            print(f"🔍 URL detected in input: {', '.join(urls)}")
+            step = session_state['workflow_step']
+            started = time.perf_counter()
+            if background:
+                reply = self.submit_url_job(urls, session_state)
+                if reply is not None:
+                    self._record_step(step, 'url_submit', time.perf_counter() - started, session_state)
+                    yield reply
+                    return
+            yield from self._iter_url_input(urls, user_input, session_state, stream=True)
+            self._record_step(step, 'url_input', time.perf_counter() - started, session_state)
+            return
+        
+        response, _ = self.process_workflow_step(user_input, session_state)
+        yield response
+    
+    def add_step_hook(self, hook: Callable[[int, str, float, Dict], None]) -> None:
+        """Call hook(step, name, seconds, session_state) after every handled turn"""
+        with self._timing_lock:
+            self._step_hooks = self._step_hooks + (hook,)
+    
+    def get_step_timings(self) -> Dict[str, Dict]:
+        """Per-step call counts and latencies in milliseconds"""
+        with self._timing_lock:
+            return {
+                name: {
+                    'count': timing['count'],
+                    'avg_ms': round(timing['total'] / timing['count'] * 1000, 3),
+                    'max_ms': round(timing['max'] * 1000, 3)
+                }
+                for name, timing in self._step_timings.items()
+            }
+    
+    def _record_step(self, step: int, name: str, seconds: float, session_state: Dict) -> None:
+        with self._timing_lock:
+            timing = self._step_timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            hooks = self._step_hooks
+        for hook in hooks:
+            try:
+                hook(step, name, seconds, session_state)
+            except Exception as e:
+                print(f"Step hook failed: {e}")
+    
+    def _ensure_session(self, session_state: Dict) -> None:
+        """Initialize session state if needed"""
         if 'workflow_step' not in session_state:
             session_state['workflow_step'] = 1
             session_state['session_id'] = str(uuid.uuid4())
@@ -41,350 +184,81 @@ class WorkflowManager:
                 'scraped_data': []
             }
             session_state['current_question'] = 0
-        
-        # Check if input contains a URL (only scrape if URL detected)
-        urls = re.findall(self.url_pattern, user_input)
-        if urls and self._is_valid_url(urls[0]):
-            print(f"🔍 URL detected in input: {urls[0]}")
-            return self._handle_url_input(urls[0], user_input, session_state)
-        
-        current_step = session_state['workflow_step']
-        
-        if current_step == 1:
-            return self._step1_ask_what_you_sell(session_state)
-        elif current_step == 2:
-            return self._step2_user_responds(user_input, session_state)  # "I make AI OS"
-        elif current_step == 3:
-            return self._step3_create_kyb_file(session_state)
-        elif current_step == 4:
-            return self._step4_update_kyb_file(user_input, session_state)
-        elif current_step == 5:
-            return self._step5_chat_next(session_state)
-        elif current_step == 6:
-            return self._step6_update_kyb_file(user_input, session_state)
-        elif current_step == 7:
-            return self._step7_chat_next(session_state)
-        elif current_step == 8:
-            return self._step8_check_if_kyb_full(user_input, session_state)
-        else:
-            return self._ongoing_conversation(user_input, session_state)
     
-    def _is_valid_url(self, url: str) -> bool:
-        """Check if the URL looks valid and worth scraping"""
-        try:
-            # Basic URL validation
-            if not url.startswith(('http://', 'https://')):
-                return False
-            if len(url) < 10:  # Too short
-                return False
-            if any(skip in url.lower() for skip in ['localhost', '127.0.0.1', 'example.com']):
-                return False
-            return True
-        except:
-            return False
-    
-    def _step1_ask_what_you_sell(self, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 1: Initial greeting asking what they sell - then advance to step 2"""
-        session_state['workflow_step'] = 2  # Advance to step 2 so next input goes to step 2 logic
-        return self.get_initial_message(), session_state
-    
-    def _step2_user_responds(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
+    def _find_urls(self, user_input: str) -> List[str]:
+        """Return the canonical, scrapeable URLs in the input, in order and without repeats"""
+        return extract_urls(user_input, limit=self.MAX_URLS_PER_MESSAGE)
+    
+    def _step1_ask_what_you_sell(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
+        """Step 1: Initial greeting asking what they sell"""
+        return self.get_initial_message(), 'asked'
+    
+    def _step2_user_responds(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 2: User responds with what they sell (e.g., 'I make AI OS')"""
         session_state['what_they_sell'] = user_input
-        session_state['workflow_step'] = 3
+        ingest_kyb_answer(session_state.get('session_id'), "What do you sell?", user_input, 'business_understanding')
         
         response = f"Great! You make **{user_input}**. Let me create your business profile..."
-        return response, session_state
+        return response, 'answered'
     
-    def _step3_create_kyb_file(self, session_state: Dict) -> Tuple[str, Dict]:
+    def _step3_create_kyb_file(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 3: Create KYB file"""
         self._create_kyb_file(session_state)
-        session_state['workflow_step'] = 4
         
         response = "✅ Business profile created! Now tell me more about your AI OS - what makes it special?"
-        return response, session_state
+        return response, 'created'
     
-    def _step4_update_kyb_file(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
+    def _step4_update_kyb_file(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 4: Update KYB file with user response"""
         # Add to business understanding
         session_state['kyb_data']['business_understanding'].append(f"Product details: {user_input}")
         self._update_kyb_file(session_state, user_input, step=4)
-        session_state['workflow_step'] = 5
+        ingest_kyb_answer(session_state.get('session_id'), self.CORE_QUESTIONS[0], user_input, 'business_understanding')
         
         response = "📝 Information saved!"
-        return response, session_state
+        return response, 'saved'
     
-    def _step5_chat_next(self, session_state: Dict) -> Tuple[str, Dict]:
+    def _step5_chat_next(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 5: Ask next question (chat next)"""
         question_index = session_state.get('current_question', 0)
         
-        if question_index < len(self.CORE_QUESTIONS):
-            question = self.CORE_QUESTIONS[question_index]
+        if question_index < len(WORKFLOW_QUESTIONS):
             session_state['current_question'] = question_index
-            session_state['workflow_step'] = 6
-            
-            response = f"Next question: {question}"
-        else:
-            # No more questions, go to step 8 to check completion
-            session_state['workflow_step'] = 8
-            response = "Let me check if I have enough information..."
+            return f"Next question: {WORKFLOW_QUESTIONS[question_index]['text']}", 'asked'
         
-        return response, session_state
+        # No more questions, go to step 8 to check completion
+        return "Let me check if I have enough information...", 'no_more_questions'
     
-    def _step6_update_kyb_file(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
+    def _step6_update_kyb_file(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 6: Update KYB file with response to current question"""
         question_index = session_state.get('current_question', 0)
         
-        # Categorize the response based on question type
-        if question_index == 0:  # About the product
-            session_state['kyb_data']['business_understanding'].append(f"Special features: {user_input}")
-        elif question_index == 1:  # Business goals
-            session_state['kyb_data']['objectives'].append(user_input)
-        elif question_index == 2:  # Challenges
-            session_state['kyb_data']['constraints'].append(user_input)
-        elif question_index == 3:  # Target audience
-            session_state['kyb_data']['business_understanding'].append(f"Target audience: {user_input}")
-        elif question_index == 4:  # Success definition
-            session_state['kyb_data']['objectives'].append(f"Success metric: {user_input}")
+        # File the answer under the question's category
+        if question_index < len(WORKFLOW_QUESTIONS):
+            question = WORKFLOW_QUESTIONS[question_index]
+            session_state['kyb_data'][question['category']].append(f"{question['label']}{user_input}")
         
         self._update_kyb_file(session_state, user_input, step=6)
-        session_state['current_question'] += 1
-        session_state['workflow_step'] = 7
+        if question_index < len(WORKFLOW_QUESTIONS):
+            ingest_kyb_answer(session_state.get('session_id'), question['text'], user_input, question['category'])
+        session_state['current_question'] = question_index + 1
         
         response = "💾 Response recorded!"
-        return response, session_state
+        return response, 'saved'
     
-    def _step7_chat_next(self, session_state: Dict) -> Tuple[str, Dict]:
+    def _step7_chat_next(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 7: Chat next - could ask another question or proceed to check"""
-        session_state['workflow_step'] = 8
-        response = "Let me check if your business profile is complete..."
-        return response, session_state
-    
-    def _step8_check_if_kyb_full(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 8: Check if KYB is full - Yes: summarize, No: ask same question"""
-        kyb_data = session_state['kyb_data']
-        
-        # Check if we have sufficient information (at least 2 items in each category)
-        has_business = len(kyb_data['business_understanding']) >= 2
-        has_objectives = len(kyb_data['objectives']) >= 1
-        has_constraints = len(kyb_data['constraints']) >= 1
-        
-        if has_business and has_objectives and has_constraints:
-            # YES - KYB is full: (old + new) -> summarize
-            old_data = kyb_data.copy()
-            new_summary = self._create_summary_from_data(old_data)
-            
-            session_state['kyb_data']['summary'] = new_summary
-            self._update_kyb_file(session_state, "KYB Complete - Summary Generated", step=8)
-            
-            response = f"""
-🎉 **Your Business Profile is Complete!**
-
-**Business:** {session_state.get('what_they_sell', 'AI OS')}
-
-**Understanding:**
-{chr(10).join(['• ' + item for item in kyb_data['business_understanding']])}
-
-**Objectives:**
-{chr(10).join(['• ' + item for item in kyb_data['objectives']])}
-
-**Challenges:**
-{chr(10).join(['• ' + item for item in kyb_data['constraints']])}
-
-**Summary:** {new_summary}
-
-Now I can provide targeted assistance! What would you like to focus on?
-"""
-            
-            session_state['workflow_step'] = 9  # Move to ongoing conversation
-            
-        else:
-            # NO - Update KYB and ask same question (loop back)
-            question_index = session_state.get('current_question', 0)
-            
-            if question_index < len(self.CORE_QUESTIONS):
-                next_question = self.CORE_QUESTIONS[question_index]
-                
-                response = f"""
-📋 I need more information to complete your business profile.
-
-Missing: {', '.join([
-                    'Business Details' if not has_business else '',
-                    'Objectives' if not has_objectives else '',
-                    'Challenges' if not has_constraints else ''
-                ]).strip(', ')}
-
-**Next Question:** {next_question}
-"""
-                
-                # Go back to step 6 to collect more info
-                session_state['workflow_step'] = 6
-            else:
-                # All questions asked but still not enough info
-                response = """
-📋 Could you provide more details about:
-- What makes your AI OS unique compared to others?
-- Your main business goals for the next 6 months?
-- The biggest challenge you're facing right now?
-
-This will complete your business profile.
-"""
-                session_state['workflow_step'] = 6
-        
-        return response, session_state
-    
-    def _handle_url_input(self, url: str, full_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Handle URL scraping and extract business data"""
-        try:
-            # Scrape the website
-            scraped_data = scrape_url(url)
-            
-            # Use AI to extract business information from scraped data
-            analysis_prompt = f"""
-            Extract important business information from this website data:
-            
-            Title: {scraped_data.get('title', '')}
-            Meta Description: {scraped_data.get('meta_description', '')}
-            Headings: {', '.join(scraped_data.get('headings', []))}
-            Content: {scraped_data.get('content', '')[:2000]}
-            
-            Extract and return:
-            1. What the business sells/does
-            2. Key products or services
-            3. Business objectives or goals mentioned
-            4. Target audience
-            5. Unique value propositions
-            6. Any challenges or problems they solve
-            
-            Format as structured business insights.
-            """
-            
-            # Use Gemini AI to analyze the scraped data
-            analysis_result = analyze_with_gemini(analysis_prompt, [])
-            
-            # Store scraped data in KYB
-            session_state['kyb_data']['scraped_data'].append({
-                'url': url,
-                'title': scraped_data.get('title', ''),
-                'content_summary': scraped_data.get('content', '')[:500],
-                'analysis': analysis_result.get('response', 'Analysis completed')
-            })
-            
-            # Update business understanding with scraped insights
-            session_state['kyb_data']['business_understanding'].extend([
-                f"Website: {scraped_data.get('title', url)}",
-                f"Business Focus: {analysis_result.get('response', 'Web-based business')[:100]}..."
-            ])
-            
-            # Move to next logical step
-            session_state['workflow_step'] = 3
-            
-            response = f"""
-✅ **Website Analyzed: {scraped_data.get('title', url)}**
-
-I've extracted key business information from your website. Based on what I found, let me ask you some specific questions to complete your business profile.
-
-{self.HARDCODED_QUESTIONS[3]}
-"""
-            
-        except Exception as e:
-            response = f"""
-❌ I had trouble accessing that website ({str(e)}). 
-
-No worries! Let's continue with the questions:
-
-{self.HARDCODED_QUESTIONS.get(session_state['workflow_step'] + 1, 'Tell me more about your business.')}
-"""
-            session_state['workflow_step'] = min(session_state['workflow_step'] + 1, 7)
-        
-        return response, session_state
-    
-    def _step1_what_do_you_sell(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 1: What do you sell?"""
-        # Store what they sell
-        session_state['kyb_data']['business_understanding'].append(f"Business: {user_input}")
-        session_state['what_they_sell'] = user_input
-        
-        # Move to step 2 - Create KYB file
-        session_state['workflow_step'] = 2
-        self._create_kyb_file(session_state)
-        
-        response = f"Great! You make **{user_input}**. I've created your business profile file.\n\n{self.HARDCODED_QUESTIONS[2]}"
-        return response, session_state
-    
-    def _step2_tell_me_more(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 2: Tell me more about your product"""
-        # Update KYB file
-        session_state['kyb_data']['business_understanding'].append(f"Product Details: {user_input}")
-        self._update_kyb_file(session_state, user_input, step=2)
-        
-        session_state['workflow_step'] = 3
-        
-        response = f"📝 Profile updated! {self.HARDCODED_QUESTIONS[3]}"
-        return response, session_state
-    
-    def _step3_business_goals(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 3: Business goals"""
-        # Update KYB file with objectives
-        session_state['kyb_data']['objectives'].append(user_input)
-        self._update_kyb_file(session_state, user_input, step=3)
-        
-        session_state['workflow_step'] = 4
-        
-        response = f"🎯 Goals noted! {self.HARDCODED_QUESTIONS[4]}"
-        return response, session_state
-    
-    def _step4_challenges(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 4: Challenges and constraints"""
-        # Update KYB file with constraints
-        session_state['kyb_data']['constraints'].append(user_input)
-        self._update_kyb_file(session_state, user_input, step=4)
-        
-        session_state['workflow_step'] = 5
-        
-        response = f"⚠️ Challenges recorded! {self.HARDCODED_QUESTIONS[5]}"
-        return response, session_state
-    
-    def _step5_target_audience(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 5: Target audience"""
-        session_state['kyb_data']['business_understanding'].append(f"Target Audience: {user_input}")
-        self._update_kyb_file(session_state, user_input, step=5)
-        
-        session_state['workflow_step'] = 6
-        
-        response = f"👥 Target audience noted! {self.HARDCODED_QUESTIONS[6]}"
-        return response, session_state
+        return "Let me check if your business profile is complete...", 'done'
     
-    def _step6_success_definition(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 6: Success definition"""
-        session_state['kyb_data']['objectives'].append(f"Success metric: {user_input}")
-        self._update_kyb_file(session_state, user_input, step=6)
-        
-        session_state['workflow_step'] = 7
-        
-        response = f"🏆 Success definition saved! {self.HARDCODED_QUESTIONS[7]}"
-        return response, session_state
-    
-    def _step7_pain_points(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Step 7: Pain points"""
-        session_state['kyb_data']['constraints'].append(f"Main pain point: {user_input}")
-        self._update_kyb_file(session_state, user_input, step=7)
-        
-        session_state['workflow_step'] = 8
-        
-        response = "💡 Pain point noted! Let me check if I have enough information to provide comprehensive insights..."
-        return response, session_state
-    
-    def _step8_check_if_kyb_full(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
+    def _step8_check_if_kyb_full(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
         """Step 8: Check if KYB is full and decide next steps"""
         kyb_data = session_state['kyb_data']
         
         # Check if we have sufficient information
-        has_business = len(kyb_data['business_understanding']) >= 2
-        has_objectives = len(kyb_data['objectives']) >= 2
-        has_constraints = len(kyb_data['constraints']) >= 2
+        missing = [rule['label'] for rule in COMPLETION_RULES
+                   if len(kyb_data.get(rule['category'], [])) < rule['minimum']]
         
-        if has_business and has_objectives and has_constraints:
+        if not missing:
             # KYB is full - create summary
             summary = self._create_summary(kyb_data)
             session_state['kyb_data']['summary'] = summary
@@ -408,39 +282,19 @@ No worries! Let's continue with the questions:
 
 Now I can provide targeted assistance! What specific area would you like help with?
 """
-            
-            session_state['workflow_step'] = 9  # Move to ongoing conversation
-            
-        else:
-            # Need more information
-            response = f"""
+            return response, 'complete'
+        
+        # Need more information
+        response = f"""
 📋 I need a bit more information to provide the best insights.
 
-Missing areas: {', '.join([
-    'Business Details' if not has_business else '',
-    'Objectives' if not has_objectives else '',
-    'Challenges' if not has_constraints else ''
-]).strip(', ')}
+Missing areas: {', '.join(missing)}
 
 Could you elaborate on any of these areas? This will help me give you more targeted recommendations.
 """
-            
-            # Go back to collect more info
-            session_state['workflow_step'] = 3
         
-        return response, session_state
-    def _ongoing_conversation(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Handle conversation after workflow completion"""
-        # Continue normal conversation while still updating KYB if needed
-        kyb_data = session_state.get('kyb_data', {})
-        
-        response = f"""Based on your **{session_state.get('what_they_sell', 'AI OS')}** business, here's my response to: "{user_input}"
-
-{self._generate_contextual_response(user_input, kyb_data)}
-
-Is there anything specific about your business I can help you with?"""
-        
-        return response, session_state
+        # Go back to collect more info
+        return response, 'incomplete'
     
     def _create_kyb_file(self, session_state: Dict) -> None:
         """Create a KYB file for the session"""
@@ -460,8 +314,7 @@ Is there anything specific about your business I can help you with?"""
                 "kyb_data": session_state['kyb_data']
             }
             
-            with open(filepath, 'w') as f:
-                json.dump(initial_data, f, indent=2)
+            get_kyb_repository().create(filepath, initial_data)
                 
             session_state['kyb_filepath'] = filepath
             
@@ -473,17 +326,13 @@ Is there anything specific about your business I can help you with?"""
         try:
             if 'kyb_filepath' in session_state and os.path.exists(session_state['kyb_filepath']):
                 
-                with open(session_state['kyb_filepath'], 'r') as f:
-                    data = json.load(f)
-                
-                # Update with new information
-                data['kyb_data'] = session_state['kyb_data']
-                data['workflow_step'] = session_state['workflow_step']
-                data[f'step_{step}_response'] = user_input
-                data['last_updated'] = str(uuid.uuid4())
-                
-                with open(session_state['kyb_filepath'], 'w') as f:
-                    json.dump(data, f, indent=2)
+                # Journal only what changed since the last step
+                get_kyb_repository().update(session_state['kyb_filepath'], {
+                    'kyb_data': session_state['kyb_data'],
+                    'workflow_step': session_state['workflow_step'],
+                    f'step_{step}_response': user_input,
+                    'last_updated': str(uuid.uuid4())
+                })
                     
         except Exception as e:
             print(f"Error updating KYB file: {e}")
@@ -501,117 +350,306 @@ Is there anything specific about your business I can help you with?"""
         
         return summary
     
-    def _create_summary_from_data(self, kyb_data: Dict) -> str:
-        """Create summary from old + new data (Step 8 requirement)"""
-        business_count = len(kyb_data.get('business_understanding', []))
-        objectives_count = len(kyb_data.get('objectives', []))
-        constraints_count = len(kyb_data.get('constraints', []))
-        
-        summary = f"Complete business profile with {business_count} business insights, {objectives_count} objectives, and {constraints_count} challenges documented."
+    def _handle_url_input(self, urls: List[str], full_input: str, session_state: Dict) -> Tuple[str, Dict]:
+        """Handle URL scraping at any step in the workflow - Scraping first, then AI"""
+        response = ''.join(self._iter_url_input(urls, full_input, session_state, stream=False))
+        return response, session_state
+    
+    def _iter_url_input(self, urls: List[str], full_input: str, session_state: Dict, stream: bool) -> Iterator[str]:
+        """Yield the URL reply in pieces; with stream=True the AI analysis arrives token by token
         
-        if kyb_data.get('scraped_data'):
-            summary += f" Includes website analysis from {len(kyb_data['scraped_data'])} source(s)."
+        Several URLs are scraped together and analyzed in one combined request.
+        """
+        try:
+            page = self._scrape_urls(urls)
+        except Exception as e:
+            print(f"URL scraping failed: {str(e)}")
+            yield self._url_error_message(e)
+            return
+        for scraped in page.get('pages', [page]):
+            self._store_page(scraped, session_state)
+        
+        # Auto-fill business information if we're at step 1 or 2
+        auto_fill = session_state['workflow_step'] <= 2
+        yield self._url_header(page, auto_fill)
+        
+        # STEP 3: Try AI analysis (optional - fallback if fails)
+        ai_analysis = yield from self._iter_ai_analysis(page, stream)
+        yield self._apply_ai_analysis(ai_analysis, page, session_state, auto_fill)
+    
+    def submit_url_job(self, urls: List[str], session_state: Dict) -> Optional[str]:
+        """Hand pasted URLs to the background executor and return the interim reply
         
-        return summary
+        Returns None when the queue is full, in which case the caller handles the URLs inline.
+        """
+        # The worker never sees session state, so it cannot race with the chat
+        try:
+            job_id = get_job_executor().submit(self.fetch_url_analysis, urls, kind='url_analysis')
+        except JobQueueFull as e:
+            print(f"Handling URL inline: {e}")
+            return None
+        label = ', '.join(urls)
+        session_state.setdefault('pending_jobs', []).append({'id': job_id, 'url': label})
+        return f"⏳ **Working on it!** I'm reading {label} in the background - feel free to keep chatting, the analysis will appear here when it's ready."
     
-    def _handle_url_input(self, url: str, full_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Handle URL scraping at any step in the workflow - Scraping first, then AI"""
+    def fetch_url_analysis(self, urls: List[str]) -> Dict:
+        """Scrape and analyze URLs without touching session state, so it can run on a worker thread"""
         try:
-            print(f"Attempting to scrape: {url}")
-            
-            # STEP 1: Pure Python scraping (independent of AI)
-            scraped_data = scrape_url(url)
-            print(f"Successfully scraped: {scraped_data.get('title', 'No title')}")
-            
-            # STEP 2: Process scraped data without AI first
-            title = scraped_data.get('title', 'Unknown Business')
-            content = scraped_data.get('content', '')
-            headings = scraped_data.get('headings', [])
-            
-            # Create basic business summary from scraped data
-            basic_summary = f"Website: {title}"
-            if headings:
-                basic_summary += f"\nKey sections: {', '.join(headings[:3])}"
-            if content:
-                basic_summary += f"\nContent preview: {content[:200]}..."
-            
-            # Store scraped data (works without AI)
-            session_state['kyb_data']['scraped_data'].append({
-                'url': url,
-                'title': title,
-                'basic_summary': basic_summary,
-                'full_content': content[:1000]  # Store first 1000 chars
-            })
-            
-            # STEP 3: Try AI analysis (optional - fallback if fails)
-            ai_analysis = "AI analysis unavailable - using basic content extraction"
-            try:
-                analysis_prompt = f"""
-                Analyze this business website and extract key information:
-                
-                Title: {title}
-                Headings: {', '.join(headings[:5])}
-                Content: {content[:800]}
-                
-                What does this business do? Provide a brief summary.
-                """
-                
-                analysis_result = analyze_with_gemini(analysis_prompt, [])
-                if analysis_result and analysis_result.get('response'):
-                    ai_analysis = analysis_result['response']
-            except Exception as ai_error:
-                print(f"AI analysis failed: {ai_error}")
-                ai_analysis = f"Business analysis: {basic_summary}"
-            
-            # Auto-fill business information if we're at step 1 or 2
-            if session_state['workflow_step'] <= 2:
-                business_desc = f"{title}"
-                session_state['what_they_sell'] = business_desc
-                session_state['workflow_step'] = 3
-                
-                response = f"""
+            page = self._scrape_urls(urls)
+        except Exception as e:
+            print(f"URL scraping failed: {str(e)}")
+            return {'url': urls[0], 'error': self._url_error_message(e)}
+        
+        page['ai_analysis'] = ''.join(self._iter_ai_analysis(page, False))
+        return page
+    
+    def apply_url_analysis(self, result: Dict, session_state: Dict) -> str:
+        """Apply a fetch_url_analysis result to the session and return the reply text"""
+        if result.get('error'):
+            return result['error']
+        for scraped in result.get('pages', [result]):
+            self._store_page(scraped, session_state)
+        auto_fill = session_state['workflow_step'] <= 2
+        return (self._url_header(result, auto_fill) + result['ai_analysis'] +
+                self._apply_ai_analysis(result['ai_analysis'], result, session_state, auto_fill))
+    
+    def collect_finished_jobs(self, session_state: Dict) -> List[str]:
+        """Apply every finished background job to the session and return their replies in order"""
+        replies = []
+        pending = []
+        executor = get_job_executor()
+        for job in session_state.get('pending_jobs', []):
+            outcome = executor.pop_result(job['id'])
+            if outcome is None:
+                pending.append(job)
+            elif outcome['status'] == 'done':
+                replies.append(self.apply_url_analysis(outcome['result'], session_state))
+            else:
+                replies.append(f"❌ **Couldn't finish analyzing** {job['url']}. No worries, let's continue with the questions!")
+        session_state['pending_jobs'] = pending
+        return replies
+    
+    def _scrape_page(self, url: str) -> Dict:
+        """Scrape a URL and summarize it without AI; raises if the page cannot be fetched"""
+        print(f"Attempting to scrape: {url}")
+        
+        # STEP 1: Pure Python scraping (independent of AI)
+        scraped_data = scrape_url(url, max_bytes=self.URL_SCRAPE_MAX_BYTES,
+                                  deadline=self.URL_SCRAPE_DEADLINE)
+        print(f"Successfully scraped: {scraped_data.get('title', 'No title')}")
+        return self._build_page(url, scraped_data)
+    
+    def _scrape_urls(self, urls: List[str]) -> Dict:
+        """Scrape one URL, or several concurrently and merged into one combined page
+        
+        Raises only when no page could be fetched.
+        """
+        if len(urls) == 1:
+            return self._crawl_site(urls[0]) if self.CRAWL_SITE else self._scrape_page(urls[0])
+        
+        # Every page starts at once with the same budget, so the batch takes as long as the slowest page
+        results = {}
+        for result in scrape_many(urls, concurrency=len(urls), per_host_limit=len(urls), politeness_delay=0,
+                                  max_bytes=self.URL_SCRAPE_MAX_BYTES, deadline=self.URL_SCRAPE_DEADLINE):
+            results[result['url']] = result
+        pages = [self._build_page(url, results[url]['data']) for url in urls if not results[url]['error']]
+        failed = [url for url in urls if results[url]['error']]
+        if not pages:
+            raise Exception(results[urls[0]]['error'])
+        print(f"Successfully scraped {len(pages)} of {len(urls)} pages")
+        return self._combine_pages(pages, failed)
+    
+    def _crawl_site(self, url: str) -> Dict:
+        """Crawl the site behind url and merge what was found like a multi-URL paste"""
+        print(f"Crawling site from: {url}")
+        crawl = crawl_site(url)
+        pages = [self._build_page(page['url'], page['data']) for page in crawl['pages']]
+        print(f"Crawled {len(pages)} pages ({crawl['duplicates']} duplicates skipped)")
+        if len(pages) == 1:
+            return pages[0]
+        return self._combine_pages(pages, crawl['failed'])
+    
+    def _combine_pages(self, pages: List[Dict], failed: List[str]) -> Dict:
+        """Merge pages of one site into a single page-like dict for one analysis"""
+        share = self.MULTI_PAGE_CONTENT_CHARS // len(pages)
+        return {
+            'url': pages[0]['url'],
+            'pages': pages,
+            'failed': failed,
+            'title': pages[0]['title'],
+            'headings': [heading for page in pages for heading in page['headings'][:3]],
+            'content': '\n\n'.join(f"[{page['title']} - {page['url']}]\n{page['content'][:share]}" for page in pages),
+            'basic_summary': '\n\n'.join(page['basic_summary'] for page in pages)
+        }
+    
+    def _build_page(self, url: str, scraped_data: Dict) -> Dict:
+        # STEP 2: Process scraped data without AI first
+        title = scraped_data.get('title', 'Unknown Business')
+        content = scraped_data.get('content', '')
+        headings = scraped_data.get('headings', [])
+        
+        # Create basic business summary from scraped data
+        basic_summary = f"Website: {title}"
+        if headings:
+            basic_summary += f"\nKey sections: {', '.join(headings[:3])}"
+        if content:
+            basic_summary += f"\nContent preview: {content[:200]}..."
+        
+        return {
+            'url': url,
+            'scraped_data': scraped_data,
+            'title': title,
+            'content': content,
+            'headings': headings,
+            'basic_summary': basic_summary
+        }
+    
+    def _store_page(self, page: Dict, session_state: Dict) -> None:
+        """Record a scraped page in the session and feed it to the knowledge base"""
+        # Store scraped data (works without AI)
+        session_state['kyb_data']['scraped_data'].append({
+            'url': page['url'],
+            'title': page['title'],
+            'basic_summary': page['basic_summary'],
+            'full_content': page['content'][:1000],  # Store first 1000 chars
+            'truncated': page['scraped_data'].get('truncated', False)
+        })
+        
+        # Feed the knowledge base in the background
+        ingest_scraped_page(page['url'], page['scraped_data'], session_state.get('session_id'))
+    
+    def _url_header(self, page: Dict, auto_fill: bool) -> str:
+        if page.get('pages'):
+            return self._multi_page_header(page, auto_fill)
+        if auto_fill:
+            return f"""
 ✅ **Website Successfully Scraped & Analyzed!**
 
-**Website:** {title}
+**Website:** {page['title']}
 
 **Extracted Content:**
-{basic_summary}
+{page['basic_summary']}
 
 **AI Analysis:**
-{ai_analysis}
-
-Let me create your business profile now...
 """
-            else:
-                # Add as additional context to existing profile
-                session_state['kyb_data']['business_understanding'].append(f"Website insight: {ai_analysis[:100]}...")
-                response = f"""
+        return f"""
 ✅ **Website Information Added to Profile!** 
 
-**{title}**
+**{page['title']}**
 
-**Analysis:** {ai_analysis}
+**Analysis:** """
+    
+    def _multi_page_header(self, page: Dict, auto_fill: bool) -> str:
+        listing = '\n'.join(f"- {scraped['title']} ({scraped['url']})" for scraped in page['pages'])
+        if page['failed']:
+            listing += f"\n- Couldn't read: {', '.join(page['failed'])}"
+        if auto_fill:
+            return f"""
+✅ **{len(page['pages'])} Pages Successfully Scraped & Analyzed!**
+
+**Pages:**
+{listing}
+
+**AI Analysis:**
 """
+        return f"""
+✅ **{len(page['pages'])} Pages Added to Profile!** 
+
+{listing}
+
+**Analysis:** """
+    
+    def _apply_ai_analysis(self, ai_analysis: str, page: Dict, session_state: Dict, auto_fill: bool) -> str:
+        """Fold the analysis into the session and return the closing text of the reply"""
+        if auto_fill:
+            session_state['what_they_sell'] = f"{page['title']}"
+            session_state['workflow_step'] = 3
+            return "\n\nLet me create your business profile now...\n"
+        # Add as additional context to existing profile
+        session_state['kyb_data']['business_understanding'].append(f"Website insight: {ai_analysis[:100]}...")
+        return "\n"
+    
+    def _analysis_cache_key(self, page: Dict) -> str:
+        """Cache key for a page analysis: the canonical URLs and content, whoever asks"""
+        fingerprint = hashlib.sha256()
+        for part in [cache_key(scraped['url']) for scraped in page.get('pages', [page])] + [page['content']]:
+            fingerprint.update(part.encode('utf-8'))
+            fingerprint.update(b'\0')
+        return f"page-analysis:{fingerprint.hexdigest()}"
+    
+    def _iter_ai_analysis(self, page: Dict, stream: bool) -> Iterator[str]:
+        """Yield the AI analysis of a scraped (or combined) page and return its full text
+        
+        The prompt holds only the page, so every session analyzing it shares one cached answer.
+        """
+        title, headings = page['title'], page['headings']
+        ai_analysis = "AI analysis unavailable - using basic content extraction"
+        streamed = False
+        try:
+            if page.get('pages'):
+                analysis_prompt = f"""
+                Analyze these {len(page['pages'])} pages from one business website together and extract key information:
+                
+                Pages: {', '.join(scraped['title'] for scraped in page['pages'])}
+                Headings: {', '.join(headings[:8])}
+                Content:
+                {page['content']}
+                
+                What does this business do? Provide one brief combined summary.
+                """
+            else:
+                analysis_prompt = f"""
+                Analyze this business website and extract key information:
+                
+                Title: {title}
+                Headings: {', '.join(headings[:5])}
+                Content: {page['content'][:800]}
+                
+                What does this business do? Provide a brief summary.
+                """
             
-        except Exception as e:
-            print(f"URL scraping failed: {str(e)}")
-            # Provide more specific error message
-            if "SSL" in str(e):
-                response = f"❌ **SSL Certificate Issue** with that website. This is common with some sites. Please continue with our questions instead!"
-            elif "connect" in str(e).lower():
-                response = f"❌ **Cannot connect** to that website. It might be down or restricted. Let's continue with our questions!"
-            elif "timeout" in str(e).lower():
-                response = f"❌ **Website took too long** to respond. Let's continue with our questions instead!"
+            if stream:
+                analysis_result = yield from stream_with_gemini(analysis_prompt, [], cache_key=self._analysis_cache_key(page))
+                streamed = bool(analysis_result and analysis_result.get('response'))
             else:
-                response = f"❌ **Couldn't access that website** ({str(e)[:50]}). No worries, let's continue with the questions!"
-        
-        return response, session_state
+                analysis_result = analyze_with_gemini(analysis_prompt, [], cache_key=self._analysis_cache_key(page))
+            if analysis_result and analysis_result.get('response'):
+                ai_analysis = analysis_result['response']
+        except Exception as ai_error:
+            print(f"AI analysis failed: {ai_error}")
+            ai_analysis = f"Business analysis: {page['basic_summary']}"
+        
+        if not streamed:
+            yield ai_analysis
+        return ai_analysis
+    
+    def _url_error_message(self, error: Exception) -> str:
+        """Explain a failed scrape in a friendly way"""
+        # Provide more specific error message
+        if "SSL" in str(error):
+            return f"❌ **SSL Certificate Issue** with that website. This is common with some sites. Please continue with our questions instead!"
+        elif "connect" in str(error).lower():
+            return f"❌ **Cannot connect** to that website. It might be down or restricted. Let's continue with our questions!"
+        elif "timeout" in str(error).lower():
+            return f"❌ **Website took too long** to respond. Let's continue with our questions instead!"
+        else:
+            return f"❌ **Couldn't access that website** ({str(error)[:50]}). No worries, let's continue with the questions!"
     
-    def _ongoing_conversation(self, user_input: str, session_state: Dict) -> Tuple[str, Dict]:
-        """Handle conversation after workflow completion"""
-        kyb_data = session_state.get('kyb_data', {})
+    def _ongoing_conversation(self, user_input: str, session_state: Dict) -> Tuple[str, str]:
+        """Handle conversation after workflow completion
+        
+        Gemini answers with the session's KYB facts, running conversation summary
+        and knowledge-base snippets as context; the keyword replies below cover
+        for it when it is unavailable.
+        """
         business = session_state.get('what_they_sell', 'your business')
         
+        context, _ = build_context(user_input, session_state)
+        result = analyze_with_gemini(user_input, [], context)
+        # Fallback replies carry no prompt_stats
+        if result.get('prompt_stats') and result.get('response'):
+            return str(result['response']), 'replied'
+        
         # Simple contextual responses based on keywords
         if any(word in user_input.lower() for word in ['help', 'assistance', 'support']):
             response = f"Based on your **{business}** profile, I can help you with strategy, marketing, technical challenges, or business development. What specific area interests you?"
@@ -625,4 +663,18 @@ Let me create your business profile now...
         else:
             response = f"Regarding your question about **{user_input}** - based on your **{business}** profile, I can provide targeted guidance. What specific aspect would you like me to focus on?"
         
-        return response, session_state
\ No newline at end of file
+        return response, 'replied'
+
+
+workflow_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_workflow_manager() -> WorkflowManager:
+    """Return the WorkflowManager shared by every session, creating it on first use"""
+    global workflow_manager
+    if workflow_manager is None:
+        with _manager_lock:
+            if workflow_manager is None:
+                workflow_manager = WorkflowManager()
+    return workflow_manager
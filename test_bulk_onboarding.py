@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test headless bulk KYB onboarding from a CSV
+"""
+import sys
+import os
+import csv
+import json
+import tempfile
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.bulk_onboarding import ANSWER_COLUMNS, onboard_prospect, run_bulk_onboarding
+from services.kyb_repository import get_kyb_repository
+
+FIELDS = ['id', 'url', 'what_they_sell', 'details'] + ANSWER_COLUMNS
+
+
+def prospect(i, challenges='Hiring engineers'):
+    return {
+        'id': f'prospect-{i}', 'url': '', 'what_they_sell': f'Bulk widgets {i}',
+        'details': 'Widgets made to order', 'features': 'Fast delivery', 'goals': 'Double revenue',
+        'challenges': challenges, 'audience': 'Small shops', 'success': '100 customers'
+    }
+
+
+def write_csv(rows):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'prospects.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path, os.path.join(directory, 'checkpoint.jsonl')
+
+
+@pytest.mark.usefixtures('kyb_tmp_dir')
+def test_prospect_answers_reach_the_kyb_store():
+    result = onboard_prospect(prospect(0))
+    # Step 8 wants two challenges but the workflow only asks for one, so the run stops cleanly
+    assert result['status'] == 'incomplete'
+    assert result['turns'] < 40
+    assert 0 < result['completeness'] < 1
+
+    document = get_kyb_repository().load(result['kyb_filepath'])
+    assert document['status'] == 'incomplete'
+    assert document['source'] == 'bulk_onboarding'
+    assert document['business'] == 'Bulk widgets 0'
+    # Each answer is given once, and every question is reached without replaying the product details
+    assert document['kyb_data']['business_understanding'] == [
+        'Product details: Widgets made to order', 'Special features: Fast delivery', 'Target audience: Small shops'
+    ]
+    assert document['kyb_data']['constraints'] == ['Hiring engineers']
+    assert document['kyb_data']['objectives'] == ['Double revenue', 'Success metric: 100 customers']
+
+    # Blank answers stop the session early instead of inventing data
+    partial = onboard_prospect(prospect(1, challenges=''))
+    assert partial['status'] == 'incomplete'
+    assert get_kyb_repository().load(partial['kyb_filepath'])['kyb_data']['constraints'] == []
+
+
+@pytest.mark.usefixtures('kyb_tmp_dir')
+def test_run_resumes_from_checkpoint():
+    rows = [prospect(i) for i in range(10, 16)]
+    csv_path, checkpoint_path = write_csv(rows)
+
+    first = run_bulk_onboarding(csv_path, checkpoint_path, concurrency=3, limit=4)
+    assert first['processed'] == 4 and first['failed'] == 0
+    assert first['sessions_per_minute'] > 0
+
+    # A crash can leave half a line behind; it must not break the resume
+    with open(checkpoint_path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "prosp')
+
+    second = run_bulk_onboarding(csv_path, checkpoint_path, concurrency=3)
+    assert second['skipped'] == 4
+    assert second['processed'] == 2
+
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        keys = [json.loads(line)['key'] for line in f if line.endswith('}\n')]
+    assert sorted(set(keys)) == sorted(row['id'] for row in rows)
+
+
+if __name__ == "__main__":
+    from conftest import isolate_kyb_files
+    for test in (test_prospect_answers_reach_the_kyb_store, test_run_resumes_from_checkpoint):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            isolate_kyb_files(monkeypatch, tempfile.mkdtemp())
+            test()
+    print("✅ Bulk onboarding tests passed")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test ChromaDB ingestion and retrieval caching with an in-memory collection
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import chroma_service
+from services.chroma_service import CachedEmbeddingFunction, IngestionPipeline, chunk_text
+
+
+class FakeCollection:
+    """Records add() batches the way a Chroma collection would receive them"""
+
+    def __init__(self):
+        self.documents = {}
+        self.add_calls = []
+
+    def get(self, ids, include=None):
+        return {'ids': [doc_id for doc_id in ids if doc_id in self.documents]}
+
+    def add(self, ids, documents, metadatas):
+        self.add_calls.append(list(ids))
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self.documents[doc_id] = (document, metadata)
+
+    def query(self, query_embeddings, n_results, include=None):
+        self.query_calls = getattr(self, 'query_calls', 0) + 1
+        docs = [document for document, _ in self.documents.values()][:n_results]
+        return {
+            'documents': [docs for _ in query_embeddings],
+            'metadatas': [[{'source': 'test'} for _ in docs] for _ in query_embeddings],
+            'distances': [[0.1 * i for i in range(len(docs))] for _ in query_embeddings]
+        }
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, input):
+        self.texts.extend(input)
+        return [[float(len(text)), 1.0] for text in input]
+
+
+def use_fake_chroma():
+    collection = FakeCollection()
+    embedder = CountingEmbedder()
+    chroma_service.client = object()
+    chroma_service.collection = collection
+    chroma_service._embedding_function = CachedEmbeddingFunction(embedder, 'fake-model')
+    chroma_service.mark_collection_changed()
+    return collection, embedder
+
+
+def test_chunk_text_prefers_paragraph_breaks():
+    text = '\n\n'.join(f"Paragraph {i}. " + 'word ' * 60 for i in range(6))
+    chunks = chunk_text(text, chunk_size=800, overlap=100)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 800 for chunk in chunks)
+    assert chunks[0].startswith('Paragraph 0.')
+    assert chunk_text('short text') == ['short text']
+
+
+def test_documents_are_batched_and_deduplicated():
+    collection = FakeCollection()
+    pipeline = IngestionPipeline(collection=collection, flush_size=100, flush_interval=60)
+    for i in range(10):
+        assert pipeline.submit(f"Answer number {i}", {'source': 'kyb_answer'})
+    pipeline.submit("Answer number 3", {'source': 'kyb_answer'})
+    pipeline.flush()
+
+    assert len(collection.add_calls) == 1
+    assert len(collection.documents) == 10
+
+    # Content already in the collection is not added again
+    pipeline.submit("Answer number 3", {'source': 'kyb_answer'})
+    pipeline.flush()
+    assert len(collection.add_calls) == 1
+    assert pipeline.stats()['duplicates'] == 2
+
+
+def test_flush_size_and_interval_trigger_writes():
+    collection = FakeCollection()
+    pipeline = IngestionPipeline(collection=collection, flush_size=3, flush_interval=0.2)
+    for i in range(3):
+        pipeline.submit(f"Sized batch {i}")
+    pipeline.submit("Waits for the interval")
+
+    deadline = time.monotonic() + 2
+    while len(collection.documents) < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(collection.documents) == 4
+    assert len(collection.add_calls[0]) == 3
+
+
+def test_submit_does_not_wait_for_slow_writes():
+    class SlowCollection(FakeCollection):
+        def add(self, ids, documents, metadatas):
+            time.sleep(0.5)
+            super().add(ids, documents, metadatas)
+
+    pipeline = IngestionPipeline(collection=SlowCollection(), flush_size=1, flush_interval=60)
+    start = time.perf_counter()
+    for i in range(5):
+        pipeline.submit(f"Document {i}")
+    assert time.perf_counter() - start < 0.1
+
+
+def test_embedding_cache_only_embeds_new_texts():
+    embedder = CountingEmbedder()
+    embed = CachedEmbeddingFunction(embedder, 'fake-model')
+    first = embed(['pricing', 'customers'])
+    second = embed(['customers', 'pricing', 'about'])
+
+    assert embedder.texts == ['pricing', 'customers', 'about']
+    assert second[:2] == [first[1], first[0]]
+    assert embed.stats()['hits'] == 2
+
+
+def test_query_results_are_memoized_until_collection_changes():
+    collection, embedder = use_fake_chroma()
+    collection.add(['a'], ['Acme sells widgets'], [{'source': 'test'}])
+
+    assert chroma_service.query_chroma('what do they sell') == 'Acme sells widgets'
+    assert chroma_service.query_chroma('what do they sell') == 'Acme sells widgets'
+    assert collection.query_calls == 1
+
+    collection.add(['b'], ['Acme targets retailers'], [{'source': 'test'}])
+    chroma_service.mark_collection_changed()
+    assert 'Acme targets retailers' in chroma_service.query_chroma('what do they sell')
+    assert collection.query_calls == 2
+    # The query text itself was only embedded once
+    assert embedder.texts == ['what do they sell']
+
+
+def test_query_many_issues_one_call_for_all_misses():
+    collection, _ = use_fake_chroma()
+    collection.add(['a'], ['Acme sells widgets'], [{'source': 'test'}])
+    chroma_service.query_many(['pricing'])
+
+    results = chroma_service.query_many(['pricing', 'customers', 'about'])
+    assert len(results) == 3
+    assert results[1][0] == {'document': 'Acme sells widgets', 'metadata': {'source': 'test'}, 'distance': 0.0}
+    assert collection.query_calls == 2
+
+
+if __name__ == "__main__":
+    test_chunk_text_prefers_paragraph_breaks()
+    test_documents_are_batched_and_deduplicated()
+    test_flush_size_and_interval_trigger_writes()
+    test_submit_does_not_wait_for_slow_writes()
+    test_embedding_cache_only_embeds_new_texts()
+    test_query_results_are_memoized_until_collection_changes()
+    test_query_many_issues_one_call_for_all_misses()
+    print("✅ Chroma ingestion and retrieval tests passed")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test context assembly and prompt token budgeting
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import context_service, gemini_service
+from services.cache_store import PersistentCache
+from services.context_service import (build_context, estimate_tokens, pack_history, pack_snippets,
+                                      rank_snippets, truncate_to_tokens)
+from services.gemini_client import GeminiClient
+from services.gemini_service import ModelRegistry
+from services.workflow_service import ONGOING_STEP, WorkflowManager
+
+
+def make_session():
+    return {
+        'session_id': 'abc',
+        'what_they_sell': 'Payroll software for restaurants',
+        'kyb_data': {
+            'business_understanding': ['Sells payroll software to restaurant chains'] + [
+                f'Unrelated note number {i} about office furniture' for i in range(40)],
+            'objectives': ['Expand into hotel payroll'],
+            'constraints': ['Small sales team'],
+            'summary': ''
+        }
+    }
+
+
+def test_truncate_respects_budget():
+    text = 'word ' * 500
+    cut = truncate_to_tokens(text, 50)
+    assert estimate_tokens(cut) <= 50
+    assert cut.endswith('…')
+    assert truncate_to_tokens('short', 50) == 'short'
+
+
+def test_ranking_prefers_relevant_snippets():
+    ranked = rank_snippets('restaurant payroll', [
+        {'text': 'We sell office chairs', 'source': 'kyb'},
+        {'text': 'Payroll for every restaurant', 'source': 'kyb'},
+        {'text': 'payroll for every restaurant', 'source': 'kyb'}
+    ])
+    assert len(ranked) == 2
+    assert ranked[0]['text'] == 'Payroll for every restaurant'
+
+
+def test_build_context_stays_within_budget():
+    context, stats = build_context('restaurant payroll', make_session(), token_budget=60,
+                                   use_knowledge_base=False)
+    assert stats['context_tokens'] <= 60
+    assert estimate_tokens(context) <= 60
+    assert stats['truncated']
+    assert 'Payroll software for restaurants' in context
+    assert 'furniture' not in context.split('\n')[0]
+
+    lines, used, truncated = pack_snippets(rank_snippets('x', [{'text': 'tiny', 'source': 'kyb'}]), 60)
+    assert lines == ['- tiny'] and not truncated
+
+
+def test_history_keeps_newest_turns_within_budget():
+    history = [{'role': 'user', 'content': f'message {i} ' + 'x' * 2000} for i in range(10)]
+    text, used = pack_history(history, token_budget=200)
+    assert used <= 200
+    assert 'message 9' in text
+    assert 'message 4' not in text
+    assert pack_history([], 200) == ('', 0)
+
+
+class RecordingModel:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        return FakeResponse('{"response": "Lead with hotel payroll.", "knowledge_update": null}')
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_ongoing_conversation_prompt_carries_context():
+    model = RecordingModel()
+    session = dict(make_session(), workflow_step=ONGOING_STEP,
+                   conversation_summary='They asked about hotel payroll pricing last week')
+    kb_hit = {'text': 'Hotel payroll needs tip pooling support', 'source': 'knowledge_base', 'similarity': 0.9}
+    original = (gemini_service.model_registry, gemini_service.gemini_client, gemini_service._response_cache,
+                context_service._chroma_snippets, context_service.USE_KNOWLEDGE_BASE)
+    gemini_service.model_registry = ModelRegistry(['fake'], factory=lambda name: model)
+    gemini_service.gemini_client = GeminiClient(rate=0)
+    gemini_service._response_cache = PersistentCache(os.path.join(tempfile.mkdtemp(), 'gemini_cache.db'),
+                                                     table='responses')
+    context_service._chroma_snippets = lambda query, session_id, exclude_urls: [kb_hit]
+    context_service.USE_KNOWLEDGE_BASE = True
+    try:
+        reply, _ = WorkflowManager().process_workflow_step('How should we price hotel payroll?', session)
+    finally:
+        (gemini_service.model_registry, gemini_service.gemini_client, gemini_service._response_cache,
+         context_service._chroma_snippets, context_service.USE_KNOWLEDGE_BASE) = original
+
+    assert reply == 'Lead with hotel payroll.'
+    assert len(model.prompts) == 1
+    assert 'Earlier conversation: They asked about hotel payroll pricing last week' in model.prompts[0]
+    assert 'Hotel payroll needs tip pooling support' in model.prompts[0]
+    assert 'Expand into hotel payroll' in model.prompts[0]
+
+
+if __name__ == "__main__":
+    test_truncate_respects_budget()
+    test_ranking_prefers_relevant_snippets()
+    test_build_context_stays_within_budget()
+    test_history_keeps_newest_turns_within_budget()
+    test_ongoing_conversation_prompt_carries_context()
+    print("✅ Context service tests passed")
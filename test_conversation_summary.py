@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test rolling conversation summarization
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.context_service import estimate_tokens
+from services.kyb_service import KYBManager
+from services.summary_service import (RECENT_TURNS, SUMMARY_BATCH, SUMMARY_TOKEN_BUDGET,
+                                      compact_history, fold_summary)
+
+
+def turn(i, role='user'):
+    return {'role': role, 'content': f"Message {i} about **pricing**. Extra detail that is dropped."}
+
+
+def test_short_conversations_are_untouched():
+    messages = [turn(i) for i in range(RECENT_TURNS + SUMMARY_BATCH - 1)]
+    recent, summary, folded = compact_history(messages)
+    assert recent is messages
+    assert summary == '' and folded == 0
+
+
+def test_long_sessions_stay_bounded():
+    messages, summary, total_folded = [], '', 0
+    for i in range(500):
+        messages.append(turn(i, 'user' if i % 2 == 0 else 'assistant'))
+        messages, summary, folded = compact_history(messages, summary)
+        total_folded += folded
+        assert len(messages) < RECENT_TURNS + SUMMARY_BATCH
+
+    assert total_folded + len(messages) == 500
+    assert estimate_tokens(summary) <= SUMMARY_TOKEN_BUDGET
+    assert messages[-1]['content'].startswith('Message 499')
+    # Newest folded turns survive; markup and trailing sentences do not
+    assert 'Message 470 about pricing.' in summary
+    assert 'Extra detail' not in summary
+    # User lines outlive assistant lines
+    assert fold_summary('assistant: a\nuser: b', [], token_budget=3) == 'user: b'
+
+
+def test_kyb_file_history_is_folded():
+    manager = KYBManager(kyb_dir=tempfile.mkdtemp())
+    path = manager.create_kyb_file('summary-session', {'what_they_sell': 'Bakeries'})
+    for i in range(100):
+        manager.update_kyb_file(path, {'conversation_entry': turn(i)})
+
+    data = manager.get_kyb_data(path)
+    assert len(data['conversation_history']) < RECENT_TURNS + SUMMARY_BATCH
+    assert data['conversation_summary']
+    assert manager.summarize_kyb(path)['total_conversations'] == 100
+
+
+if __name__ == "__main__":
+    test_short_conversations_are_untouched()
+    test_long_sessions_stay_bounded()
+    test_kyb_file_history_is_folded()
+    print("✅ Conversation summary tests passed")
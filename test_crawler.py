@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Test the same-site crawler against a small local website
+"""
+import sys
+import os
+import tempfile
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import crawler_service, gemini_service
+from services.crawler_service import crawl_site, relevance_score, same_site_url, site_key, sitemap_urls
+from services.gemini_client import GeminiClient
+from services.gemini_service import ModelRegistry
+from services.workflow_service import WorkflowManager
+
+pytestmark = pytest.mark.usefixtures('temp_caches', 'loopback_allowed')
+
+HOST = '127.0.0.1'
+
+NAV = ('<nav><a href="/about">About us</a> <a href="/pricing">Pricing</a> <a href="/blog/2020/01/hello">Blog</a>'
+       ' <a href="/login">Log in</a> <a href="/about-us">Company</a> <a href="https://elsewhere.test/">Partner</a>'
+       ' <a href="/brochure.pdf">Brochure</a></nav>')
+
+
+def page(title, text):
+    return (f"<html><head><title>{title}</title></head><body>{NAV}<h1>{title}</h1>"
+            f"<p>{text}</p></body></html>")
+
+
+ABOUT_TEXT = 'Acme was founded in 2010 to build widgets that automate the back office for small businesses.'
+SITE = {
+    '/': page('Acme Widgets', 'Acme sells widgets that help small businesses automate their back office.'),
+    '/about': page('About Acme', ABOUT_TEXT),
+    # The same page published under a second path
+    '/about-us': page('About Acme', ABOUT_TEXT),
+    '/pricing': page('Acme Pricing', 'Plans start at forty dollars per month for up to ten users of the widget suite.'),
+    '/customers': page('Acme Customers', 'Over two thousand bakeries, clinics and law firms run their billing on Acme.'),
+    '/blog/2020/01/hello': page('Hello world', 'Our very first blog post about nothing in particular at all, really.'),
+    '/login': page('Log in', 'Please sign in with your account email and password to continue here.'),
+}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    requested = []
+
+    def do_GET(self):
+        SiteHandler.requested.append(self.path)
+        if self.path == '/sitemap.xml':
+            body = (f"<urlset><url><loc>http://{self.headers['Host']}/customers</loc></url>"
+                    f"<url><loc>http://{self.headers['Host']}/login</loc></url></urlset>").encode('utf-8')
+            content_type = 'application/xml'
+        elif self.path in SITE:
+            body, content_type = SITE[self.path].encode('utf-8'), 'text/html; charset=utf-8'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def with_site(test):
+    server = ThreadingHTTPServer((HOST, 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    SiteHandler.requested = []
+    try:
+        test(f'http://{HOST}:{server.server_port}')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_link_filtering_and_scoring():
+    site = site_key('https://www.acme-widgets.test/')
+    assert site == 'acme-widgets.test'
+    assert same_site_url('https://www.acme-widgets.test/', '/about#team', site) == 'https://www.acme-widgets.test/about'
+    assert same_site_url('https://www.acme-widgets.test/', 'https://acme-widgets.test/pricing', site)
+    assert same_site_url('https://www.acme-widgets.test/', 'https://other.test/about', site) is None
+    assert same_site_url('https://www.acme-widgets.test/', 'mailto:hi@acme-widgets.test', site) is None
+    assert same_site_url('https://www.acme-widgets.test/', '/deck.pdf', site) is None
+
+    assert relevance_score('https://acme-widgets.test/pricing') > relevance_score('https://acme-widgets.test/blog/post')
+    assert relevance_score('https://acme-widgets.test/x', 'About us') > 0
+    assert relevance_score('https://acme-widgets.test/privacy') < 0
+
+
+def test_sitemap_index_only_follows_same_site_sitemaps():
+    sitemaps = {
+        'https://acme-widgets.test/sitemap.xml': (
+            '<sitemapindex><sitemap><loc>https://www.acme-widgets.test/sitemap-pages.xml</loc></sitemap>'
+            '<sitemap><loc>https://elsewhere.test/sitemap.xml</loc></sitemap>'
+            '<sitemap><loc>http://169.254.169.254/latest/sitemap.xml</loc></sitemap></sitemapindex>'),
+        'https://www.acme-widgets.test/sitemap-pages.xml': (
+            '<urlset><url><loc>https://acme-widgets.test/pricing</loc></url></urlset>')
+    }
+    fetched = []
+
+    def fake_fetch_text(url, deadline):
+        fetched.append(url)
+        return sitemaps[url]
+
+    original = crawler_service.fetch_text
+    crawler_service.fetch_text = fake_fetch_text
+    try:
+        urls = sitemap_urls('https://acme-widgets.test/', 'acme-widgets.test')
+    finally:
+        crawler_service.fetch_text = original
+    assert urls == ['https://acme-widgets.test/pricing']
+    assert fetched == list(sitemaps)
+
+
+def test_crawl_ranks_relevant_pages_and_skips_duplicates():
+    def check(base):
+        crawl = crawl_site(f'{base}/', max_pages=5, concurrency=4)
+        titles = [page['data']['title'] for page in crawl['pages']]
+
+        assert titles[0] == 'Acme Widgets'
+        assert set(titles[1:]) == {'About Acme', 'Acme Pricing', 'Acme Customers'}
+        assert crawl['duplicates'] == 1
+        assert '/login' not in SiteHandler.requested
+        assert '/blog/2020/01/hello' not in SiteHandler.requested
+        assert '/brochure.pdf' not in SiteHandler.requested
+
+    with_site(check)
+
+
+def test_crawl_respects_page_and_byte_budgets():
+    def check(base):
+        single = crawl_site(f'{base}/', max_pages=1)
+        assert len(single['pages']) == 1
+        assert '/sitemap.xml' not in SiteHandler.requested
+
+        small = crawl_site(f'{base}/', max_pages=10, max_bytes=1, use_sitemap=False)
+        assert len(small['pages']) == 1
+
+    with_site(check)
+
+
+def test_workflow_crawl_mode_feeds_url_input():
+    class FakeModel:
+        prompts = []
+
+        def generate_content(self, prompt, stream=False):
+            FakeModel.prompts.append(prompt)
+            return FakeResponse('{"response": "Acme sells widgets.", "knowledge_update": null}')
+
+    def check(base):
+        manager = WorkflowManager()
+        manager.CRAWL_SITE = True
+        session = {}
+        manager.process_workflow_step('', session)
+        reply, session = manager.process_workflow_step(f'{base}/', session)
+
+        stored = [page['title'] for page in session['kyb_data']['scraped_data']]
+        assert stored[0] == 'Acme Widgets' and 'Acme Pricing' in stored
+        assert len(FakeModel.prompts) == 1 and 'Acme Pricing' in FakeModel.prompts[0]
+        assert 'Pages' in reply
+
+    original = (gemini_service.model_registry, gemini_service.gemini_client)
+    gemini_service.model_registry = ModelRegistry(['fake'], factory=lambda name: FakeModel())
+    gemini_service.gemini_client = GeminiClient(rate=0)
+    try:
+        with_site(check)
+    finally:
+        gemini_service.model_registry, gemini_service.gemini_client = original
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+if __name__ == "__main__":
+    from conftest import allow_test_host, use_temp_caches
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        use_temp_caches(monkeypatch, tempfile.mkdtemp())
+        allow_test_host(monkeypatch, HOST)
+        test_link_filtering_and_scoring()
+        test_sitemap_index_only_follows_same_site_sitemaps()
+        test_crawl_ranks_relevant_pages_and_skips_duplicates()
+        test_crawl_respects_page_and_byte_budgets()
+        test_workflow_crawl_mode_feeds_url_input()
+    print("✅ All crawler tests passed")
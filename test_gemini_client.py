@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Test the Gemini client's rate limiter, deadlines, retries and circuit breaker
+"""
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from google.api_core import exceptions as api_exceptions
+from services import gemini_service
+from services.gemini_client import (CLOSED, HALF_OPEN, OPEN, CircuitOpen, DeadlineExceeded, GeminiClient,
+                                    Throttled, TokenBucket, is_retryable)
+from services.gemini_service import ModelRegistry
+from services.tracing import tracer
+
+
+class Flaky:
+    """Fails with the given errors in turn, then answers"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def fast_client(**options):
+    options.setdefault('rate', 0)
+    options.setdefault('backoff_base', 0.001)
+    options.setdefault('backoff_max', 0.002)
+    return GeminiClient(**options)
+
+
+def test_retryable_errors():
+    assert is_retryable(api_exceptions.ServiceUnavailable("Service Unavailable"))
+    assert is_retryable(api_exceptions.ResourceExhausted("Resource exhausted"))
+    assert is_retryable(DeadlineExceeded("slow"))
+    assert is_retryable(ConnectionResetError("reset by peer"))
+    assert not is_retryable(api_exceptions.InvalidArgument("Invalid argument"))
+    assert not is_retryable(api_exceptions.NotFound("models/x is not found"))
+    # Status-like words in ordinary error text do not count
+    assert not is_retryable(Exception("quota 5000 exceeded"))
+    assert not is_retryable(ValueError("invalid connection string"))
+
+
+def test_retries_transient_errors_then_succeeds():
+    client = fast_client(max_retries=2)
+    flaky = Flaky(api_exceptions.ServiceUnavailable("unavailable"), api_exceptions.InternalServerError("internal"))
+
+    assert client.call(flaky) == 'ok'
+    assert flaky.calls == 3
+    stats = client.stats()
+    assert stats['retries'] == 2 and stats['successes'] == 1 and stats['breaker_state'] == CLOSED
+
+
+def test_non_retryable_error_is_raised_at_once():
+    client = fast_client(max_retries=3)
+    flaky = Flaky(api_exceptions.InvalidArgument("invalid argument"))
+    try:
+        client.call(flaky)
+        assert False, "expected the 400 to propagate"
+    except Exception as e:
+        assert '400' in str(e)
+    assert flaky.calls == 1
+    assert client.stats()['failures'] == 1
+
+
+def test_deadline_cuts_off_slow_call():
+    client = fast_client(max_retries=0)
+    started = time.perf_counter()
+    try:
+        client.call(time.sleep, 0.5, deadline=0.05)
+        assert False, "expected the deadline to fire"
+    except DeadlineExceeded:
+        pass
+    assert time.perf_counter() - started < 0.3
+    assert client.stats()['timeouts'] == 1
+    client.shutdown()
+
+
+def test_breaker_opens_and_recovers():
+    client = fast_client(max_retries=0, breaker_threshold=3, breaker_reset=0.05)
+    for _ in range(3):
+        try:
+            client.call(Flaky(api_exceptions.ServiceUnavailable("unavailable")))
+        except Exception:
+            pass
+    assert client.breaker.state == OPEN
+
+    untouched = Flaky()
+    try:
+        client.call(untouched)
+        assert False, "an open breaker should reject calls"
+    except CircuitOpen:
+        pass
+    assert untouched.calls == 0
+
+    time.sleep(0.06)
+    assert client.breaker.allow() and client.breaker.state == HALF_OPEN
+    client.breaker.release()
+    assert client.call(Flaky()) == 'ok'
+    stats = client.stats()
+    assert stats['breaker_state'] == CLOSED and stats['breaker_opened'] == 1 and stats['rejected_open'] == 1
+
+
+def test_in_flight_cap():
+    client = fast_client(max_in_flight=2, max_retries=0)
+    peak, running = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=client.call, args=(work,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert client.stats()['in_flight'] == 0
+
+
+def test_stalled_stream_hits_the_deadline_and_trips_the_breaker():
+    client = fast_client(max_retries=0, breaker_threshold=1)
+
+    def stalls_after_first_chunk():
+        yield 'first'
+        time.sleep(0.3)
+        yield 'late'
+
+    stream = client.stream(stalls_after_first_chunk, deadline=0.1)
+    assert next(stream) == 'first'
+    started = time.perf_counter()
+    try:
+        next(stream)
+        assert False, "expected the deadline to fire mid-stream"
+    except DeadlineExceeded:
+        pass
+    assert time.perf_counter() - started < 0.2
+    assert client.breaker.state == OPEN
+    # The abandoned read keeps its slot until the model returns
+    assert client.stats()['in_flight'] == 1
+    time.sleep(0.35)
+    assert client.stats()['in_flight'] == 0
+    client.shutdown()
+
+
+def test_stream_holds_its_slot_until_closed():
+    client = fast_client(max_in_flight=1, max_retries=0)
+    stream = client.stream(lambda: iter(['a', 'b', 'c']))
+    assert next(stream) == 'a'
+    try:
+        list(client.stream(lambda: iter(['x']), deadline=0.05))
+        assert False, "a second stream should wait for the slot"
+    except Throttled:
+        pass
+    assert list(stream) == ['b', 'c']
+    assert client.stats()['in_flight'] == 0
+    assert list(client.stream(lambda: iter(['x']))) == ['x']
+
+    early = client.stream(lambda: iter(['a', 'b']))
+    next(early)
+    early.close()
+    stats = client.stats()
+    assert stats['in_flight'] == 0 and stats['successes'] == 2 and stats['breaker_state'] == CLOSED
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(rate=100, burst=1)
+    started = time.perf_counter()
+    for _ in range(6):
+        assert bucket.acquire(time.monotonic() + 1)
+    assert time.perf_counter() - started >= 0.04
+    empty = TokenBucket(rate=0.5, burst=1)
+    empty.acquire(time.monotonic() + 1)
+    assert not empty.acquire(time.monotonic() + 0.1)
+
+
+def test_open_circuit_falls_back_without_calling_model():
+    class CountingModel:
+        calls = 0
+
+        def generate_content(self, prompt, stream=False):
+            CountingModel.calls += 1
+            raise api_exceptions.ServiceUnavailable("unavailable")
+
+    original = (gemini_service.model_registry, gemini_service.gemini_client)
+    gemini_service.model_registry = ModelRegistry(['fake'], factory=lambda name: CountingModel())
+    gemini_service.gemini_client = fast_client(max_retries=0, breaker_threshold=2, breaker_reset=60)
+    try:
+        results = [gemini_service.analyze_with_gemini(f'turn {i}', use_cache=False) for i in range(5)]
+        stats = gemini_service.get_client_stats()
+        metrics = tracer.prometheus_text()
+    finally:
+        gemini_service.model_registry, gemini_service.gemini_client = original
+
+    assert CountingModel.calls == 2
+    assert all(result['knowledge_update'] is None for result in results)
+    assert stats['breaker_state'] == OPEN and stats['rejected_open'] == 3
+    assert 'kyb_gemini_client_breaker_state_code 1' in metrics
+
+
+if __name__ == "__main__":
+    test_retryable_errors()
+    test_retries_transient_errors_then_succeeds()
+    test_non_retryable_error_is_raised_at_once()
+    test_deadline_cuts_off_slow_call()
+    test_breaker_opens_and_recovers()
+    test_in_flight_cap()
+    test_stalled_stream_hits_the_deadline_and_trips_the_breaker()
+    test_stream_holds_its_slot_until_closed()
+    test_token_bucket_paces_calls()
+    test_open_circuit_falls_back_without_calling_model()
+    print("✅ All Gemini client tests passed")
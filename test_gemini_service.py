@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test the Gemini model registry without touching the network
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import gemini_service
+from services.cache_store import PersistentCache
+from services.gemini_service import ModelRegistry
+
+
+def use_temp_response_cache():
+    cache = PersistentCache(os.path.join(tempfile.mkdtemp(), 'gemini_cache.db'), table='responses')
+    gemini_service._response_cache = cache
+    return cache
+
+
+# Keep test responses out of the real on-disk cache
+use_temp_response_cache()
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel that can pretend to be missing"""
+
+    def __init__(self, name, missing=False):
+        self.name = name
+        self.missing = missing
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        if self.missing:
+            raise Exception(f"404 models/{self.name} is not found for API version v1beta")
+        text = '{"response": "ok from %s", "knowledge_update": null}' % self.name
+        if stream:
+            return [FakeResponse(text[i:i + 4]) for i in range(0, len(text), 4)]
+        return FakeResponse(text)
+
+
+def test_registry_reuses_resolved_model():
+    """The factory should only run once for repeated lookups"""
+    built = []
+
+    def factory(name):
+        built.append(name)
+        return FakeModel(name)
+
+    registry = ModelRegistry(['model-a', 'model-b'], factory=factory)
+    first = registry.get_model()
+    second = registry.get_model()
+
+    assert first is second
+    assert built == ['model-a']
+    info = registry.info()
+    assert info['model_name'] == 'model-a'
+    assert info['resolution_seconds'] is not None
+
+
+def test_missing_model_is_evicted_and_next_candidate_used():
+    """A 'model not found' error should fall through to the next candidate"""
+    registry = ModelRegistry(['model-a', 'model-b'],
+                             factory=lambda name: FakeModel(name, missing=(name == 'model-a')))
+    original = gemini_service.model_registry
+    gemini_service.model_registry = registry
+    try:
+        result = gemini_service.analyze_with_gemini("hello")
+        assert result['response'] == 'ok from model-b'
+        assert registry.info()['model_name'] == 'model-b'
+        assert registry.info()['evictions'] == 1
+
+        # Later calls go straight to the surviving model
+        model_b = registry.get_model()
+        gemini_service.analyze_with_gemini("hello again")
+        assert model_b.calls == 2
+    finally:
+        gemini_service.model_registry = original
+
+
+def test_fallback_when_every_model_is_missing():
+    """Running out of candidates should return the canned response"""
+    registry = ModelRegistry(['model-a'], factory=lambda name: FakeModel(name, missing=True))
+    original = gemini_service.model_registry
+    gemini_service.model_registry = registry
+    try:
+        result = gemini_service.analyze_with_gemini("hello")
+        assert 'AI analysis is currently unavailable' in result['response']
+        assert registry.get_model() is None
+    finally:
+        gemini_service.model_registry = original
+
+
+def test_identical_prompts_are_served_from_cache():
+    """A repeated prompt should not reach the model again unless the cache is bypassed"""
+    cache = use_temp_response_cache()
+    registry = ModelRegistry(['model-a'], factory=lambda name: FakeModel(name))
+    original = gemini_service.model_registry
+    gemini_service.model_registry = registry
+    try:
+        model = registry.get_model()
+        first = gemini_service.analyze_with_gemini("Analyze acme.com")
+        second = gemini_service.analyze_with_gemini("Analyze acme.com")
+        assert first == second
+        assert model.calls == 1
+
+        gemini_service.analyze_with_gemini("Analyze acme.com", use_cache=False)
+        assert model.calls == 2
+
+        gemini_service.analyze_with_gemini("Analyze another.com")
+        assert model.calls == 3
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+    finally:
+        gemini_service.model_registry = original
+
+
+def test_cache_key_depends_on_model_name():
+    use_temp_response_cache()
+    registry_a = ModelRegistry(['model-a'], factory=lambda name: FakeModel(name))
+    registry_b = ModelRegistry(['model-b'], factory=lambda name: FakeModel(name))
+    original = gemini_service.model_registry
+    try:
+        gemini_service.model_registry = registry_a
+        assert gemini_service.analyze_with_gemini("hi")['response'] == 'ok from model-a'
+        gemini_service.model_registry = registry_b
+        assert gemini_service.analyze_with_gemini("hi")['response'] == 'ok from model-b'
+    finally:
+        gemini_service.model_registry = original
+
+
+def test_stream_yields_response_text_in_pieces():
+    use_temp_response_cache()
+    registry = ModelRegistry(['model-a'], factory=lambda name: FakeModel(name))
+    original = gemini_service.model_registry
+    gemini_service.model_registry = registry
+    try:
+        stream = gemini_service.stream_with_gemini("hello")
+        pieces = []
+        while True:
+            try:
+                pieces.append(next(stream))
+            except StopIteration as done:
+                result = done.value
+                break
+
+        assert len(pieces) > 1
+        assert ''.join(pieces) == 'ok from model-a'
+        assert result['response'] == 'ok from model-a'
+        assert result['knowledge_update'] is None
+        assert result['prompt_stats']['prompt_tokens'] > 0
+
+        # The streamed result is cached for the non-streaming path too
+        model = registry.get_model()
+        assert gemini_service.analyze_with_gemini("hello") == result
+        assert model.calls == 1
+    finally:
+        gemini_service.model_registry = original
+
+
+if __name__ == "__main__":
+    test_registry_reuses_resolved_model()
+    test_missing_model_is_evicted_and_next_candidate_used()
+    test_fallback_when_every_model_is_missing()
+    test_identical_prompts_are_served_from_cache()
+    test_cache_key_depends_on_model_name()
+    test_stream_yields_response_text_in_pieces()
+    print("✅ Gemini registry tests passed")
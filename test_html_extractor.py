@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test the single-pass HTML extractor against the BeautifulSoup extraction
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.html_extractor import PageExtractor, extract_page
+from services.scraper_service import _extract_with_soup
+
+PAGE = """<html><head><title> Acme &amp; Co </title>
+<meta property="og:description" content="OG text">
+<meta name="description" content="Acme sells widgets.">
+<script>var ignored = "this script text is long enough to count as a paragraph";</script>
+</head><body>
+<nav><p>Navigation links that are long enough to be a paragraph</p><h2>Menu heading</h2></nav>
+<h1>Widgets for everyone</h1>
+<h2>Our</h2>
+<p>Acme builds reliable widgets that help small businesses automate.</p>
+<span>Trusted by more than four hundred retailers across Europe.</span>
+<footer><p>Copyright notice that should never be extracted by us.</p></footer>
+</body></html>"""
+
+
+def test_matches_soup_extraction():
+    streamed = extract_page(PAGE)
+    souped = _extract_with_soup(PAGE.encode('utf-8'))
+
+    assert streamed['title'] == souped['title'] == 'Acme & Co'
+    assert streamed['meta_description'] == souped['meta_description'] == 'Acme sells widgets.'
+    assert streamed['headings'] == souped['headings'] == ['Widgets for everyone']
+    assert sorted(streamed['content'].split('\n')) == sorted(souped['content'].split('\n'))
+
+
+NESTED_PAGE = """<html><head><title>Nested</title></head><body>
+<div class="page"><div class="section">
+<p>Acme builds reliable widgets that help small businesses automate.</p>
+<p>Every widget ships with a two year warranty and free returns.</p>
+</div>
+<div class="section"><span>Trusted by more than four hundred retailers across Europe.</span></div>
+</div></body></html>"""
+
+
+def test_nested_wrappers_keep_the_same_blocks_as_soup():
+    streamed = extract_page(NESTED_PAGE)
+    souped = _extract_with_soup(NESTED_PAGE.encode('utf-8'))
+
+    # Both keep the inner paragraphs, not the wrapper divs that repeat them
+    assert streamed['content'] == souped['content'] == '\n'.join([
+        'Acme builds reliable widgets that help small businesses automate.',
+        'Every widget ships with a two year warranty and free returns.',
+        'Trusted by more than four hundred retailers across Europe.'])
+    assert streamed['duplicate_blocks'] == souped['duplicate_blocks']
+
+
+def test_falls_back_to_first_h1_and_og_description():
+    html = '<meta property="og:description" content="OG text"><h1>Hi</h1>'
+    data = extract_page(html)
+    assert data['title'] == 'Hi'
+    assert data['meta_description'] == 'OG text'
+    assert data['content'] == 'Content could not be extracted'
+
+
+def test_handles_input_split_across_chunks():
+    data = extract_page(PAGE, chunk_size=7)
+    assert data == extract_page(PAGE)
+
+
+def test_stops_once_limits_are_reached():
+    block = ''.join(f'<h2>Heading number {i}</h2><p>Paragraph {i} with enough words to be kept.</p>'
+                    for i in range(1000))
+    extractor = PageExtractor()
+    html = f'<title>Big page</title>{block}'
+    consumed = 0
+    for start in range(0, len(html), 1024):
+        consumed += 1024
+        if extractor.feed(html[start:start + 1024]):
+            break
+
+    assert extractor.done
+    assert consumed < len(html) // 10
+    result = extractor.result()
+    assert len(result['headings']) == 15
+    assert len(result['content'].split('\n')) == 15
+
+
+def test_deeply_nested_divs_stay_linear():
+    inner = '<p>The one real paragraph of text sitting at the very bottom.</p>'
+    html = '<div>' * 5000 + inner + '</div>' * 5000
+    data = extract_page(html)
+    assert data['content'].split('\n')[0] == 'The one real paragraph of text sitting at the very bottom.'
+
+
+def test_collects_links_including_navigation():
+    html = ('<html><body><nav><a href="/about">About <b>us</b></a></nav>'
+            '<p>Read our <a href="/pricing">  pricing\n plans </a> for details about the widgets.</p>'
+            '<a name="anchor-only">No href</a><footer><a href="mailto:hi@acme.test">Mail</a></footer></body></html>')
+    streamed = extract_page(html)
+    souped = _extract_with_soup(html.encode('utf-8'))
+
+    expected = [{'href': '/about', 'text': 'About us'}, {'href': '/pricing', 'text': 'pricing plans'},
+                {'href': 'mailto:hi@acme.test', 'text': 'Mail'}]
+    assert streamed['links'] == souped['links'] == expected
+
+
+if __name__ == "__main__":
+    test_matches_soup_extraction()
+    test_nested_wrappers_keep_the_same_blocks_as_soup()
+    test_falls_back_to_first_h1_and_og_description()
+    test_handles_input_split_across_chunks()
+    test_stops_once_limits_are_reached()
+    test_deeply_nested_divs_stay_linear()
+    test_collects_links_including_navigation()
+    print("✅ HTML extractor tests passed")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test the background job executor and deferred URL handling
+"""
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import gemini_service
+from services.gemini_service import ModelRegistry
+from services.job_service import JobExecutor, JobQueueFull
+from services.workflow_service import WorkflowManager
+
+
+class FakeModel:
+    def generate_content(self, prompt, stream=False):
+        class Response:
+            text = '{"response": "Acme sells widgets.", "knowledge_update": null}'
+        return Response()
+
+
+def test_queue_is_bounded_and_measured():
+    executor = JobExecutor(workers=2, queue_size=3)
+    release = threading.Event()
+    jobs = [executor.submit(release.wait, kind='slow') for _ in range(3)]
+
+    try:
+        executor.submit(release.wait)
+        assert False, "fourth job should have been rejected"
+    except JobQueueFull:
+        pass
+
+    stats = executor.stats()
+    assert stats['queue_depth'] == 3
+    assert stats['rejected'] == 1
+    assert executor.pop_result(jobs[0]) is None
+
+    release.set()
+    for job_id in jobs:
+        assert executor.wait(job_id, timeout=5)
+        assert executor.pop_result(job_id)['status'] == 'done'
+
+    stats = executor.stats()
+    assert stats['queue_depth'] == 0 and stats['completed'] == 3
+    assert stats['run_ms_p95'] >= stats['run_ms_p50'] >= 0
+    assert executor.pop_result(jobs[0])['status'] == 'lost'
+    executor.shutdown()
+
+
+def test_failed_jobs_are_reported():
+    executor = JobExecutor(workers=1, queue_size=2)
+    job_id = executor.submit(lambda: 1 / 0, kind='broken')
+    executor.wait(job_id, timeout=5)
+    outcome = executor.pop_result(job_id)
+    assert outcome['status'] == 'failed'
+    assert 'division' in outcome['error']
+    assert executor.stats()['failed'] == 1
+    executor.shutdown()
+
+
+def test_url_reply_is_deferred_until_collected():
+    original = gemini_service.model_registry
+    gemini_service.model_registry = ModelRegistry(['fake'], factory=lambda name: FakeModel())
+    manager = WorkflowManager()
+    page_requested = threading.Event()
+    release = threading.Event()
+
+    def slow_scrape(url):
+        page_requested.set()
+        release.wait(5)
+        return {'url': url, 'scraped_data': {'title': 'Acme'}, 'title': 'Acme', 'content': 'Widgets.',
+                'headings': ['Widgets'], 'basic_summary': 'Website: Acme'}
+
+    manager._scrape_page = slow_scrape
+    session = {}
+    try:
+        started = time.time()
+        reply = ''.join(manager.process_workflow_step_stream(
+            'see https://acme-widgets.test', session, background=True))
+        assert time.time() - started < 1
+        assert 'Working on it' in reply
+        assert page_requested.wait(5)
+
+        # Nothing is applied while the job is still running
+        assert manager.collect_finished_jobs(session) == []
+        assert session['workflow_step'] == 1
+        assert session['kyb_data']['scraped_data'] == []
+
+        release.set()
+        deadline = time.time() + 5
+        replies = []
+        while not replies and time.time() < deadline:
+            replies = manager.collect_finished_jobs(session)
+            time.sleep(0.02)
+
+        assert len(replies) == 1
+        assert 'Acme sells widgets.' in replies[0]
+        assert session['workflow_step'] == 3
+        assert session['what_they_sell'] == 'Acme'
+        assert session['pending_jobs'] == []
+    finally:
+        release.set()
+        gemini_service.model_registry = original
+
+
+if __name__ == "__main__":
+    test_queue_is_bounded_and_measured()
+    test_failed_jobs_are_reported()
+    test_url_reply_is_deferred_until_collected()
+    print("✅ Job service tests passed")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Test the append-only KYB journal and the managers that write through it
+"""
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.kyb_journal import KYBJournal, diff_documents, journal_path
+from services.kyb_service import KYBManager
+
+
+def make_document():
+    return {
+        'session_id': 'abc',
+        'workflow_step': 3,
+        'kyb_data': {'business_understanding': ['Business: AI OS'], 'objectives': [], 'summary': ''}
+    }
+
+
+def test_diff_records_list_growth_as_extend():
+    old = make_document()
+    new = make_document()
+    new['kyb_data']['objectives'].append('Grow revenue')
+    new['workflow_step'] = 4
+
+    ops = diff_documents(old, new)
+    assert {'op': 'extend', 'path': ['kyb_data', 'objectives'], 'value': ['Grow revenue']} in ops
+    assert {'op': 'set', 'path': ['workflow_step'], 'value': 4} in ops
+    assert len(ops) == 2
+
+
+def test_updates_append_small_records_and_replay_from_disk():
+    path = os.path.join(tempfile.mkdtemp(), 'kyb_abc.json')
+    journal = KYBJournal(compact_after=1000)
+    document = make_document()
+    journal.create(path, document)
+
+    sizes = []
+    for i in range(50):
+        document['kyb_data']['business_understanding'].append(f"Insight number {i}")
+        document['workflow_step'] = i
+        journal.update(path, {'kyb_data': document['kyb_data'], 'workflow_step': i})
+        sizes.append(os.path.getsize(journal_path(path)))
+
+    # Every record costs about the same, however long the history gets
+    growth = [b - a for a, b in zip(sizes, sizes[1:])]
+    assert max(growth) - min(growth) < 10
+
+    # A fresh journal (e.g. another process) rebuilds the same state
+    assert KYBJournal().load(path) == document
+    with open(path) as f:
+        assert json.load(f)['workflow_step'] == 3
+
+
+def test_compaction_folds_tail_into_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), 'kyb_abc.json')
+    journal = KYBJournal(compact_after=5)
+    document = make_document()
+    journal.create(path, document)
+    for i in range(12):
+        document['kyb_data']['objectives'].append(f"Objective {i}")
+        journal.update(path, {'kyb_data': document['kyb_data']})
+
+    with open(journal_path(path)) as f:
+        assert len(f.readlines()) == 2
+    with open(path) as f:
+        assert len(json.load(f)['kyb_data']['objectives']) == 10
+    assert KYBJournal().load(path) == document
+
+
+def test_replay_skips_records_already_in_snapshot():
+    path = os.path.join(tempfile.mkdtemp(), 'kyb_abc.json')
+    journal = KYBJournal(compact_after=1000)
+    journal.create(path, make_document())
+    journal.append(path, [{'op': 'extend', 'path': ['kyb_data', 'objectives'], 'value': ['A']}])
+    with open(journal_path(path)) as f:
+        stale_tail = f.read()
+
+    # Simulate a crash between writing the snapshot and truncating the journal
+    journal.compact(path)
+    with open(journal_path(path), 'w') as f:
+        f.write(stale_tail)
+
+    assert KYBJournal().load(path)['kyb_data']['objectives'] == ['A']
+
+
+def test_writers_in_separate_processes_do_not_lose_records():
+    path = os.path.join(tempfile.mkdtemp(), 'kyb_abc.json')
+    # Two journals stand in for two processes: neither sees the other's cache
+    streamlit, bulk = KYBJournal(compact_after=1000), KYBJournal(compact_after=3)
+    streamlit.create(path, make_document())
+
+    def add(journal, objective):
+        journal.append(path, [{'op': 'extend', 'path': ['kyb_data', 'objectives'], 'value': [objective]}])
+
+    add(streamlit, 'A')
+    add(bulk, 'B')
+    add(streamlit, 'C')
+    add(bulk, 'D')  # third record for bulk's cache, so it compacts
+    add(streamlit, 'E')
+    bulk.update(path, {'workflow_step': 7})
+    streamlit.update(path, {'workflow_step': 8})
+
+    with open(journal_path(path)) as f:
+        seqs = [json.loads(line)['seq'] for line in f]
+    assert len(seqs) == len(set(seqs))
+    expected = ['A', 'B', 'C', 'D', 'E']
+    for journal in (KYBJournal(), streamlit, bulk):
+        document = journal.load(path)
+        assert document['kyb_data']['objectives'] == expected
+    assert KYBJournal().load(path)['workflow_step'] == 8
+
+
+def test_record_after_torn_line_is_kept():
+    path = os.path.join(tempfile.mkdtemp(), 'kyb_abc.json')
+    journal = KYBJournal()
+    journal.create(path, make_document())
+    journal.append(path, [{'op': 'set', 'path': ['workflow_step'], 'value': 4}])
+    with open(journal_path(path), 'a') as f:
+        f.write('{"seq": 2, "ops": [{"op"')  # a writer crashed mid-record
+
+    other = KYBJournal()
+    other.append(path, [{'op': 'set', 'path': ['workflow_step'], 'value': 5}])
+    assert KYBJournal().load(path)['workflow_step'] == 5
+
+
+def test_kyb_manager_writes_through_journal():
+    manager = KYBManager(kyb_dir=tempfile.mkdtemp())
+    path = manager.create_kyb_file('abc', {'what_they_sell': 'AI OS'})
+    for i in range(3):
+        manager.update_kyb_file(path, {
+            'knowledge_extracted': {'objectives': [f"Objective {i}"], 'key_insights': ['Fast']},
+            'conversation_entry': {'role': 'user', 'content': f"Message {i}"}
+        })
+
+    data = manager.get_kyb_data(path)
+    assert data['knowledge_extracted']['objectives'] == ['Objective 0', 'Objective 1', 'Objective 2']
+    assert len(data['conversation_history']) == 3
+    assert data['completeness_score'] == 0.8
+    assert manager.is_kyb_full(path)
+
+
+if __name__ == "__main__":
+    test_diff_records_list_growth_as_extend()
+    test_updates_append_small_records_and_replay_from_disk()
+    test_compaction_folds_tail_into_snapshot()
+    test_replay_skips_records_already_in_snapshot()
+    test_writers_in_separate_processes_do_not_lose_records()
+    test_record_after_torn_line_is_kept()
+    test_kyb_manager_writes_through_journal()
+    print("✅ KYB journal tests passed")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test the indexed KYB repository and the JSON importer
+"""
+import sys
+import os
+import json
+import shutil
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.kyb_journal import KYBJournal
+from services.kyb_repository import KYBRepository
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kyb_files')
+
+
+def make_repository():
+    directory = tempfile.mkdtemp()
+    return directory, KYBRepository(os.path.join(directory, 'kyb_index.db'), journal=KYBJournal())
+
+
+def workflow_document(session_id, business, step, objectives=0):
+    return {
+        'session_id': session_id,
+        'business': business,
+        'workflow_step': step,
+        'kyb_data': {
+            'business_understanding': ['Business', 'Product'],
+            'objectives': [f"Objective {i}" for i in range(objectives)],
+            'constraints': ['Budget', 'Hiring'],
+            'summary': '',
+            'scraped_data': []
+        }
+    }
+
+
+def test_writes_keep_index_in_sync():
+    directory, repository = make_repository()
+    path = os.path.join(directory, 'kyb_s1.json')
+    repository.create(path, workflow_document('s1', 'AI OS', 3))
+    assert repository.list_sessions(session_id='s1')[0]['completeness_score'] == 0.5
+
+    # One objective is still short of the two that step 8 asks for
+    document = repository.load(path)
+    document['kyb_data']['objectives'].append('Grow revenue')
+    repository.update(path, {'kyb_data': document['kyb_data'], 'workflow_step': 6})
+    assert repository.list_sessions(session_id='s1')[0]['completeness_score'] == 0.5
+
+    document['kyb_data']['objectives'].append('Hire')
+    repository.update(path, {'kyb_data': document['kyb_data'], 'workflow_step': 7})
+
+    row = repository.list_sessions(session_id='s1')[0]
+    assert row['workflow_step'] == 7
+    assert row['completeness_score'] == 0.75
+    assert repository.get_by_session('s1')['kyb_data']['objectives'] == ['Grow revenue', 'Hire']
+
+
+def test_writes_do_not_copy_the_document():
+    directory, repository = make_repository()
+    path = os.path.join(directory, 'kyb_s1.json')
+    document = workflow_document('s1', 'AI OS', 3)
+    repository.create(path, document)
+
+    def no_copies(filepath):
+        raise AssertionError("writes should index the cached document, not a copy")
+
+    repository.journal.load = no_copies
+    for i in range(5):
+        document['kyb_data']['objectives'].append(f"Objective {i}")
+        repository.update(path, {'kyb_data': document['kyb_data'], 'workflow_step': 4 + i})
+    repository.append(path, [{'op': 'set', 'path': ['status'], 'value': 'complete'}])
+
+    row = repository.list_sessions(session_id='s1')[0]
+    assert (row['workflow_step'], row['completeness_score'], row['status']) == (8, 0.75, 'complete')
+
+
+def test_filters_and_analytics():
+    directory, repository = make_repository()
+    for i, (business, step) in enumerate([('AI OS', 3), ('Coffee Roasters', 6), ('ai tutoring', 9)]):
+        repository.create(os.path.join(directory, f"kyb_s{i}.json"),
+                          workflow_document(f"s{i}", business, step, objectives=2))
+
+    assert {row['business'] for row in repository.list_sessions(business='ai')} == {'AI OS', 'ai tutoring'}
+    assert [row['session_id'] for row in repository.list_sessions(workflow_step=6)] == ['s1']
+    assert len(repository.list_sessions(min_completeness=0.75)) == 3
+
+    stats = repository.analytics()
+    assert stats['sessions'] == 3
+    assert stats['sessions_by_step'] == {3: 1, 6: 1, 9: 1}
+    assert len(repository.export(business='coffee')) == 1
+
+
+def test_import_existing_json_files():
+    directory, repository = make_repository()
+    for name in os.listdir(SAMPLE_DIR):
+        if name.endswith('.json'):
+            shutil.copy(os.path.join(SAMPLE_DIR, name), directory)
+
+    imported = repository.import_json_files(directory)
+    assert imported == len(repository.list_sessions())
+    assert imported >= 3
+
+
+def test_queries_stay_fast_with_many_sessions():
+    directory, repository = make_repository()
+    for i in range(3000):
+        with open(os.path.join(directory, f"kyb_{i:05d}.json"), 'w') as f:
+            json.dump(workflow_document(f"s{i}", f"Business {i % 50}", i % 10), f)
+    assert repository.import_json_files(directory) == 3000
+
+    start = time.perf_counter()
+    rows = repository.list_sessions(workflow_step=7, limit=50)
+    stats = repository.analytics()
+    elapsed = time.perf_counter() - start
+
+    assert len(rows) == 50
+    assert stats['sessions'] == 3000
+    assert elapsed < 0.1
+
+
+if __name__ == "__main__":
+    test_writes_keep_index_in_sync()
+    test_writes_do_not_copy_the_document()
+    test_filters_and_analytics()
+    test_import_existing_json_files()
+    test_queries_stay_fast_with_many_sessions()
+    print("✅ KYB repository tests passed")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test the record, replay and synthetic Gemini backends without touching the network
+"""
+import sys
+import os
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import gemini_service
+from services.cache_store import PersistentCache
+from services.gemini_client import GeminiClient
+from services.llm_backends import PromptRecording, RecordingModel, ReplayModel, create_model_factory
+
+# Keep test responses out of the real on-disk cache
+gemini_service._response_cache = PersistentCache(os.path.join(tempfile.mkdtemp(), 'gemini_cache.db'),
+                                                 table='responses')
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        text = '{"response": "live answer %d", "knowledge_update": null}' % self.calls
+        if stream:
+            return [FakeResponse(text[i:i + 5]) for i in range(0, len(text), 5)]
+        return FakeResponse(text)
+
+
+def use_backend(backend, **options):
+    """Switch backend, with an unthrottled client that does not retry so failures are visible"""
+    original = (gemini_service.model_registry, gemini_service.get_llm_backend(), gemini_service.gemini_client)
+    gemini_service.set_llm_backend(backend, **options)
+    gemini_service.gemini_client = GeminiClient(rate=0, max_in_flight=16, max_retries=0, breaker_threshold=1000)
+    return original
+
+
+def restore_backend(original):
+    gemini_service.model_registry, gemini_service._llm_backend, gemini_service.gemini_client = original
+
+
+def test_record_then_replay_round_trip():
+    """Replies recorded from a live model should come back verbatim from a fresh replay store"""
+    path = os.path.join(tempfile.mkdtemp(), 'recording.jsonl')
+    live = FakeModel()
+    recorder = RecordingModel(live, PromptRecording(path), 'fake')
+
+    assert 'live answer 1' in recorder.generate_content('prompt one').text
+    streamed = ''.join(chunk.text for chunk in recorder.generate_content('prompt two', stream=True))
+    assert 'live answer 2' in streamed
+
+    replay = ReplayModel(PromptRecording(path), synthesize_missing=False)
+    assert replay.generate_content('prompt one').text == '{"response": "live answer 1", "knowledge_update": null}'
+    assert ''.join(chunk.text for chunk in replay.generate_content('prompt two', stream=True)) == streamed
+    assert live.calls == 2
+
+    try:
+        replay.generate_content('never recorded')
+        assert False, "a missing prompt should fail in strict replay"
+    except Exception as e:
+        assert 'No recorded response' in str(e)
+
+
+def test_record_backend_through_analyze():
+    """set_llm_backend('record') should wrap the real factory and persist what it answers"""
+    path = os.path.join(tempfile.mkdtemp(), 'recording.jsonl')
+    live = FakeModel()
+    original = gemini_service.model_registry
+    try:
+        factory = create_model_factory('record', recording_path=path, real_factory=lambda name: live)
+        gemini_service.model_registry = gemini_service.ModelRegistry(['fake'], factory=factory)
+        result = gemini_service.analyze_with_gemini('We sell bikes', use_cache=False)
+    finally:
+        gemini_service.model_registry = original
+
+    assert result['response'] == 'live answer 1'
+    assert len(PromptRecording(path)) == 1
+
+
+def test_synthetic_backend_is_deterministic():
+    """Two runs with the same seed should fail on exactly the same calls"""
+    def run():
+        model = ReplayModel(failure_rate=0.3, seed='fixed')
+        outcomes = []
+        for i in range(200):
+            try:
+                model.generate_content(f'prompt {i % 20}')
+                outcomes.append(True)
+            except Exception as e:
+                assert '503' in str(e)
+                outcomes.append(False)
+        return outcomes
+
+    first, second = run(), run()
+    assert first == second
+    failures = first.count(False)
+    assert 30 < failures < 90, failures
+
+
+def test_synthetic_latency_is_applied():
+    """Calls should take about the configured latency"""
+    model = ReplayModel(latency=0.02, jitter=0.5)
+    started = time.perf_counter()
+    for i in range(5):
+        model.generate_content(f'prompt {i}')
+    elapsed = time.perf_counter() - started
+    assert 0.05 <= elapsed < 1.0, elapsed
+
+
+def test_synthetic_reply_parses_and_streams():
+    """analyze_with_gemini and stream_with_gemini should both accept synthetic replies"""
+    original = use_backend('synthetic')
+    try:
+        result = gemini_service.analyze_with_gemini('We sell bikes to commuters', use_cache=False)
+        stream = gemini_service.stream_with_gemini('We sell bikes to commuters')
+        pieces = []
+        while True:
+            try:
+                pieces.append(next(stream))
+            except StopIteration as done:
+                streamed = done.value
+                break
+        info = gemini_service.get_model_info()
+    finally:
+        restore_backend(original)
+
+    assert 'We sell bikes to commuters' in result['response']
+    assert result['knowledge_update']['business_understanding']
+    assert info['backend'] == 'synthetic'
+    assert ''.join(pieces) == result['response']
+    assert streamed['knowledge_update'] == result['knowledge_update']
+
+
+def test_concurrent_load_with_failures():
+    """Many threads of synthetic turns should all be answered, with failures turned into fallbacks"""
+    original = use_backend('synthetic', failure_rate=0.1)
+    results = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = [gemini_service.analyze_with_gemini(f'session {index} turn {turn}', use_cache=False)
+                 for turn in range(100)]
+        with lock:
+            results.extend(local)
+
+    try:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        restore_backend(original)
+
+    failed = sum(1 for result in results if result['knowledge_update'] is None)
+    assert len(results) == 800
+    assert 0 < failed < 200, failed
+    print(f"   {len(results) / elapsed:.0f} turns/s with {failed} synthetic failures")
+
+
+if __name__ == "__main__":
+    test_record_then_replay_round_trip()
+    test_record_backend_through_analyze()
+    test_synthetic_backend_is_deterministic()
+    test_synthetic_latency_is_applied()
+    test_synthetic_reply_parses_and_streams()
+    test_concurrent_load_with_failures()
+    print("✅ All LLM backend tests passed")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test that a message with several links is scraped concurrently and analyzed in one Gemini call
+"""
+import sys
+import os
+import tempfile
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import gemini_service
+from services.gemini_client import GeminiClient
+from services.gemini_service import ModelRegistry
+from services.workflow_service import WorkflowManager
+
+pytestmark = pytest.mark.usefixtures('temp_caches', 'loopback_allowed')
+
+HOST = '127.0.0.1'
+PAGE_DELAY = 0.4
+TITLES = {'/home': 'Acme Widgets', '/pricing': 'Acme Pricing', '/about': 'About Acme'}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(PAGE_DELAY)
+        title = TITLES.get(self.path)
+        if title is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = (f"<html><head><title>{title}</title></head><body><h1>{title}</h1>"
+                f"<p>{title} helps small businesses automate their back office with reliable widgets.</p>"
+                f"</body></html>").encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RecordingModel:
+    """Remembers every prompt and answers like Gemini"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        text = '{"response": "Acme sells widgets to small businesses.", "knowledge_update": null}'
+        if stream:
+            return [FakeResponse(text[i:i + 8]) for i in range(0, len(text), 8)]
+        return FakeResponse(text)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def run_with_site(test):
+    server = ThreadingHTTPServer((HOST, 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    model = RecordingModel()
+    original = (gemini_service.model_registry, gemini_service.gemini_client)
+    gemini_service.model_registry = ModelRegistry(['fake'], factory=lambda name: model)
+    gemini_service.gemini_client = GeminiClient(rate=0)
+    try:
+        test(f'http://{HOST}:{server.server_port}', model)
+    finally:
+        gemini_service.model_registry, gemini_service.gemini_client = original
+        server.shutdown()
+        server.server_close()
+
+
+def test_find_urls_keeps_order_and_drops_repeats():
+    manager = WorkflowManager()
+    text = ("See https://acme-widgets.test/ and https://acme-widgets.test/pricing "
+            "then https://acme-widgets.test/ again, plus http://localhost:8000/admin")
+    assert manager._find_urls(text) == ['https://acme-widgets.test/', 'https://acme-widgets.test/pricing']
+    many = ' '.join(f'https://acme-widgets.test/page{i}' for i in range(10))
+    assert len(manager._find_urls(many)) == WorkflowManager.MAX_URLS_PER_MESSAGE
+
+
+def test_multi_url_paste_is_concurrent_and_combined():
+    def check(base, model):
+        manager = WorkflowManager()
+        session = {}
+        manager.process_workflow_step('', session)
+
+        started = time.perf_counter()
+        reply, session = manager.process_workflow_step(
+            f'{base}/home {base}/pricing {base}/about {base}/missing', session)
+        elapsed = time.perf_counter() - started
+
+        # Four pages in about the time of one
+        assert elapsed < PAGE_DELAY * 2.5, elapsed
+        assert len(model.prompts) == 1
+        for title in TITLES.values():
+            assert title in model.prompts[0]
+        assert [page['title'] for page in session['kyb_data']['scraped_data']] == list(TITLES.values())
+        assert session['what_they_sell'] == 'Acme Widgets'
+        assert session['workflow_step'] == 3
+        assert '3 Pages' in reply and f'{base}/missing' in reply
+        assert 'Acme sells widgets' in reply
+
+    run_with_site(check)
+
+
+def test_background_job_handles_several_urls():
+    def check(base, model):
+        manager = WorkflowManager()
+        session = {}
+        manager.process_workflow_step('', session)
+
+        result = manager.fetch_url_analysis([f'{base}/home', f'{base}/about'])
+        assert len(result['pages']) == 2 and result['failed'] == []
+        reply = manager.apply_url_analysis(result, session)
+        assert '2 Pages' in reply
+        assert len(session['kyb_data']['scraped_data']) == 2
+        assert len(model.prompts) == 1
+
+        failed = manager.fetch_url_analysis([f'{base}/missing', f'{base}/gone'])
+        assert failed.get('error')
+
+    run_with_site(check)
+
+
+def test_sessions_share_the_analysis_of_a_page():
+    def check(base, model):
+        manager = WorkflowManager()
+        replies = []
+        for summary in ['Sells widgets to bakeries', 'Runs an overnight parcel service']:
+            session = {}
+            manager.process_workflow_step('', session)
+            session['conversation_summary'] = summary
+            reply, session = manager.process_workflow_step(f'{base}/about', session)
+            replies.append(reply)
+        assert len(model.prompts) == 1
+        assert all('Acme sells widgets' in reply for reply in replies)
+
+    run_with_site(check)
+
+
+if __name__ == "__main__":
+    from conftest import allow_test_host, use_temp_caches
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        use_temp_caches(monkeypatch, tempfile.mkdtemp())
+        allow_test_host(monkeypatch, HOST)
+        test_find_urls_keeps_order_and_drops_repeats()
+        test_multi_url_paste_is_concurrent_and_combined()
+        test_background_job_handles_several_urls()
+        test_sessions_share_the_analysis_of_a_page()
+    print("✅ All multi-URL tests passed")
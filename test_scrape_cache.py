@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test the on-disk scrape cache and ETag/Last-Modified revalidation
+"""
+import sys
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import scraper_service
+from services.cache_store import PersistentCache
+from services.scraper_service import normalize_url, scrape_url
+
+pytestmark = pytest.mark.usefixtures('loopback_allowed')
+
+PAGE = b"""<html><head><title>Cached Co</title></head>
+<body><p>Cached Co sells subscriptions for office plants and coffee.</p></body></html>"""
+
+
+class ValidatingHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', '"v1"')
+        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def use_temp_cache(monkeypatch, ttl=3600, max_entries=500):
+    cache = PersistentCache(os.path.join(tempfile.mkdtemp(), 'scrape_cache.db'), table='pages',
+                            ttl=ttl, max_entries=max_entries)
+    monkeypatch.setattr(scraper_service, '_scrape_cache', cache)
+    monkeypatch.setattr(scraper_service, '_revalidated_count', 0)
+    return cache
+
+
+def start_server():
+    ValidatingHandler.requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ValidatingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://Acme.COM:443/About#team') == 'https://acme.com/About'
+    assert normalize_url('http://acme.com') == 'http://acme.com/'
+    assert normalize_url('http://acme.com:8080/?a=1') == 'http://acme.com:8080/?a=1'
+
+
+def test_fresh_entries_skip_the_network(monkeypatch):
+    use_temp_cache(monkeypatch)
+    server, base = start_server()
+    try:
+        first = scrape_url(f"{base}/")
+        second = scrape_url(f"{base}/#contact")
+        assert first['title'] == second['title'] == 'Cached Co'
+        assert second['from_cache']
+        assert len(ValidatingHandler.requests_seen) == 1
+        assert scraper_service.get_scrape_cache_stats()['hits'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_stale_entries_are_revalidated_with_etag(monkeypatch):
+    use_temp_cache(monkeypatch, ttl=0)
+    server, base = start_server()
+    try:
+        scrape_url(f"{base}/")
+        again = scrape_url(f"{base}/")
+        assert again['from_cache']
+        assert ValidatingHandler.requests_seen == [None, '"v1"']
+        stats = scraper_service.get_scrape_cache_stats()
+        assert stats['revalidated'] == 1
+        assert stats['hit_rate'] == 0.5
+    finally:
+        server.shutdown()
+
+
+def test_truncated_pages_are_not_cached(monkeypatch):
+    use_temp_cache(monkeypatch)
+    server, base = start_server()
+    try:
+        partial = scrape_url(f"{base}/", max_bytes=40)
+        assert partial['truncated']
+        full = scrape_url(f"{base}/")
+        assert not full['truncated'] and not full.get('from_cache')
+        assert 'office plants' in full['content']
+        assert scrape_url(f"{base}/", max_bytes=40)['from_cache']
+        assert len(ValidatingHandler.requests_seen) == 2
+    finally:
+        server.shutdown()
+
+
+def test_lru_eviction_caps_cache_size(monkeypatch):
+    cache = use_temp_cache(monkeypatch, max_entries=2)
+    cache.set('a', {'n': 1})
+    cache.set('b', {'n': 2})
+    cache.get('a')
+    cache.set('c', {'n': 3})
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a')[0] == {'n': 1}
+    assert cache.stats()['evictions'] == 1
+
+
+if __name__ == "__main__":
+    from conftest import allow_test_host
+    test_normalize_url()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        allow_test_host(monkeypatch)
+        test_fresh_entries_skip_the_network(monkeypatch)
+        test_stale_entries_are_revalidated_with_etag(monkeypatch)
+        test_truncated_pages_are_not_cached(monkeypatch)
+        test_lru_eviction_caps_cache_size(monkeypatch)
+    print("✅ Scrape cache tests passed")
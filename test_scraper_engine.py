@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Test the concurrent scraping engine against a local HTTP server
+"""
+import sys
+import os
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.scraper_service import _read_socket, scrape_url, scrape_many
+
+pytestmark = pytest.mark.usefixtures('temp_caches', 'loopback_allowed')
+
+PAGE = """<html><head><title>Acme Widgets</title>
+<meta name="description" content="We sell widgets to small businesses."></head>
+<body><h1>Widgets for everyone</h1><h2>Pricing plans</h2>
+<p>Acme builds reliable widgets that help small businesses automate their back office.</p>
+</body></html>"""
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self.path.startswith('/huge'):
+            return self.send_huge_page()
+        if self.path.startswith('/trickle'):
+            return self.send_trickle()
+        if self.path.startswith('/stall'):
+            return self.send_stall()
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_huge_page(self):
+        body = ('<html><head><title>Huge</title></head><body>'
+                + '<div>' + 'x' * 5_000_000 + '</div></body></html>').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_trickle(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        try:
+            self.wfile.write(b'<html><head><title>Slow site</title></head><body>')
+            self.wfile.flush()
+            for _ in range(50):
+                time.sleep(0.1)
+                self.wfile.write(b'<span>.</span>')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_stall(self):
+        head = b'<html><head><title>Stalled site</title></head><body>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        # A keep-alive response, so the client's connection keeps hold of its socket
+        self.send_header('Connection', 'keep-alive')
+        self.send_header('Content-Length', str(len(head) + 100))
+        self.end_headers()
+        try:
+            time.sleep(0.8)
+            self.wfile.write(head)
+            self.wfile.flush()
+            time.sleep(3)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_scrape_url_still_returns_page_data():
+    server, base = start_server()
+    try:
+        data = scrape_url(f"{base}/")
+        assert data['title'] == 'Acme Widgets'
+        assert data['meta_description'] == 'We sell widgets to small businesses.'
+        assert 'Widgets for everyone' in data['headings']
+    finally:
+        server.shutdown()
+
+
+def test_scrape_many_runs_concurrently_and_reports_errors():
+    server, base = start_server()
+    try:
+        urls = [f"{base}/page/{i}" for i in range(12)] + [f"{base}/missing"]
+        start = time.perf_counter()
+        results = list(scrape_many(urls, concurrency=6, per_host_limit=6, politeness_delay=0))
+        elapsed = time.perf_counter() - start
+
+        assert sorted(r['url'] for r in results) == sorted(urls)
+        failed = [r for r in results if r['error']]
+        assert [r['url'] for r in failed] == [f"{base}/missing"]
+        assert all(r['data']['title'] == 'Acme Widgets' for r in results if not r['error'])
+        # 13 requests at 50 ms each would take ~0.65 s one after another
+        assert elapsed < 0.5
+    finally:
+        server.shutdown()
+
+
+def test_politeness_delay_spaces_out_requests_to_one_host():
+    server, base = start_server()
+    try:
+        urls = [f"{base}/page/{i}" for i in range(4)]
+        start = time.perf_counter()
+        list(scrape_many(urls, concurrency=4, per_host_limit=4, politeness_delay=0.1))
+        assert time.perf_counter() - start >= 0.3
+    finally:
+        server.shutdown()
+
+
+def test_byte_budget_truncates_huge_pages():
+    server, base = start_server()
+    try:
+        data = scrape_url(f"{base}/huge", max_bytes=100_000)
+        assert data['truncated']
+        assert data['bytes_read'] == 100_000
+        assert data['title'] == 'Huge'
+    finally:
+        server.shutdown()
+
+
+def test_deadline_stops_trickling_servers():
+    server, base = start_server()
+    try:
+        start = time.perf_counter()
+        data = scrape_url(f"{base}/trickle", deadline=0.5)
+        assert time.perf_counter() - start < 1.5
+        assert data['truncated']
+        assert data['title'] == 'Slow site'
+    finally:
+        server.shutdown()
+
+
+def test_deadline_caps_each_read_on_a_stalled_server():
+    server, base = start_server()
+    try:
+        start = time.perf_counter()
+        data = scrape_url(f"{base}/stall", deadline=1.0)
+        # The read after the first chunk only gets the time left, not another full second
+        assert time.perf_counter() - start < 1.4
+        assert data['truncated']
+        assert data['title'] == 'Stalled site'
+    finally:
+        server.shutdown()
+
+
+def test_read_socket_is_reachable_while_streaming():
+    server, base = start_server()
+    try:
+        with requests.get(f"{base}/stall", stream=True, timeout=5) as response:
+            # If urllib3 stops exposing HTTPResponse.connection.sock, reads fall back to the open-time timeout
+            assert isinstance(_read_socket(response), socket.socket)
+    finally:
+        server.shutdown()
+
+
+def test_small_pages_are_not_truncated():
+    server, base = start_server()
+    try:
+        data = scrape_url(f"{base}/", extractor='soup')
+        assert not data['truncated']
+        assert data['title'] == 'Acme Widgets'
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    from conftest import allow_test_host, use_temp_caches
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        use_temp_caches(monkeypatch, tempfile.mkdtemp())
+        allow_test_host(monkeypatch)
+        test_scrape_url_still_returns_page_data()
+        test_scrape_many_runs_concurrently_and_reports_errors()
+        test_politeness_delay_spaces_out_requests_to_one_host()
+        test_byte_budget_truncates_huge_pages()
+        test_deadline_stops_trickling_servers()
+        test_deadline_caps_each_read_on_a_stalled_server()
+        test_read_socket_is_reachable_while_streaming()
+        test_small_pages_are_not_truncated()
+    print("✅ Scrape engine tests passed")
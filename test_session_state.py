@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test the slotted per-session state and the shared WorkflowManager
+"""
+import sys
+import os
+import copy
+import tempfile
+import threading
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.chat_service import process_user_input, stream_user_input
+from services.session_state import SessionState
+from services.workflow_service import WorkflowManager, get_workflow_manager
+
+
+def test_reads_and_writes_like_a_dict():
+    state = SessionState(workflow_step=2)
+    assert not SessionState()
+    assert state['workflow_step'] == 2 and state.workflow_step == 2
+    assert 'kyb_filepath' not in state and state.get('kyb_filepath') is None
+    assert state.get('summarized_turns', 0) == 0
+    state.setdefault('pending_jobs', []).append({'id': 'job-1', 'url': 'https://acme.com/'})
+    assert state == {'workflow_step': 2, 'pending_jobs': [{'id': 'job-1', 'url': 'https://acme.com/'}]}
+
+    try:
+        state['workflow_stpe'] = 3
+        assert False, "misspelled field should be rejected"
+    except KeyError as e:
+        assert 'workflow_stpe' in str(e)
+    assert 'update' not in state
+    assert not hasattr(state, '__dict__')
+
+    snapshot = copy.deepcopy(state)
+    snapshot['pending_jobs'].clear()
+    assert len(state['pending_jobs']) == 1
+
+
+def test_manager_is_shared():
+    managers = []
+    threads = [threading.Thread(target=lambda: managers.append(get_workflow_manager())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(manager is managers[0] for manager in managers)
+    assert isinstance(managers[0], WorkflowManager)
+    assert process_user_input('hello', [])['session_state'] == {}
+
+
+@pytest.mark.usefixtures('kyb_tmp_dir')
+def test_threads_drive_independent_sessions():
+    sessions = [SessionState() for _ in range(16)]
+    history = [{'role': 'assistant', 'content': get_workflow_manager().get_initial_message()}]
+    errors = []
+    start = threading.Barrier(len(sessions))
+
+    def run(index, state):
+        try:
+            start.wait()
+            for text in ['', f'Business {index}', '', f'Details {index}', '', f'Features {index}', '']:
+                ''.join(stream_user_input(text, history, state))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, state)) for i, state in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len({state['session_id'] for state in sessions}) == len(sessions)
+    for i, state in enumerate(sessions):
+        assert state['what_they_sell'] == f'Business {i}'
+        assert state['workflow_step'] == 8
+        assert state['current_question'] == 1
+        assert state['kyb_data']['business_understanding'] == [f'Product details: Details {i}',
+                                                               f'Special features: Features {i}']
+        assert state['kyb_filepath'].endswith(f"kyb_{state['session_id']}.json")
+
+
+if __name__ == "__main__":
+    test_reads_and_writes_like_a_dict()
+    test_manager_is_shared()
+    from conftest import isolate_kyb_files
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        isolate_kyb_files(monkeypatch, tempfile.mkdtemp())
+        test_threads_drive_independent_sessions()
+    print("✅ All session state tests passed")
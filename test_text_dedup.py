@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test exact and near-duplicate detection for scraped text blocks
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.html_extractor import MAX_PARAGRAPHS, extract_page
+from services.scraper_service import _extract_with_soup
+from services.text_dedup import ContentDeduper, estimated_similarity, minhash, normalize_text, shingles
+
+SENTENCE = 'Acme builds reliable widgets that help small businesses automate their back office every day.'
+
+
+def test_exact_copies_ignore_case_spacing_and_punctuation():
+    deduper = ContentDeduper()
+    assert deduper.add(SENTENCE)
+    assert not deduper.add('  ACME builds reliable widgets, that help small businesses automate their back office every day!')
+    assert deduper.duplicates == 1
+
+
+def test_near_duplicates_are_caught_but_distinct_text_is_kept():
+    deduper = ContentDeduper()
+    assert deduper.add(SENTENCE)
+    assert not deduper.add(SENTENCE.replace('every day', 'every single day'))
+    assert deduper.add('Pricing starts at forty dollars per month for teams of up to ten people.')
+
+    near = minhash(shingles(normalize_text(SENTENCE)))
+    far = minhash(shingles(normalize_text('Our offices are in Lisbon, Berlin and Toronto with support around the clock.')))
+    assert estimated_similarity(near, near) == 1.0
+    assert estimated_similarity(near, far) < 0.3
+
+
+def test_wrapper_repeating_kept_blocks_is_dropped():
+    first = 'Acme builds reliable widgets for small businesses across Europe.'
+    second = 'Every widget ships with a five year warranty and free support.'
+    deduper = ContentDeduper()
+    assert deduper.add(first) and deduper.add(second)
+    assert not deduper.add(f'{first} {second}')
+
+    pages = ContentDeduper(containment=False)
+    assert pages.add(first) and pages.add(second)
+    assert pages.add(f'{first} {second}')
+
+
+def test_nested_wrappers_no_longer_eat_the_paragraph_budget():
+    sentences = [f'Feature number {i} lets small businesses automate another part of the back office.'
+                 for i in range(20)]
+    html = '<html><body>' + ''.join(
+        f'<div class="card"><div class="inner"><p>{sentence}</p></div></div>' for sentence in sentences
+    ) + '</body></html>'
+
+    streamed = extract_page(html)
+    souped = _extract_with_soup(html.encode('utf-8'))
+    paragraphs = streamed['content'].split('\n')
+
+    assert len(paragraphs) == MAX_PARAGRAPHS
+    assert len(set(paragraphs)) == MAX_PARAGRAPHS
+    assert paragraphs == sentences[:MAX_PARAGRAPHS]
+    assert souped['content'].split('\n') == sentences[:MAX_PARAGRAPHS]
+    assert streamed['duplicate_blocks'] > 0
+
+
+if __name__ == "__main__":
+    test_exact_copies_ignore_case_spacing_and_punctuation()
+    test_near_duplicates_are_caught_but_distinct_text_is_kept()
+    test_wrapper_repeating_kept_blocks_is_dropped()
+    test_nested_wrappers_no_longer_eat_the_paragraph_budget()
+    print("✅ All text dedup tests passed")
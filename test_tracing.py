@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test span recording, percentile aggregation and the metrics exports
+"""
+import sys
+import os
+import json
+import socket
+import time
+import urllib.request
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import tracing
+from services.tracing import Tracer, start_metrics_server
+
+
+def test_nested_spans_form_a_breakdown():
+    tracer = Tracer(enabled=True)
+    with tracer.span('chat.turn'):
+        with tracer.span('scrape.url') as scrape:
+            scrape.set(bytes=2048)
+            tracer.record('scrape.parse', 0.002, bytes=2048)
+        with tracer.span('gemini.generate'):
+            time.sleep(0.01)
+
+    snapshot = tracer.snapshot()
+    trace = snapshot['recent_traces'][-1]
+    assert trace['name'] == 'chat.turn'
+    assert [child['name'] for child in trace['children']] == ['scrape.url', 'gemini.generate']
+    assert trace['children'][0]['children'][0]['name'] == 'scrape.parse'
+    assert snapshot['stages']['scrape.url']['bytes'] == 2048
+    assert snapshot['stages']['gemini.generate']['p50_ms'] >= 10
+
+
+def test_percentiles_and_errors():
+    tracer = Tracer(enabled=True)
+    for i in range(1, 101):
+        tracer.record('kyb.update', i / 1000)
+    try:
+        with tracer.span('kyb.load'):
+            raise ValueError("missing file")
+    except ValueError:
+        pass
+
+    stages = tracer.snapshot()['stages']
+    assert stages['kyb.update']['p50_ms'] == 51.0
+    assert stages['kyb.update']['p95_ms'] == 96.0
+    assert stages['kyb.update']['p99_ms'] == 100.0
+    assert stages['kyb.load']['errors'] == 1
+
+    text = tracer.prometheus_text()
+    assert 'kyb_stage_duration_seconds{stage="kyb.update",quantile="0.99"} 0.100000' in text
+    assert 'kyb_stage_duration_seconds_count{stage="kyb.update"} 100' in text
+    assert 'kyb_stage_errors_total{stage="kyb.load"} 1' in text
+
+    disabled = Tracer(enabled=False)
+    with disabled.span('anything') as span:
+        span.set(bytes=1)
+    assert disabled.snapshot()['stages'] == {}
+
+
+def test_metrics_endpoint_serves_both_formats():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    tracing.tracer.record('test.stage', 0.005)
+    server = start_metrics_server(port)
+    assert server is not None
+    assert start_metrics_server(port) is server
+
+    metrics = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    assert 'stage="test.stage"' in metrics
+    snapshot = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/snapshot", timeout=5).read())
+    assert snapshot['stages']['test.stage']['count'] >= 1
+
+
+if __name__ == "__main__":
+    test_nested_spans_form_a_breakdown()
+    test_percentiles_and_errors()
+    test_metrics_endpoint_serves_both_formats()
+    print("✅ Tracing tests passed")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test URL detection, canonicalization and private-address blocking
+"""
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import url_intake
+from services.scraper_service import scrape_url
+from services.url_intake import allow_host, cache_key, canonicalize_url, extract_urls, is_public_host, is_scrapeable_url
+from services.workflow_service import WorkflowManager
+
+
+def test_canonical_form():
+    assert canonicalize_url('HTTPS://www.Acme.COM:443/Pricing/?utm_source=ad&b=2&a=1&gclid=xyz#plans') == \
+        'https://www.acme.com/Pricing?a=1&b=2'
+    assert canonicalize_url('http://acme.com:80') == 'http://acme.com/'
+    assert canonicalize_url('http://acme.com:8080//about//') == 'http://acme.com:8080/about'
+    assert canonicalize_url('acme.com/about') == 'https://acme.com/about'
+    assert canonicalize_url('ftp://acme.com/file') is None
+    assert canonicalize_url('http://acme.com:99999/') is None
+
+
+def test_equivalent_urls_share_a_cache_key():
+    variants = ['https://acme.com/pricing', 'https://ACME.com/pricing/', 'https://acme.com:443/pricing#top',
+                'https://acme.com/pricing?utm_campaign=spring', 'acme.com/pricing']
+    assert len({cache_key(url) for url in variants}) == 1
+
+
+def test_extract_urls_from_chat_text():
+    text = ("Our site is acme.com, pricing at (https://acme.com/pricing?utm_medium=email). "
+            "Email bob@acme-mail.com, we use Node.js, see e.g. https://acme.com/pricing again!")
+    assert extract_urls(text) == ['https://acme.com/', 'https://acme.com/pricing']
+    assert extract_urls('Wiki: https://en.wikipedia.org/wiki/Widget_(device).') == \
+        ['https://en.wikipedia.org/wiki/Widget_(device)']
+    assert extract_urls('a.com b.io c.co d.ai', limit=2) == ['https://a.com/', 'https://b.io/']
+
+
+def test_private_and_local_hosts_are_blocked():
+    blocked = ['http://localhost:8501/', 'http://127.0.0.1/admin', 'http://10.0.0.5/', 'http://192.168.1.1/',
+               'http://169.254.169.254/latest/meta-data', 'http://[::1]/', 'http://printer.local/',
+               'http://0.0.0.0/', 'https://example.com/', 'https://www.example.org/about']
+    for url in blocked:
+        assert not is_scrapeable_url(url), url
+    assert is_scrapeable_url('https://8.8.8.8/')
+    assert is_scrapeable_url('https://acme-widgets.test/')
+
+
+def test_shorthand_numeric_hosts_are_blocked():
+    for url in ['http://127.1/', 'http://0x7f.0.0.1/', 'http://0177.0.0.1/', 'http://2130706433/',
+                'http://0xa9fea9fe/latest/meta-data', 'http://10.1/']:
+        assert not is_scrapeable_url(url), url
+        assert not is_scrapeable_url(url, resolve=True), url
+    assert is_public_host('8.8.8.8', resolve=True)
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/page':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(b'<html><head><title>Landing</title></head><body><p>Hello</p></body></html>')
+            return
+        targets = {'/moved': '/page', '/internal': f'http://127.0.0.2:{self.server.server_port}/page',
+                   '/metadata': 'http://169.254.169.254/latest/meta-data'}
+        self.send_response(302)
+        self.send_header('Location', targets.get(self.path, '/loop'))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.mark.usefixtures('loopback_allowed')
+def test_redirects_are_checked_at_every_hop():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RedirectHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    try:
+        assert scrape_url(f'{base}/moved', use_cache=False)['title'] == 'Landing'
+        for path, reason in [('/internal', 'non-public'), ('/metadata', 'non-public'), ('/loop', 'redirects')]:
+            try:
+                scrape_url(f'{base}{path}', use_cache=False)
+                assert False, f"{path} should not be followed"
+            except Exception as e:
+                assert reason in str(e), e
+    finally:
+        server.shutdown()
+
+
+def test_allow_listed_host_passes(monkeypatch):
+    monkeypatch.setattr(url_intake, 'ALLOWED_HOSTS', set(url_intake.ALLOWED_HOSTS))
+    assert not is_scrapeable_url('http://127.0.0.1:8000/page')
+    allow_host('127.0.0.1')
+    assert is_scrapeable_url('http://127.0.0.1:8000/page')
+
+
+def test_workflow_detects_bare_domains_and_canonicalizes():
+    manager = WorkflowManager()
+    assert manager._find_urls('We sell widgets at acme-widgets.com.') == ['https://acme-widgets.com/']
+    assert manager._find_urls('https://acme-widgets.com/?utm_source=x https://ACME-widgets.com') == \
+        ['https://acme-widgets.com/']
+    assert manager._find_urls('We sell an AI OS for factories') == []
+
+
+if __name__ == "__main__":
+    test_canonical_form()
+    test_equivalent_urls_share_a_cache_key()
+    test_extract_urls_from_chat_text()
+    test_private_and_local_hosts_are_blocked()
+    test_shorthand_numeric_hosts_are_blocked()
+    from conftest import allow_test_host
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        allow_test_host(monkeypatch)
+        test_redirects_are_checked_at_every_hop()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_allow_listed_host_passes(monkeypatch)
+    test_workflow_detects_bare_domains_and_canonicalizes()
+    print("✅ All URL intake tests passed")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test the table-driven workflow engine
+"""
+import sys
+import os
+import tempfile
+import threading
+import pytest
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.workflow_service import WORKFLOW_STEPS, WorkflowManager
+
+
+@pytest.mark.usefixtures('kyb_tmp_dir')
+def test_transitions_follow_the_table():
+    wf = WorkflowManager()
+    session = {}
+    steps = []
+    for text in ['', 'Widgets', '', 'Made to order', '', 'Fast', '', '']:
+        wf.process_workflow_step(text, session)
+        steps.append(session['workflow_step'])
+
+    # Step 8 sends an incomplete profile back to step 3
+    assert steps == [2, 3, 4, 5, 6, 7, 8, 3]
+    assert session['kyb_data']['business_understanding'] == ['Product details: Made to order',
+                                                             'Special features: Fast']
+
+    session['kyb_data']['objectives'] = ['Grow', 'Hire']
+    session['kyb_data']['constraints'] = ['Cash', 'Time']
+    session['workflow_step'] = 8
+    response, _ = wf.process_workflow_step('', session)
+    assert 'Profile is Complete' in response
+    assert session['workflow_step'] == 9
+
+
+def test_invalid_table_is_rejected():
+    steps = dict(WORKFLOW_STEPS)
+    steps[7] = dict(steps[7], transitions={'done': 42})
+    try:
+        WorkflowManager(steps)
+        assert False, "undefined transition target should be rejected"
+    except Exception as e:
+        assert '42' in str(e)
+
+
+@pytest.mark.usefixtures('kyb_tmp_dir')
+def test_shared_instance_across_sessions():
+    wf = WorkflowManager()
+    seen = []
+    wf.add_step_hook(lambda step, name, seconds, session: seen.append(name))
+    sessions = [{} for _ in range(8)]
+
+    def run(session, business):
+        for text in ['', business, '', f'{business} details', '', f'{business} features']:
+            wf.process_workflow_step(text, session)
+
+    threads = [threading.Thread(target=run, args=(session, f'Business {i}'))
+               for i, session in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, session in enumerate(sessions):
+        assert session['what_they_sell'] == f'Business {i}'
+        assert session['workflow_step'] == 7
+        assert session['kyb_data']['business_understanding'][-1] == f'Special features: Business {i} features'
+
+    timings = wf.get_step_timings()
+    assert len(seen) == 48
+    assert sum(timing['count'] for timing in timings.values()) == 48
+    assert timings['create_kyb_file']['count'] == 8
+
+
+if __name__ == "__main__":
+    from conftest import isolate_kyb_files
+    test_invalid_table_is_rejected()
+    for test in (test_transitions_follow_the_table, test_shared_instance_across_sessions):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            isolate_kyb_files(monkeypatch, tempfile.mkdtemp())
+            test()
+    print("✅ Workflow state machine tests passed")